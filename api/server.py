@@ -1,12 +1,18 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Header, Response
 from pydantic import BaseModel
 import logging
 import asyncio
 import os
+import time
+import concurrent.futures
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from serial.tools import list_ports
 from core.device import BITalino
 from core.mock_device import MockBITalino
+from core.session import SessionManager
+from core.sync import SyncSession
+from core.wire_format import MEDIA_TYPE, accepts_frame, encode_frame
 
 load_dotenv()
 
@@ -17,6 +23,15 @@ logging.basicConfig( # configure logging
 
 app = FastAPI()
 device_locks: dict[str, asyncio.Lock] = {} # Per-device asyncio locks to prevent concurrent access to same BITalino
+device_pending: dict[str, int] = {} # requests queued or running per device
+DEVICE_QUEUE_DEPTH = int(os.getenv('DEVICE_QUEUE_DEPTH', '4')) # max queued requests per device before 429
+discovery_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="bt-discovery")
+sessions = SessionManager( # open, started devices with background reader threads, kept between requests
+    idle_timeout=float(os.getenv('SESSION_IDLE_TIMEOUT', '30')),
+    buffer_seconds=float(os.getenv('RING_BUFFER_SECONDS', '60')),
+    io_mode=os.getenv('DEVICE_IO', 'select'), # 'select': one thread reads all devices, 'thread': one per device
+)
+sync_sessions: dict[str, SyncSession] = {} # synchronized multi-device sessions by id (device addresses joined with '+')
 
 class BITalinoRequest(BaseModel):
     macAddress: str
@@ -25,93 +40,244 @@ class BITalinoRequest(BaseModel):
     # optional - request specific channels ["A1","A2"] and sensor types {"A1":"ACCBIT"}
     channels: list[str] | None = None
     channel_types: dict | None = None
+    clientId: str | None = None # own cursor on the shared device stream, see /bitalino-subscribers/
+
+class SyncRequest(BaseModel):
+    devices: list[str] # MAC addresses / ports started together, e.g. ECG+EMG board and EEG board
+    samplingRate: int
+    record: bool = False # write the merged stream to data/recordings/
+
+COLUMN_NAMES = ['seqN', 'D0', 'D1', 'D2', 'D3', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6'] # rows of device.read() output
+
+
+def normalize_label(lbl: str) -> str:
+    if not isinstance(lbl, str):
+        return lbl
+    s = lbl.strip().upper()
+    if s.startswith('A') and s[1:].isdigit(): # analog labels A1..A6
+        return s
+    # TODO: check digital channels mapping
+    if s.startswith('D') and s[1:].isdigit(): # digital labels, are there D-starting labels?
+        return 'D' + str(int(s[1:]))
+    if s.isdigit(): # numeric or zero-padded like '01' -> map to Dn
+        return 'D' + str(int(s))
+    if s.startswith('I') and s[1:].isdigit(): # I1 or 01 prefix variants -> Dn
+        return 'D' + str(int(s[1:]))
+    return s
+
+
+def select_rows(requested, n_rows):
+    """Row indices and names of seqN + requested channels (order as requested) for data with n_rows rows.
+    All rows if nothing requested. Returns (indices, column_names).
+    """
+    full_column_names = COLUMN_NAMES[:n_rows]
+    if not requested:
+        return list(range(n_rows)), full_column_names
+
+    requested_norm = [normalize_label(l) for l in requested]
+    logging.debug("Filtering: requested_norm=%s, full_column_names=%s", requested_norm, full_column_names)
+    # keep seqN and any requested that exist in full_column_names
+    selected = ['seqN'] + [c for c in requested_norm if c in full_column_names]
+    logging.debug("Selected columns: %s", selected)
+    return [full_column_names.index(c) for c in selected], selected
+
+
+def select_columns(dataAcquired, requested):
+    """Subset rows of dataAcquired to seqN + requested channels (order as requested). Returns (sub, column_names).
+    """
+    indices, column_names = select_rows(requested, dataAcquired.shape[0])
+    if not requested:
+        return dataAcquired, column_names
+    return dataAcquired[indices, :], column_names # subset rows from dataAcquired
+
+
+def echo_channel_types(channel_types, column_names) -> dict:
+    """Normalize channel_types keys, keep only those present in returned columns."""
+    if not channel_types:
+        return {}
+    normalized = {normalize_label(k): v for k, v in channel_types.items()}
+    return {k: v for k, v in normalized.items() if k in column_names}
+
+
+def device_http_error(e: Exception) -> HTTPException:
+    """Map final device failure to a clearer HTTP error."""
+    err_no = getattr(e, 'errno', None)
+    if isinstance(e, OSError) and err_no == 5:
+        logging.exception("Device EIO final failure")
+        return HTTPException(status_code=503, detail=f"Device write failed (EIO): {e}")
+    if isinstance(e, TimeoutError):
+        logging.exception("Device timeout final failure")
+        return HTTPException(status_code=504, detail=str(e))
+    if isinstance(e, OSError) and err_no == 16:
+        logging.exception("Device busy")
+        return HTTPException(status_code=409, detail=str(e))
+
+    # BT timeout
+    try:
+        import bluetooth as _bt
+        if isinstance(e, _bt.btcommon.BluetoothError) and 'timed out' in str(e).lower():
+            return HTTPException(status_code=504, detail=str(e))
+    except Exception:
+        pass
+
+    logging.exception("Device operation final failure")
+    return HTTPException(status_code=500, detail=str(e))
+
+
+@asynccontextmanager
+async def device_slot(macAdd: str, exclusive: bool = True):
+    """Queue a request for a device: 429 if DEVICE_QUEUE_DEPTH HTTP requests are already queued or running for it.
+    exclusive requests (opening, reconfiguring) also hold the per-device lock, reads only count towards the limit.
+    """
+    if device_pending.get(macAdd, 0) >= DEVICE_QUEUE_DEPTH:
+        raise HTTPException(status_code=429, detail=f"Too many queued requests for device {macAdd}")
+    device_pending[macAdd] = device_pending.get(macAdd, 0) + 1
+    try:
+        if exclusive:
+            async with device_locks.setdefault(macAdd, asyncio.Lock()):
+                yield
+        else:
+            yield
+    finally:
+        device_pending[macAdd] -= 1
+        if not device_pending[macAdd]:
+            del device_pending[macAdd]
+
+
+async def run_device_io(session, func, *args, **kwargs):
+    """Run blocking device call on the session's worker thread (DeviceSession.worker()) so the event loop stays
+    free. Calls without a session, or racing a close that shut the worker down, use the default pool.
+    """
+    future = None
+    if session is not None:
+        try:
+            future = session.worker().submit(func, *args, **kwargs)
+        except RuntimeError: # shut down by a concurrent close
+            pass
+    if future is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.wrap_future(future)
+
+
+async def open_session(macAdd: str, DeviceClass, samplingRate: int):
+    """Get the device session and make sure its reader runs. Queued like other device I/O (429 when full)."""
+    session = sessions.sessions.get(macAdd)
+    if (session is not None and session.is_open and session.error is None
+            and session.device_class is DeviceClass and session.samplingRate == samplingRate):
+        session.last_used = time.monotonic() # fast path for frequent polls, no worker thread round trip
+        return session
+    async with device_slot(macAdd):
+        session = await run_device_io(None, sessions.get, DeviceClass, macAdd, samplingRate)
+        await run_device_io(session, session.open)
+        return session
+
+
+async def read_subscriber(macAdd: str, session, subscriber, nSamples: int, timeout: float = 10):
+    """Wait on the event loop until subscriber has nSamples buffered, then take them. Returns (data, first_sample).
+    Raises the reader thread's final failure, or TimeoutError when no new samples arrived for timeout seconds
+    (recordingTime may be longer). Many subscribers can wait at once without holding a thread.
+    """
+    deadline = time.monotonic() + timeout
+    available = subscriber.available
+    while subscriber.available < nSamples:
+        if subscriber.available != available: # stream is alive, restart the inactivity timeout
+            available = subscriber.available
+            deadline = time.monotonic() + timeout
+        if session.error is not None: # reader gave up, drop the device so the next request reconnects
+            error = session.error
+            await run_device_io(session, session.close)
+            raise error
+        if not session.is_open: # closed as idle or by another subscriber's failure
+            await run_device_io(session, session.open)
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for data")
+        session.last_used = subscriber.last_read = time.monotonic() # waiting counts as use, reap_idle keeps both
+        missing = nSamples - subscriber.available
+        await asyncio.sleep(min(0.05, max(0.005, missing / session.samplingRate / 2)))
+    return subscriber.take(nSamples)
+
+
+@app.on_event("shutdown")
+def close_sessions():
+    for sync in sync_sessions.values():
+        sync.stop()
+    sessions.close_all() # also shuts down the device worker threads
+    discovery_executor.shutdown(wait=False)
+
 
 # GET from /bitalino-get/?macAddress=[mac-address]&samplingRate=[sr]&recordingTime=[rt]
 @app.get("/bitalino-get/")
-async def bitalino_data(macAdd: str, samplingRate: int, recordingTime: int):
-    """Return raw samples acquired from BITalino device as JSON.
+async def bitalino_data(macAdd: str, samplingRate: int, recordingTime: int, clientId: str | None = None, accept: str | None = Header(None)):
+    """Return raw samples acquired from BITalino device as JSON, or as binary frame if requested with
+    Accept: application/x-bitalino-frame. With clientId the caller reads from its own cursor on the shared stream.
     """
     
     use_mock = os.getenv('USE_MOCK_DEVICE', 'false').lower() == 'true' # check if mock mode is enabled
     DeviceClass = MockBITalino if use_mock else BITalino
     
-    device = DeviceClass(macAddress=macAdd, timeout=10)
-    lock = device_locks.setdefault(macAdd, asyncio.Lock())
-    
-    async with lock:
-        try:
-            max_attempts = 3 # retry loop for transient device I/O errors
-            attempt = 0
-            while True: 
-                try:
-                    attempt += 1
-                    logging.debug("Opening device %s (attempt %d/%d)", macAdd, attempt, max_attempts)
-                    device.open(macAddress=macAdd, SamplingRate=samplingRate)
-                    device.start()
-                    nSamples = samplingRate * recordingTime  # total samples to read based on time and rate
-                    data = device.read(nSamples=nSamples, timeout=10) # read data for given time
-                    logging.debug("Successfully acquired %d samples from %s", len(data), macAdd)
-                    break
-                    
-                except Exception as e:
-                    # for transient I/O error, attempt to retry after short backoff
-                    try:
-                        err_no = getattr(e, 'errno', None)
-                    except Exception:
-                        err_no = None
-                    logging.warning("Device operation failed on attempt %d/%d: %s (errno=%s)", attempt, max_attempts, repr(e), err_no)
-                    
-                    # if EIO (errno 5) or other transient socket errors, try to close/reopen and retry
-                    if attempt < max_attempts and (isinstance(e, OSError) and err_no in (5, 11, None) or isinstance(e, TimeoutError)):
-                        import time
-                        logging.info("Retrying device operation after short backoff...")
-                        try:
-                            device.close()
-                        except Exception:
-                            pass
-                        time.sleep(0.2 * attempt)
-                        continue
-                    
-                    # else map to clearer HTTP codes and re-raise
-                    if isinstance(e, OSError) and err_no == 5:
-                        logging.exception("Device EIO final failure")
-                        raise HTTPException(status_code=503, detail=f"Device write failed (EIO): {e}")
-                    if isinstance(e, TimeoutError):
-                        logging.exception("Device timeout final failure")
-                        raise HTTPException(status_code=504, detail=str(e))
-                    if isinstance(e, OSError) and err_no == 16:
-                        logging.exception("Device busy")
-                        raise HTTPException(status_code=409, detail=str(e))
-                    
-                    # BT timeout
-                    try:
-                        import bluetooth as _bt
-                        if isinstance(e, _bt.btcommon.BluetoothError) and 'timed out' in str(e).lower():
-                            raise HTTPException(status_code=504, detail=str(e))
-                    except HTTPException:
-                        raise
-                    except Exception:
-                        pass
-                    
-                    logging.exception("Device operation final failure")
-                    raise HTTPException(status_code=500, detail=str(e))
-
-            return {
-                "macAddress": macAdd,
-                "samplingRate": samplingRate,
-                "recordingTime": recordingTime,
-                "data": data.tolist()  # Convert NumPy array to list for JSON serialization
-                # TODO: check for unnecessary data type conversions
-            }
-        finally:
-            try:
-                device.stop()
-            except Exception:
-                pass
-            try:
-                device.close()
-            except Exception:
-                pass
+    try:
+        session = await open_session(macAdd, DeviceClass, samplingRate)
+        subscriber = session.subscribe(clientId) if clientId else session.default
+        nSamples = samplingRate * recordingTime  # total samples to read based on time and rate
+        async with device_slot(macAdd, exclusive=False): # counted for the 429 limit, subscribers wait in parallel
+            data, first_sample = await read_subscriber(macAdd, session, subscriber, nSamples, timeout=10) # next samples from the running stream
+        logging.debug("Successfully acquired %d samples from %s", len(data), macAdd)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise device_http_error(e)
+
+    if accepts_frame(accept):
+        return Response(content=encode_frame(data, COLUMN_NAMES[:data.shape[0]], first_sample=first_sample), media_type=MEDIA_TYPE)
+    return {
+        "macAddress": macAdd,
+        "samplingRate": samplingRate,
+        "recordingTime": recordingTime,
+        "data": data.tolist()  # Convert NumPy array to list for JSON serialization
+        # TODO: check for unnecessary data type conversions
+    }
+
+
+# GET from /bitalino-since/?macAdd=[mac-address]&samplingRate=[sr]&cursor=[next_cursor of previous response]
+@app.get("/bitalino-since/")
+async def bitalino_since(macAdd: str, samplingRate: int, cursor: int | None = None, maxSamples: int | None = None,
+                         accept: str | None = Header(None)):
+    """Return immediately every sample buffered since cursor (absolute sample index), at most maxSamples
+    (default 5 s worth). Pass back next_cursor to continue without gaps or duplicates; without cursor reading
+    starts at the newest sample. dropped counts samples the ring buffer overwrote before they were fetched.
+    """
+    use_mock = os.getenv('USE_MOCK_DEVICE', 'false').lower() == 'true'
+    DeviceClass = MockBITalino if use_mock else BITalino
+    try:
+        session = await open_session(macAdd, DeviceClass, samplingRate)
+        if session.error is not None:
+            raise session.error
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise device_http_error(e)
+
+    buffer = session.buffer
+    head = buffer.head
+    if cursor is None or cursor > head: # new client, or buffer restarted since its last poll
+        cursor = head
+    data, first_sample = buffer.read(cursor, maxSamples or samplingRate * 5)
+    next_cursor = first_sample + data.shape[1]
+    dropped = first_sample - cursor
+
+    columns = COLUMN_NAMES[:data.shape[0]]
+    if accepts_frame(accept):
+        return Response(content=encode_frame(data, columns, first_sample=first_sample, next_cursor=next_cursor, dropped=dropped),
+                        media_type=MEDIA_TYPE)
+    return {
+        "macAddress": macAdd,
+        "samplingRate": samplingRate,
+        "first_sample": first_sample,
+        "next_cursor": next_cursor,
+        "dropped": dropped,
+        "data": data.T.tolist(), # samples × channels like /bitalino-data/
+        "columns": columns,
+    }
 
 
 @app.get("/bitalino-health/")
@@ -120,22 +286,20 @@ async def bitalino_health(macAdd: str):
     """
     try:
         # fast check,  serial ports, e.g., /dev/rfcomm0 or attached serial devices
-        ports = [p.device for p in list_ports.comports()]
+        ports = [p.device for p in await asyncio.to_thread(list_ports.comports)]
         if macAdd in ports:
             return {"macAddress": macAdd, "found": True}
 
         # otherwise try short BT discovery in background thread to avoid blocking
-        device = BITalino(macAddress=macAdd, timeout=10)
         found = False
         try:
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-                future = ex.submit(device.find, False)
-                try:
-                    devs = future.result(timeout=3)  # short timeout (seconds)
-                except concurrent.futures.TimeoutError:
-                    logging.warning("Bluetooth discovery timed out for %s", macAdd)
-                    raise HTTPException(status_code=504, detail="Bluetooth discovery timed out")
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(discovery_executor, lambda: BITalino(macAddress=macAdd, timeout=10).find(False))
+            try:
+                devs = await asyncio.wait_for(future, timeout=3)  # short timeout (seconds)
+            except asyncio.TimeoutError:
+                logging.warning("Bluetooth discovery timed out for %s", macAdd)
+                raise HTTPException(status_code=504, detail="Bluetooth discovery timed out")
         except HTTPException:
             raise
         except Exception:
@@ -161,143 +325,194 @@ async def bitalino_health(macAdd: str):
 
 # POST to get data from /bitalino-data/
 @app.post("/bitalino-data/")
-async def get_bitalino_data(request: BITalinoRequest):
-    """Return raw samples acquired from the BITalino device as JSON.
+async def get_bitalino_data(request: BITalinoRequest, accept: str | None = Header(None)):
+    """Return raw samples acquired from the BITalino device as JSON, or as binary frame if requested with
+    Accept: application/x-bitalino-frame.
     """
-    device = BITalino(macAddress=request.macAddress, timeout=10)
-    lock = device_locks.setdefault(request.macAddress, asyncio.Lock())
-    device_opened = False  # track whether device was successfully opened
-
-    async with lock:
+    try:
         try:
-            # Retry loop for I/O errors
-            max_attempts = 3
-            attempt = 0
-            while True:
-                try:
-                    attempt += 1
-                    logging.debug("Opening device %s (attempt %d/%d)", request.macAddress, attempt, max_attempts)
-                    device.open(request.macAddress, request.samplingRate)
-                    device_opened = True  # mark as opened successfully
-                    logging.info("BITalino: %s", device)
-                    device.start()
-                    nSamples = int(request.samplingRate * request.recordingTime)
-                    # increase read timeout
-                    dataAcquired = device.read(nSamples, timeout=10)
-                    # build column names for the rows present in dataAcquired
-                    column_names = ['seqN', 'D0', 'D1', 'D2', 'D3', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6'][:dataAcquired.shape[0]]
-                    break
-                except Exception as e:
-                    # If a transient I/O error, attempt to retry after short backoff
-                    try:
-                        err_no = getattr(e, 'errno', None)
-                    except Exception:
-                        err_no = None
-                    logging.warning("Device operation failed on attempt %d/%d: %s (errno=%s)", attempt, max_attempts, repr(e), err_no)
-                    # If EIO (errno 5) or other transient socket errors, try to close/reopen and retry
-                    if attempt < max_attempts and (isinstance(e, OSError) and err_no in (5, 11, None) or isinstance(e, TimeoutError)):
-                        import time
-                        logging.info("Retrying device operation after short backoff...")
-                        try:
-                            device.close()
-                        except Exception:
-                            pass
-                        time.sleep(0.2 * attempt)
-                        continue
-                    # else map to clearer HTTP codes and re-raise
-                    if isinstance(e, OSError) and err_no == 5:
-                        logging.exception("Device EIO final failure")
-                        raise HTTPException(status_code=503, detail=f"Device write failed (EIO): {e}")
-                    if isinstance(e, TimeoutError):
-                        logging.exception("Device timeout final failure")
-                        raise HTTPException(status_code=504, detail=str(e))
-                    logging.exception("Device operation final failure")
-                    raise HTTPException(status_code=500, detail=str(e))
-
-            # read all available data from device, filter channles later
-            requested = getattr(request, 'channels', None)
-            logging.debug("channels from request: %s (type: %s)", requested, type(requested))
-            def _normalize_label(lbl: str) -> str:
-                if not isinstance(lbl, str):
-                    return lbl
-                s = lbl.strip().upper()
-                if s.startswith('A') and s[1:].isdigit(): # analog labels A1..A6
-                    return s
-                # TODO: check digital channels mapping
-                if s.startswith('D') and s[1:].isdigit(): # digital labels, are there D-starting labels?
-                    return 'D' + str(int(s[1:]))
-                if s.isdigit(): # numeric or zero-padded like '01' -> map to Dn
-                    return 'D' + str(int(s))
-                if s.startswith('I') and s[1:].isdigit(): # I1 or 01 prefix variants -> Dn
-                    return 'D' + str(int(s[1:]))
-                return s
-
-            if requested:
-                requested_norm = [_normalize_label(l) for l in requested]
-            else:
-                requested_norm = None
-                requested = None
-
-            # column names based on dataAcquired rows
-            full_column_names = ['seqN', 'D0', 'D1', 'D2', 'D3', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6'][:dataAcquired.shape[0]]
-
-            # If requested was provided, filter columns to the requested set (preserve order in requested)
-            if requested_norm:
-                logging.debug("Filtering: requested_norm=%s, full_column_names=%s", requested_norm, full_column_names)
-                # keep seqN and any requested that exist in full_column_names
-                selected = ['seqN'] + [c for c in requested_norm if c in full_column_names]
-                logging.debug("Selected columns: %s", selected)
-                
-                try: # compute row indices to keep
-                    indices = [full_column_names.index(c) for c in selected]
-                    logging.debug("Row indices to extract: %s", indices)
-                    sub = dataAcquired[indices, :] # subset rows from dataAcquired
-                    column_names = selected
-                except (ValueError, IndexError) as e:
-                    logging.warning("Failed to filter to requested columns %s: %s. Using all columns.", requested_norm, e)
-                    sub = dataAcquired
-                    column_names = full_column_names
-            else:
-                sub = dataAcquired
-                column_names = full_column_names
-
-            # Send samples × channels (rows = samples) and include explicit columns metadata and channel types
-            data_samples = sub.astype(float).T.tolist()
-
-            # Normalize and echo back channel_types (map keys to normalized column names)
-            channel_types_out = {}
-            if getattr(request, 'channel_types', None):
-                # normalize incoming keys and map them to normalized columns
-                for k, v in request.channel_types.items():
-                    nk = k.strip().upper()
-                    if nk.isdigit():
-                        nk = 'D' + str(int(nk))
-                    elif nk.startswith('I') and nk[1:].isdigit():
-                        nk = 'D' + str(int(nk[1:]))
-                    elif nk.startswith('D') and nk[1:].isdigit():
-                        nk = 'D' + str(int(nk[1:]))
-                    # only include if normalized key is in returned columns
-                    if nk in column_names:
-                        channel_types_out[nk] = v
-            return {"data": data_samples, "columns": column_names, "channel_types": channel_types_out}
+            session = await open_session(request.macAddress, BITalino, request.samplingRate)
+            subscriber = session.subscribe(request.clientId) if request.clientId else session.default
+            nSamples = int(request.samplingRate * request.recordingTime)
+            async with device_slot(request.macAddress, exclusive=False):
+                dataAcquired, first_sample = await read_subscriber(request.macAddress, session, subscriber, nSamples, timeout=10)
+        except HTTPException:
+            raise
         except Exception as e:
-            logging.exception("Error acquiring BITalino data")
-            if isinstance(e, OSError) and getattr(e, 'errno', None) == 5:
-                # EIO - Input/output error (e.g device disconnected, low-level rfcomm problem)
-                raise HTTPException(status_code=503, detail=f"Device write failed (EIO): {e}")
-            if isinstance(e, TimeoutError):
-                raise HTTPException(status_code=504, detail=str(e))
-            # Bluetooth timeouts already handled in the GET handler, fallback to 500 for other errors
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            if device_opened:  # only stop() if device was successfully opened
-                try:
-                    device.stop()
-                except Exception:
-                    pass
-            try:
-                device.close()
-            except Exception:
-                pass
-    
+            raise device_http_error(e)
+
+        # read all available data from device, filter channles later
+        logging.debug("channels from request: %s (type: %s)", request.channels, type(request.channels))
+        sub, column_names = select_columns(dataAcquired, request.channels)
+
+        # Normalize and echo back channel_types (map keys to normalized column names)
+        channel_types_out = echo_channel_types(request.channel_types, column_names)
+        if accepts_frame(accept):
+            return Response(content=encode_frame(sub, column_names, channel_types_out, first_sample), media_type=MEDIA_TYPE)
+
+        # Send samples × channels (rows = samples) and include explicit columns metadata and channel types
+        data_samples = sub.T.tolist()
+        return {"data": data_samples, "columns": column_names, "channel_types": channel_types_out}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.exception("Error acquiring BITalino data")
+        if isinstance(e, OSError) and getattr(e, 'errno', None) == 5:
+            # EIO - Input/output error (e.g device disconnected, low-level rfcomm problem)
+            raise HTTPException(status_code=503, detail=f"Device write failed (EIO): {e}")
+        if isinstance(e, TimeoutError):
+            raise HTTPException(status_code=504, detail=str(e))
+        # Bluetooth timeouts already handled in the GET handler, fallback to 500 for other errors
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# POST to /bitalino-sync/ starts several devices together on one timeline
+@app.post("/bitalino-sync/")
+async def start_sync(request: SyncRequest):
+    """Start devices together and merge their streams into time-aligned blocks (see core/sync.py).
+    Returns the sync id for GET /bitalino-sync/, the merged column names and the recording file, if any.
+    """
+    use_mock = os.getenv('USE_MOCK_DEVICE', 'false').lower() == 'true'
+    DeviceClass = MockBITalino if use_mock else BITalino
+    sync_id = '+'.join(request.devices)
+    previous = sync_sessions.pop(sync_id, None)
+    if previous is not None:
+        await asyncio.to_thread(previous.stop)
+    try:
+        device_sessions = await asyncio.gather(*(run_device_io(None, sessions.get, DeviceClass, mac, request.samplingRate)
+                                                 for mac in request.devices))
+        sync = SyncSession(device_sessions, request.samplingRate)
+        await asyncio.to_thread(sync.start) # opens all devices at once, not queued per device
+        path = sync.record() if request.record else None
+    except Exception as e:
+        raise device_http_error(e)
+    sync_sessions[sync_id] = sync
+    return {"id": sync_id, "samplingRate": request.samplingRate, "columns": sync.columns, "file": path}
+
+
+# GET /bitalino-sync/?id=[sync id]&cursor=[next_cursor of previous response]
+@app.get("/bitalino-sync/")
+async def read_sync(id: str, cursor: int | None = None, maxSamples: int | None = None, accept: str | None = Header(None)):
+    """Return merged samples of all devices since cursor, immediately (like /bitalino-since/).
+    Sample k of the common timeline is at k / samplingRate seconds after the sync start.
+    """
+    sync = sync_sessions.get(id)
+    if sync is None:
+        raise HTTPException(status_code=404, detail=f"No synchronized session {id}")
+    for session in sync.sessions:
+        if session.error is not None:
+            raise device_http_error(session.error)
+    data, first_sample = await asyncio.to_thread(sync.read, cursor, maxSamples)
+    next_cursor = first_sample + data.shape[1]
+    if accepts_frame(accept):
+        return Response(content=encode_frame(data, sync.columns, first_sample=first_sample, next_cursor=next_cursor,
+                                             drift_ppm=sync.drift_ppm()), media_type=MEDIA_TYPE)
+    return {
+        "id": id,
+        "samplingRate": sync.samplingRate,
+        "first_sample": first_sample,
+        "next_cursor": next_cursor,
+        "drift_ppm": sync.drift_ppm(),
+        "data": data.T.tolist(), # samples × channels
+        "columns": sync.columns,
+    }
+
+
+@app.delete("/bitalino-sync/")
+async def stop_sync(id: str):
+    """Stop a synchronized session and close its recording file. Devices stay open until idle."""
+    sync = sync_sessions.pop(id, None)
+    if sync is None:
+        raise HTTPException(status_code=404, detail=f"No synchronized session {id}")
+    await asyncio.to_thread(sync.stop)
+    return {"id": id, "file": sync.path}
+
+
+# WebSocket /bitalino-stream: send one subscribe message, then receive sample blocks continuously
+@app.websocket("/bitalino-stream")
+async def bitalino_stream(websocket: WebSocket):
+    """Push sample blocks from the device session as they arrive.
+
+    Subscribe message: {"macAddress", "samplingRate", "channels", "channel_types", "chunk_ms", "format", "policy"},
+    format "frame" sends binary messages (core/wire_format.py) instead of JSON. Every connection is its own
+    subscriber on the shared device stream; policy "block" pauses reading the device (at most the session's
+    block_timeout) before overwriting samples this client hasn't read, default "drop-oldest" skips what the
+    ring buffer already overwrote.
+    Each block has the same shape as the /bitalino-data/ response plus "seq" (block counter),
+    "first_sample" (absolute sample index) and "dropped" (samples lost to ring buffer overrun),
+    so clients can detect gaps.
+    """
+    await websocket.accept()
+    session = subscriber = None
+    try:
+        sub = await websocket.receive_json()
+        macAdd = sub.get('macAddress') or os.getenv('MAC_ADDRESS')
+        samplingRate = int(sub.get('samplingRate', 1000))
+        chunk = max(1, samplingRate * int(sub.get('chunk_ms', 100)) // 1000) # samples per block
+        use_mock = os.getenv('USE_MOCK_DEVICE', 'false').lower() == 'true'
+        DeviceClass = MockBITalino if use_mock else BITalino
+
+        session = await open_session(macAdd, DeviceClass, samplingRate)
+        rows, column_names = select_rows(sub.get('channels'), session.buffer.rows)
+        channel_types = echo_channel_types(sub.get('channel_types'), column_names)
+        # ring buffer copies only the requested rows for this subscriber
+        subscriber = session.subscribe(f"ws-{id(websocket)}", rows=rows, policy=sub.get('policy', 'drop-oldest'))
+        block_seq = 0
+        while True:
+            dropped_before = subscriber.dropped
+            data, start = await read_subscriber(macAdd, session, subscriber, chunk, timeout=session.timeout)
+            dropped = subscriber.dropped - dropped_before
+            if sub.get('format') == 'frame': # binary message, see core/wire_format.py
+                await websocket.send_bytes(encode_frame(data, column_names, channel_types, start, seq=block_seq, dropped=dropped))
+            else:
+                await websocket.send_json({
+                    "seq": block_seq,
+                    "first_sample": start,
+                    "dropped": dropped,
+                    "data": data.T.tolist(),
+                    "columns": column_names,
+                    "channel_types": channel_types,
+                })
+            block_seq += 1
+    except WebSocketDisconnect:
+        logging.info("Stream client disconnected")
+    except Exception as e:
+        logging.exception("Stream error")
+        err = device_http_error(e)
+        try:
+            await websocket.send_json({"error": err.status_code, "detail": err.detail})
+            await websocket.close()
+        except Exception:
+            pass
+    finally:
+        if subscriber is not None:
+            session.unsubscribe(subscriber)
+
+
+# GET /bitalino-stats/?macAdd=[mac-address]: link and pipeline counters of a device session
+@app.get("/bitalino-stats/")
+async def bitalino_stats(macAdd: str):
+    """Return link counters (frames decoded, CRC failures, resync bytes, sequence gaps, estimated samples lost)
+    next to pipeline counters (ring buffer overruns, reconnects), to tell radio link problems from our own.
+    """
+    session = sessions.sessions.get(macAdd)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No session for device {macAdd}")
+    buffer = session.buffer
+    return {
+        "macAddress": macAdd,
+        "open": session.is_open,
+        **session.link_counters(),
+        "overruns": buffer.overruns if buffer is not None else 0,
+        "reconnects": session.reconnects,
+    }
+
 
+# GET /bitalino-subscribers/?macAdd=[mac-address]: session and per-subscriber lag/drop counters
+@app.get("/bitalino-subscribers/")
+async def bitalino_subscribers(macAdd: str):
+    """Return stream position and per-subscriber cursor, lag and dropped samples for a device session."""
+    session = sessions.sessions.get(macAdd)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No session for device {macAdd}")
+    return session.stats()
@@ -0,0 +1,295 @@
+"""
+Chunked compressed recording container (.binz) with random access.
+
+    b'BITZ' version(u8) header_len(u32) header JSON      opensignals_header() dict plus container fields
+    block*: n_samples(u32) n_bytes(u32) payload          each block compressed on its own
+    index: (first_sample, offset, n_bytes, n_samples) int64 rows, then index_offset(u64) n_blocks(u64) b'BITZ'
+
+A block holds up to block_samples samples per channel, channel by channel, delta encoded (differences to the
+previous sample modulo 2^16 for uint16 ADC codes, of the bit patterns for float32) and then compressed with
+zlib or lzma. Reading any time window decompresses only the blocks it overlaps. If the footer is missing
+(recording interrupted) the index is rebuilt by walking the block headers, recover_compressed_recording()
+writes it back to the file.
+"""
+import json
+import lzma
+import struct
+import zlib
+import logging
+import os
+import time
+import numpy as np
+from .pyramid import MinMaxPyramid
+
+MAGIC = b'BITZ'
+VERSION = 1
+BLOCK_HEADER = struct.Struct('<II')
+TRAILER = struct.Struct('<QQ4s')
+CODECS = ('zlib', 'lzma')
+
+
+def _unsigned(dtype):
+    return np.dtype(f'<u{np.dtype(dtype).itemsize}')
+
+
+def encode_block(block, codec: str = 'zlib', level: int = 6) -> bytes:
+    """Compress an (n x channels) sample block: channel-major, delta encoded, then zlib/lzma."""
+    ints = np.ascontiguousarray(np.asarray(block).T).view(_unsigned(block.dtype))
+    delta = ints.copy()
+    delta[:, 1:] -= ints[:, :-1] # unsigned, wraps around, exactly undone by the cumulative sum
+    payload = delta.tobytes()
+    return zlib.compress(payload, level) if codec == 'zlib' else lzma.compress(payload, preset=level)
+
+
+def decode_block(data: bytes, n: int, n_channels: int, dtype, codec: str = 'zlib'):
+    """Inverse of encode_block(). Returns the (n x channels) block."""
+    payload = zlib.decompress(data) if codec == 'zlib' else lzma.decompress(data)
+    unsigned = _unsigned(dtype)
+    delta = np.frombuffer(payload, dtype=unsigned).reshape(n_channels, n)
+    ints = np.cumsum(delta, axis=1, dtype=unsigned)
+    return np.ascontiguousarray(ints.T).view(np.dtype(dtype).newbyteorder('<'))
+
+
+def _write_footer(fh, index):
+    """Append the block index and trailer at the current position of fh."""
+    index_offset = fh.tell()
+    fh.write(np.asarray(index, dtype='<i8').reshape(-1, 4).tobytes())
+    fh.write(TRAILER.pack(index_offset, len(index), MAGIC))
+
+
+class CompressedRecordingWriter:
+    """Writes a .binz container during acquisition, one compressed block per block_samples samples.
+
+    header is the opensignals_header() dict; dtype np.uint16 stores ADC codes, np.float32 converted values.
+    Same write()/close(), fsync and pyramid options as core.file_io.RecordingWriter, time stamps are implied
+    by the sampling rate. Every block is flushed as soon as it is complete; once fsync_seconds have passed the
+    pending samples are written as a shorter block and synced, so a crash loses at most that much data.
+    """
+
+    def __init__(self, path: str, header: dict, channel_labels: list, dtype=np.uint16, codec: str = 'zlib',
+                 level: int = 6, block_samples: int = 4096, pyramid: bool = True, fsync_seconds: float | None = 5.0):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}")
+        self.path = path
+        self.channel_labels = list(channel_labels)
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.converted = self.dtype.kind == 'f'
+        self.codec = codec
+        self.level = level
+        self.block_samples = block_samples
+        self.fsync_seconds = fsync_seconds
+        self.samples = 0
+        self.pyramid = MinMaxPyramid(len(self.channel_labels), spool=path) if pyramid else None
+        self.header = json.loads(json.dumps(header))
+        self.info = next(iter(self.header.values()))
+        for key in ('time offset', 'samples', 'dtype'):
+            self.info.pop(key, None)
+        self.info.update({"column": self.channel_labels, "convertedValues": int(self.converted), "dtype": self.dtype.str,
+                          "codec": codec, "block samples": block_samples})
+        self._pending = np.empty((block_samples, len(self.channel_labels)), dtype=self.dtype)
+        self._n_pending = 0
+        self._index = []
+        self._last_fsync = time.monotonic()
+        self.fh = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self, time_offset):
+        """Write the file header once the first time stamp is known."""
+        self.info["time offset"] = float(time_offset)
+        header = json.dumps(self.header).encode()
+        self.fh = open(self.path, 'wb')
+        self.fh.write(MAGIC + bytes([VERSION]) + struct.pack('<I', len(header)) + header)
+
+    def write(self, times, data):
+        """Append len(times) samples, data as for RecordingWriter.write(). Missing values are NaN (float32) or 0."""
+        n = len(times)
+        if n == 0:
+            return
+        if self.fh is None:
+            self._open(times[0])
+        block = np.full((n, len(self.channel_labels)), np.nan if self.converted else 0, dtype=self.dtype)
+        for i, ch in enumerate(self.channel_labels):
+            vals = np.asarray(data.get(ch, []) if isinstance(data, dict) else data[i])[:n]
+            block[:len(vals), i] = vals
+        if self.pyramid is not None:
+            self.pyramid.add(block.T)
+        while len(block):
+            take = min(len(block), self.block_samples - self._n_pending)
+            self._pending[self._n_pending:self._n_pending + take] = block[:take]
+            self._n_pending += take
+            block = block[take:]
+            if self._n_pending == self.block_samples:
+                self._flush_block()
+        if self.fsync_seconds is not None and time.monotonic() - self._last_fsync >= self.fsync_seconds:
+            self._flush_block(sync=True)
+
+    def _flush_block(self, sync=False):
+        """Write the pending samples as one block, fsync if sync or fsync_seconds have passed."""
+        n = self._n_pending
+        if n:
+            payload = encode_block(self._pending[:n], self.codec, self.level)
+            offset = self.fh.tell()
+            self.fh.write(BLOCK_HEADER.pack(n, len(payload)) + payload)
+            self.fh.flush()
+            self._index.append((self.samples, offset, len(payload), n))
+            self.samples += n
+            self._n_pending = 0
+        sync = self.fsync_seconds is not None and (sync or time.monotonic() - self._last_fsync >= self.fsync_seconds)
+        if sync:
+            os.fsync(self.fh.fileno())
+            self._last_fsync = time.monotonic()
+        if self.pyramid is not None:
+            self.pyramid.flush(sync)
+
+    def close(self):
+        if self.fh is None:
+            self._open(0.0) # empty recording, still a valid container
+        if self.fh.closed:
+            return
+        self._flush_block()
+        _write_footer(self.fh, self._index)
+        self.fh.flush()
+        if self.fsync_seconds is not None:
+            os.fsync(self.fh.fileno())
+        self.fh.close()
+        if self.pyramid is not None:
+            self.pyramid.save_for(self.path)
+        logging.info('Saved compressed data file to %s (%d samples, %d blocks)', self.path, self.samples, len(self._index))
+
+
+class CompressedRecordingReader:
+    """Random access to a .binz container, same interface as core.file_io.RecordingReader.
+
+    The block index comes from the footer (or a scan of the block headers if the file has none), a read
+    decompresses only the blocks overlapping the requested samples and keeps the last cache_blocks decoded.
+    """
+
+    def __init__(self, path: str, cache_blocks: int = 4):
+        self.path = path
+        self.cache_blocks = cache_blocks
+        self._fh = open(path, 'rb')
+        start = self._fh.read(len(MAGIC) + 5)
+        if len(start) < len(MAGIC) + 5 or start[:len(MAGIC)] != MAGIC:
+            self._fh.close()
+            raise ValueError(f"{path} is not a compressed recording")
+        header_len, = struct.unpack('<I', start[len(MAGIC) + 1:])
+        self.header = json.loads(self._fh.read(header_len))
+        self.data_offset = self._fh.tell()
+        self.meta = dict(next(iter(self.header.values())))
+        self.labels = self.meta['label']
+        self.sampling_rate = self.meta['sampling rate']
+        self.time_offset = self.meta.get('time offset', 0.0)
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.converted = bool(self.meta.get('convertedValues', self.dtype.kind == 'f')) # False: uint16 ADC codes
+        self.codec = self.meta.get('codec', 'zlib')
+        self.index = self._read_footer()
+        self.complete = self.index is not None # False: interrupted recording, see recover_compressed_recording()
+        if self.index is None:
+            self.index = self._scan_blocks()
+            logging.warning('%s has no block index (interrupted recording?), rebuilt it from %d blocks', path, len(self.index))
+        self.n_samples = int(self.index[-1, 0] + self.index[-1, 3]) if len(self.index) else 0
+        self._cache = {}
+
+    def __len__(self):
+        return self.n_samples
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._cache = {}
+        self._fh.close()
+
+    def _read_footer(self):
+        size = os.fstat(self._fh.fileno()).st_size
+        if size - self.data_offset < TRAILER.size:
+            return None
+        self._fh.seek(size - TRAILER.size)
+        index_offset, n_blocks, magic = TRAILER.unpack(self._fh.read(TRAILER.size))
+        if magic != MAGIC or index_offset + n_blocks * 32 + TRAILER.size != size:
+            return None
+        self._fh.seek(index_offset)
+        return np.frombuffer(self._fh.read(n_blocks * 32), dtype='<i8').reshape(n_blocks, 4)
+
+    def _scan_blocks(self):
+        """Rebuild the index from the block headers, stopping at the first incomplete block."""
+        size = os.fstat(self._fh.fileno()).st_size
+        index, offset, first = [], self.data_offset, 0
+        while offset + BLOCK_HEADER.size <= size:
+            self._fh.seek(offset)
+            n, n_bytes = BLOCK_HEADER.unpack(self._fh.read(BLOCK_HEADER.size))
+            if n == 0 or offset + BLOCK_HEADER.size + n_bytes > size:
+                break
+            index.append((first, offset, n_bytes, n))
+            first += n
+            offset += BLOCK_HEADER.size + n_bytes
+        return np.asarray(index, dtype=np.int64).reshape(-1, 4)
+
+    def _block(self, b):
+        block = self._cache.get(b)
+        if block is None:
+            _, offset, n_bytes, n = (int(v) for v in self.index[b])
+            self._fh.seek(offset + BLOCK_HEADER.size)
+            block = decode_block(self._fh.read(n_bytes), n, len(self.labels), self.dtype, self.codec)
+            if len(self._cache) >= self.cache_blocks:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[b] = block
+        return block
+
+    def sample_at(self, t: float) -> int:
+        return min(max(int(round((t - self.time_offset) * self.sampling_rate)), 0), self.n_samples)
+
+    def read(self, start: int, n: int):
+        """Samples [start, start + n) as (times, channels x samples)."""
+        start = min(max(int(start), 0), self.n_samples)
+        end = min(start + max(int(n), 0), self.n_samples)
+        out = np.empty((len(self.labels), end - start), dtype=self.dtype)
+        if end > start:
+            firsts = self.index[:, 0]
+            for b in range(int(np.searchsorted(firsts, start, side='right')) - 1, int(np.searchsorted(firsts, end))):
+                first = int(firsts[b])
+                block = self._block(b)
+                lo, hi = max(start, first), min(end, first + len(block))
+                out[:, lo - start:hi - start] = block[lo - first:hi - first].T
+        times = self.time_offset + np.arange(start, end) / self.sampling_rate
+        return times, out
+
+    def window(self, t0: float, t1: float):
+        start = self.sample_at(t0)
+        return self.read(start, self.sample_at(t1) - start)
+
+
+def recover_compressed_recording(path: str) -> int:
+    """Make an interrupted .binz recording complete: cut it after the last block that decodes and append the
+    block index. Returns the number of samples kept.
+    """
+    with CompressedRecordingReader(path) as reader:
+        if reader.complete:
+            return reader.n_samples
+        index = reader.index
+        while len(index): # a crash can leave the last blocks zero-filled or cut short
+            try:
+                reader._block(len(index) - 1)
+                break
+            except (zlib.error, lzma.LZMAError, ValueError):
+                index = index[:-1]
+                reader._cache = {}
+        end = int(index[-1, 1] + BLOCK_HEADER.size + index[-1, 2]) if len(index) else reader.data_offset
+        n_samples = int(index[-1, 0] + index[-1, 3]) if len(index) else 0
+    with open(path, 'r+b') as fh:
+        fh.truncate(end)
+        fh.seek(end)
+        _write_footer(fh, index)
+        fh.flush()
+        os.fsync(fh.fileno())
+    logging.info('Recovered %s: %d samples in %d blocks', path, n_samples, len(index))
+    return n_samples
@@ -4,16 +4,219 @@ import serial # pyserial
 from serial.tools import list_ports
 import time
 import math
+import select
 import logging
 import os
+import json
+from datetime import datetime
+
+# Analog channel decoding: (byte offset from end of frame, mask, shift) parts per channel A0..A5
+ANALOG_RULES = [
+    [(-2, 0x0F, 6), (-3, 0xFC, -2)],    # A0
+    [(-3, 0x03, 8), (-4, 0xFF,  0)],    # A1
+    [(-5, 0xFF, 2), (-6, 0xC0, -6)],    # A2
+    [(-6, 0x3F, 4), (-7, 0xF0, -4)],    # A3
+    [(-7, 0x0F, 2), (-8, 0xC0, -6)],    # A4
+    [(-8, 0x3F, 0)]                     # A5
+]
+
+# Per-device link counters kept by read(): decoded frames, CRC failures, bytes skipped to resync,
+# sequence number gaps and samples estimated lost in them (4-bit sequence, a gap of 16+ frames looks shorter)
+LINK_COUNTERS = ('frames_decoded', 'crc_failures', 'resync_bytes', 'seq_gaps', 'samples_lost')
+
+
+def frame_size(nAnalog):
+    """Return number of bytes in one frame for given number of analog channels."""
+    if nAnalog <= 4:
+        return int(math.ceil((12. + 10. * nAnalog) / 8.))
+    return int(math.ceil((52. + 6. * (nAnalog - 4)) / 8.))
+
+
+def _crc4_table():
+    """T[i] = i mod (x^4 + x + 1) for every 8-bit i, i.e. the next CRC state for (crc << 4) | nibble."""
+    table = np.zeros(256, dtype=np.uint8)
+    for i in range(256):
+        r = i
+        for bit in range(7, 3, -1):
+            if r & (1 << bit):
+                r ^= 0x13 << (bit - 4)
+        table[i] = r
+    return table
+
+
+CRC4_TABLE = _crc4_table()
+_CRC4 = CRC4_TABLE.tolist()  # plain list lookups are faster than numpy scalars in frame_valid()
+
+
+def crc4(frames):
+    """Compute CRC-4 for every row of an (N, number_bytes) uint8 frame array at once.
+    Same as the device firmware shift register, one table lookup per nibble; the low nibble
+    of the last byte (the CRC itself) counts as zero.
+    """
+    frames = np.asarray(frames, dtype=np.uint8)
+    number_bytes = frames.shape[1]
+    crc = np.zeros(frames.shape[0], dtype=np.uint8)
+    for byte in range(number_bytes):
+        column = frames[:, byte]
+        crc = CRC4_TABLE[(crc << 4) | (column >> 4)]
+        crc = CRC4_TABLE[crc << 4] if byte == number_bytes - 1 else CRC4_TABLE[(crc << 4) | (column & 0x0F)]
+    return crc
+
+
+def frame_valid(data, offset, number_bytes) -> bool:
+    """True if data[offset:offset + number_bytes] is a frame with a matching CRC-4. Allocates nothing."""
+    crc = 0
+    last = offset + number_bytes - 1
+    for i in range(offset, last):
+        b = data[i]
+        crc = _CRC4[(crc << 4) | (b >> 4)]
+        crc = _CRC4[(crc << 4) | (b & 0x0F)]
+    b = data[last]
+    crc = _CRC4[(crc << 4) | (b >> 4)]
+    crc = _CRC4[crc << 4]
+    return crc == (b & 0x0F)
+
+
+def find_frame(data, start, end, number_bytes):
+    """First offset in data[start:end] where a valid frame starts, followed by another valid frame unless
+    data ends first (rules out a chance CRC match). None if there is none.
+    """
+    for off in range(start, end - number_bytes + 1):
+        if frame_valid(data, off, number_bytes) and (off + 2 * number_bytes > end or frame_valid(data, off + number_bytes, number_bytes)):
+            return off
+    return None
+
+
+def decode_frames(data, nAnalog):
+    """Decode a contiguous buffer of N whole frames with nAnalog analog channels in one pass.
+
+    Returns (res, valid): res is the (5 + nAnalog) x N uint16 matrix [seq, D0..D3, analog...] and
+    valid is a boolean array marking the frames whose CRC-4 matched. Trailing partial frame bytes are ignored.
+    """
+    number_bytes = frame_size(nAnalog)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    nFrames = len(buf) // number_bytes
+    frames = buf[:nFrames * number_bytes].reshape(nFrames, number_bytes)
+    valid = crc4(frames) == (frames[:, -1] & 0x0F)
+
+    res = np.zeros((nAnalog + 5, nFrames), dtype=np.uint16)
+    res[0] = frames[:, -1] >> 4  # Sequence number
+
+    # Digital channels D0 to D3 from a single byte, bits 7 to 4
+    # TODO: there are only three digital channels on BITalino? confirm mapping
+    digital_byte = frames[:, -2]
+    for line, bit in enumerate(range(7, 3, -1), start=1):
+        res[line] = (digital_byte >> bit) & 0x01
+
+    # Analog channel decoding
+    for i in range(nAnalog):
+        value = res[5 + i]  # fill the output row in place
+        for byte_offset, mask, shift in ANALOG_RULES[i]:
+            part = (frames[:, number_bytes + byte_offset] & mask).astype(np.uint16)
+            if shift >= 0:
+                value |= part << shift
+            else:
+                value |= part >> -shift
+    return res, valid
+
+
+def count_frames(counters, seq, last_seq=None):
+    """Add a run of consecutive decoded frames (their sequence numbers) to LINK_COUNTERS in counters.
+    last_seq is the sequence number before the run, if any. Returns the last sequence number of the run.
+    """
+    seq = seq.astype(np.int16)
+    steps = np.diff(seq) if last_seq is None else np.diff(seq, prepend=last_seq)
+    missing = (steps - 1) % 16  # frames skipped between neighbours, modulo the 4-bit wraparound
+    gaps = int(np.count_nonzero(missing))
+    if gaps:
+        counters['seq_gaps'] += gaps
+        counters['samples_lost'] += int(missing.sum())
+    counters['frames_decoded'] += len(seq)
+    return int(seq[-1])
+
+
+def read_capture_info(path) -> dict:
+    """Sidecar of a raw capture (see BITalino.start_capture): device, sampling rate, channels, start time."""
+    with open(path + '.json') as f:
+        return json.load(f)
+
+
+def _next_frame(raw, start, number_bytes, scan=4096):
+    """Offset of the next valid frame at or after start in a mapped capture file, len(raw) if there is none.
+    Checks scan offsets at a time on a small copied window instead of indexing the memory map byte by byte.
+    """
+    size = len(raw)
+    while start < size:
+        window = raw[start:start + scan + 2 * number_bytes].tobytes()
+        off = find_frame(window, 0, len(window), number_bytes)
+        if off is not None and (off < scan or start + len(window) == size):
+            return start + off
+        start += scan
+    return size
+
+
+def iter_capture(path, block_frames: int = 1 << 20, counters=None):
+    """Decode a raw capture offline from a read-only memory map, the file is never loaded as a whole.
+
+    Yields (5 + nAnalog) x n uint16 blocks (at most block_frames samples each) exactly like BITalino.read()
+    would have returned them. Corrupted bytes are skipped the same way; pass a dict to collect LINK_COUNTERS.
+    """
+    nAnalog = len(read_capture_info(path)['channels'])
+    number_bytes = frame_size(nAnalog)
+    counters = {} if counters is None else counters
+    for key in LINK_COUNTERS:
+        counters.setdefault(key, 0)
+    if os.path.getsize(path) < number_bytes:
+        return
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    size, pos, last_seq = len(raw), 0, None
+    while size - pos >= number_bytes:
+        nFrames = min((size - pos) // number_bytes, block_frames)
+        decoded, valid = decode_frames(raw[pos:pos + nFrames * number_bytes], nAnalog)
+        n_ok = nFrames if valid.all() else int(np.argmin(valid))  # frames before first CRC failure
+        pos += n_ok * number_bytes
+        if n_ok:
+            last_seq = count_frames(counters, decoded[0, :n_ok], last_seq)
+            yield decoded[:, :n_ok]
+        if n_ok < nFrames:
+            skip = _next_frame(raw, pos + 1, number_bytes)
+            counters['crc_failures'] += 1
+            counters['resync_bytes'] += skip - pos
+            pos = skip
+
+
+def decode_capture(path, counters=None):
+    """Decode a whole raw capture into one (5 + nAnalog) x N uint16 matrix, see iter_capture()."""
+    nAnalog = len(read_capture_info(path)['channels'])
+    blocks = list(iter_capture(path, counters=counters))
+    if not blocks:
+        return np.zeros((5 + nAnalog, 0), dtype=np.uint16)
+    return np.concatenate(blocks, axis=1)
+
 
 class BITalino:
-    def __init__(self, macAddress=None, timeout=10):
+    def __init__(self, macAddress=None, timeout=10, read_chunk_size: int = 4096):
         self.socket = None
         self.analogChannels = []
         self.number_bytes = None
         self.macAddress = macAddress
         self.serial = False
+        self.timeout = timeout
+        self.nonblocking = False  # see set_nonblocking()
+        self.counters = dict.fromkeys(LINK_COUNTERS, 0)
+        self._last_seq = None  # sequence number of the last decoded frame, for gap counting
+        self.samplingRate = None
+        # raw capture mode, see start_capture()
+        self.capture_path = None
+        self.captured_bytes = 0
+        self._capture = None
+        self._capture_info = None
+        # preallocated receive buffer, bulk reads go straight into it and partial frames carry over between read() calls
+        self.read_chunk_size = read_chunk_size
+        self._rx = bytearray(0)
+        self._rx_view = memoryview(self._rx)
+        self._rx_len = 0
 
         if os.path.exists('/dev/rfcomm0'): # try rfcomm0 first
             logging.info("Using rfcomm0 serial port")
@@ -79,6 +282,7 @@ class BITalino:
             variableToSend = {1000: 0x03, 100: 0x02, 10: 0x01, 1: 0x00}.get(SamplingRate, None)
             if variableToSend is None:
                 raise ValueError(f"Invalid sampling rate {SamplingRate}")
+            self.samplingRate = SamplingRate
 
             variableToSend = int((variableToSend << 6) | 0x03)
             self.write(variableToSend)
@@ -105,6 +309,8 @@ class BITalino:
         for i in self.analogChannels:
             bit |= 1 << (2 + i)
         self.write(bit, retries=3, backoff=0.15)
+        self._rx_len = 0  # drop bytes left over from a previous acquisition
+        self._last_seq = None
         return True
 
     def stop(self):
@@ -116,6 +322,7 @@ class BITalino:
             return False
 
     def close(self):
+        self.stop_capture()
         try:
             if self.socket is not None:
                 try:
@@ -209,132 +416,265 @@ class BITalino:
                 raise
         raise last_exc or RuntimeError("Unknown error in write") # if exit loop without returning/raising
 
-    def read(self, nSamples=100, timeout: float = 5.0):
+    def _fill_rx(self, want):
+        """Bulk read into the free part of the receive buffer. Asks for at least want bytes
+        (or whatever is already waiting), capped by free space. Returns number of bytes read.
+        """
+        free = len(self._rx) - self._rx_len
+        try:
+            if self.serial:
+                n = min(free, max(want, getattr(self.socket, 'in_waiting', 0) or 0))
+                got = self.socket.readinto(self._rx_view[self._rx_len:self._rx_len + n])
+            else:
+                recv_into = getattr(self.socket, 'recv_into', None)
+                if recv_into is not None:
+                    got = recv_into(self._rx_view[self._rx_len:], free)
+                else:  # older PyBluez sockets only have recv()
+                    chunk = self.socket.recv(free)
+                    got = len(chunk)
+                    self._rx_view[self._rx_len:self._rx_len + got] = chunk
+        except OSError as e:
+            if not (self.nonblocking and (isinstance(e, BlockingIOError) or getattr(e, 'errno', None) == 11)):
+                raise
+            got = 0  # non-blocking socket with nothing to read yet
+        got = got or 0
+        if got and self._capture is not None:  # raw capture, bytes go to the file exactly as received
+            self._capture.write(self._rx_view[self._rx_len:self._rx_len + got])
+            self.captured_bytes += got
+        self._rx_len += got
+        return got
+
+    def _consume_rx(self, n):
+        """Drop first n bytes from receive buffer, moving the remainder (usually a partial frame) to the front."""
+        remaining = self._rx_len - n
+        if remaining > 0:
+            self._rx_view[:remaining] = self._rx_view[n:self._rx_len]
+        self._rx_len = max(remaining, 0)
+
+    def _count_frames(self, seq):
+        """Update link counters for a run of consecutive decoded frames given their sequence numbers."""
+        self._last_seq = count_frames(self.counters, seq, self._last_seq)
+
+    def _resync(self, start, nb):
+        """Return first offset >= start in the receive buffer where a valid frame starts (followed by another
+        valid frame, if buffered, to rule out a chance CRC match). If none, the offset that keeps only the
+        trailing bytes that could still begin a frame once more data arrives.
+        """
+        off = find_frame(self._rx_view, start, self._rx_len, nb)
+        return max(start, self._rx_len - nb + 1) if off is None else off
+
+    def fileno(self):
+        """File descriptor of the serial port or RFCOMM socket, for select/selectors."""
+        return self.socket.fileno()
+
+    def set_nonblocking(self, nonblocking=True):
+        """Make device reads return immediately with whatever is available (used by core.multiplexer)."""
+        if self.serial:
+            self.socket.timeout = 0 if nonblocking else self.timeout
+        else:
+            self.socket.setblocking(not nonblocking)
+        self.nonblocking = nonblocking
+
+    def _prepare_rx(self):
+        """Check acquisition state and (re)allocate the receive buffer for the current frame size. Returns frame size."""
         if self.socket is None:
             raise TypeError("Input connection is needed.")
         # Check if analogChannels is initialized and set to valid list
         if not self.analogChannels:
             raise ValueError("Analog channels must be specified before reading.")
+        self.number_bytes = nb = frame_size(len(self.analogChannels))
 
-        nChannels = len(self.analogChannels)
-        if nChannels <= 4:
-            self.number_bytes = int(math.ceil((12 + 10 * nChannels) / 8))
-        else:
-            self.number_bytes = int(math.ceil((52 + 6 * (nChannels - 4)) / 8))
+        rx_size = self.read_chunk_size + nb
+        if len(self._rx) != rx_size: # (re)allocate receive buffer, keeping any carried over bytes
+            carried = bytes(self._rx_view[:self._rx_len])[-rx_size:]
+            self._rx_view.release()
+            self._rx = bytearray(rx_size)
+            self._rx_view = memoryview(self._rx)
+            self._rx_view[:len(carried)] = carried
+            self._rx_len = len(carried)
+        return nb
 
-        dataAcquired = np.zeros((5 + nChannels, nSamples))  # prepare matrix to hold data
+    def _decode_rx(self, out, sampleIndex):
+        """Decode complete frames from the receive buffer into out[:, sampleIndex:], resyncing past CRC failures.
+        Returns the new sampleIndex (stops when out is full or no whole frame is left).
+        """
+        nb = self.number_bytes
+        nChannels = out.shape[0] - 5
+        while sampleIndex < out.shape[1]:
+            # decode every complete frame already in the buffer in one pass
+            nFrames = min(self._rx_len // nb, out.shape[1] - sampleIndex)
+            if not nFrames:
+                break
+            decoded, valid = self.decode_frames(self._rx_view[:nFrames * nb], nChannels)
+            n_ok = nFrames if valid.all() else int(np.argmin(valid))  # frames before first CRC failure
+            out[:, sampleIndex:sampleIndex + n_ok] = decoded[:, :n_ok]
+            sampleIndex += n_ok
+            if n_ok:
+                self._count_frames(decoded[0, :n_ok])
+            if n_ok == nFrames:
+                self._consume_rx(n_ok * nb)
+            else:
+                # CRC failed, skip to the next offset that starts a valid frame without decoding at each one
+                skip = self._resync(n_ok * nb + 1, nb)
+                self.counters['crc_failures'] += 1
+                self.counters['resync_bytes'] += skip - n_ok * nb
+                logging.debug("Decode failed, skipped %d bytes to resync", skip - n_ok * nb)
+                self._consume_rx(skip)
+        return sampleIndex
 
-        if self.serial: # reading method chosen based on connection type
-            logging.debug("Reading from serial...")
-            reader = lambda n: self.socket.read(n)
-        else:
-            logging.debug("Reading from Bluetooth...")
-            reader = lambda n: self.socket.recv(n)
+    def read(self, nSamples=100, timeout: float = 5.0):
+        nb = self._prepare_rx()
+        dataAcquired = np.zeros((5 + len(self.analogChannels), nSamples), dtype=np.uint16)  # prepare matrix to hold raw codes (max 10 bits)
 
-        Data = b''
-        sampleIndex = 0
-        start_time = time.time()
+        sampleIndex = self._decode_rx(dataAcquired, 0)
+        deadline = time.monotonic() + timeout
         while sampleIndex < nSamples:
-            # read until have at least one packet
+            # not even one frame buffered, pull a large chunk from the device
             try:
-                while len(Data) < self.number_bytes:
-                    chunk = reader(self.number_bytes - len(Data))
-                    if not chunk:
-                        # timeout or no data available
-                        if time.time() - start_time > timeout:
-                            raise TimeoutError("Timed out waiting for data")
-                        continue
-                    Data += chunk
+                got = self._fill_rx((nSamples - sampleIndex) * nb - self._rx_len)
             except Exception:
                 logging.exception("Error while reading from device")
                 raise
-
-            decoded = self.decode(Data)  # decode the collected data
-            if isinstance(decoded, np.ndarray) and decoded.size != 0:
-                dataAcquired[:, sampleIndex] = decoded.T
-                Data = b''
-                sampleIndex += 1
-            else:
-                # if decode failed, shift buffer by one and retry to avoid deadlock
-                Data = Data[1:]
-                logging.debug("Decode failed, shifting buffer and retrying")
+            if got:
+                sampleIndex = self._decode_rx(dataAcquired, sampleIndex)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # timeout or no data available
+                raise TimeoutError("Timed out waiting for data")
+            if self.nonblocking: # wait for data instead of spinning on empty reads
+                select.select([self.socket], [], [], remaining)
 
         return dataAcquired
 
+    def read_available(self, maxSamples=None):
+        """Non-blocking: pull whatever the device has sent and return all complete frames decoded
+        ((5 + nChannels) x n uint16, n may be 0). For use with set_nonblocking() and a selector.
+        """
+        nb = self._prepare_rx()
+        self._fill_rx(0)
+        nFrames = self._rx_len // nb
+        if maxSamples is not None:
+            nFrames = min(nFrames, maxSamples)
+        dataAcquired = np.zeros((5 + len(self.analogChannels), nFrames), dtype=np.uint16)
+        n = self._decode_rx(dataAcquired, 0)
+        return dataAcquired[:, :n]
+
+    def start_capture(self, path):
+        """Raw capture mode: write every byte received from now on to path as is, next to a JSON sidecar
+        (path + '.json') with channel mask, sampling rate and start time. Call after start().
+        read_raw() then only moves bytes to the file; read()/read_available() still decode and tee into it.
+        Decode the file later with decode_capture()/iter_capture().
+        """
+        if not self.analogChannels:
+            raise ValueError("Analog channels must be specified before capturing.")
+        self.stop_capture()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._capture_info = {
+            "device": self.macAddress,
+            "sampling rate": self.samplingRate,
+            "channels": self.analogChannels,
+            "channel mask": sum(1 << i for i in self.analogChannels),
+            "frame bytes": frame_size(len(self.analogChannels)),
+            "start time": datetime.now().isoformat(timespec='milliseconds'),
+            "start timestamp": time.time(),
+        }
+        self._capture = open(path, 'wb')
+        self.capture_path = path
+        self.captured_bytes = 0
+        self._write_capture_info()
+        logging.info("Raw capture of %s to %s", self.macAddress, path)
+
+    def stop_capture(self):
+        """Close the capture file and complete its sidecar with byte count and stop time."""
+        if self._capture is None:
+            return
+        self._capture.close()
+        self._capture = None
+        self._capture_info.update({"stop time": datetime.now().isoformat(timespec='milliseconds'),
+                                   "bytes": self.captured_bytes})
+        self._write_capture_info()
+        logging.info("Raw capture saved to %s (%d bytes)", self.capture_path, self.captured_bytes)
+
+    def _write_capture_info(self):
+        with open(self.capture_path + '.json', 'w') as f:
+            json.dump(self._capture_info, f, indent=2)
+
+    def read_raw(self):
+        """Capture mode read: move what the device sent into the capture file without decoding.
+        Blocks until the receive buffer is full or the port timeout passes. Returns number of bytes.
+        """
+        if self._capture is None:
+            raise ValueError("Raw capture not started, call start_capture() first.")
+        self._prepare_rx()
+        got = self._fill_rx(len(self._rx) - self._rx_len)
+        self._rx_len = 0  # already written by _fill_rx
+        return got
+
+    def capture(self, path, duration=None):
+        """Record raw bytes to path for duration seconds (until interrupted if None). Call after start().
+        Raises TimeoutError if the device sends nothing for timeout seconds.
+        """
+        self.start_capture(path)
+        try:
+            end = None if duration is None else time.monotonic() + duration
+            last_data = time.monotonic()
+            while end is None or time.monotonic() < end:
+                if self.read_raw():
+                    last_data = time.monotonic()
+                elif time.monotonic() - last_data > self.timeout:
+                    raise TimeoutError("Timed out waiting for data")
+        finally:
+            self.stop_capture()
+        return path
+
+    def decode_frames(self, data, nAnalog=None):
+        """Decode a contiguous buffer of N whole frames in one pass, see decode_frames() at module level."""
+        if nAnalog is None: nAnalog = len(self.analogChannels)
+        return decode_frames(data, nAnalog)
+
     def decode(self, data, nAnalog=None):
+        """Decode the first frame in data. Returns (5 + nAnalog) x 1 matrix, or [] if CRC check failed.
+        """
         if nAnalog == None: nAnalog = len(self.analogChannels)
-        if nAnalog <= 4:
-            number_bytes = int(math.ceil((12. + 10. * nAnalog) / 8.))
-        else:
-            number_bytes = int(math.ceil((52. + 6. * (nAnalog - 4)) / 8.))
-        
-        nSamples = len(data) // number_bytes
-        res = np.zeros(((nAnalog + 5), nSamples))
-        
-        j, x0, x1, x2, x3, out, inp, col, line = 0, 0, 0, 0, 0, 0, 0, 0, 0
-        encode01 = 0x01
-        encode03 = 0x03
-        encodeFC = 0xFC
-        encodeFF = 0xFF
-        encodeC0 = 0xC0
-        encode3F = 0x3F
-        encodeF0 = 0xF0
-        encode0F = 0x0F
-        
-        CRC = data[j + number_bytes - 1] & encode0F
-        for byte in range(number_bytes):
-            for bit in range(7, -1, -1):
-                inp = data[byte] >> bit & encode01
-                if byte == (number_bytes - 1) and bit < 4:
-                    inp = 0
-                out = x3
-                x3 = x2
-                x2 = x1
-                x1 = out^x0
-                x0 = inp^out
- 
-        if CRC == ((x3<<3)|(x2<<2)|(x1<<1)|x0):
-            try:
-                def store(value): # function to write to result and increment line
-                    nonlocal line
-                    res[line, col] = value
-                    line += 1
-
-                store((data[j + number_bytes - 1] >> 4) & 0x0F) # Sequence number
-
-                # Digital channels D0 to D3 from a single byte
-                # TODO: there are only three digital channels on BITalino? confirm mapping
-                digital_byte = data[j + number_bytes - 2]
-                for bit in range(7, 3, -1):  # bits 7 to 4
-                    store((digital_byte >> bit) & 0x01)
-
-                # Analog channel decoding
-                analog_rules = [
-                    [(-2, 0x0F, 6), (-3, 0xFC, -2)],    # A0
-                    [(-3, 0x03, 8), (-4, 0xFF,  0)],    # A1
-                    [(-5, 0xFF, 2), (-6, 0xC0, -6)],    # A2
-                    [(-6, 0x3F, 4), (-7, 0xF0, -4)],    # A3
-                    [(-7, 0x0F, 2), (-8, 0xC0, -6)],    # A4
-                    [(-8, 0x3F, 0)]                     # A5
-                ]
-
-                #max_channels = 6 if res.shape[0] == 11 else 5
-                max_channels = res.shape[0] - 5
-                for i in range(max_channels):
-                    value = 0
-                    for byte_offset, mask, shift in analog_rules[i]:
-                        part = data[j + number_bytes + byte_offset] & mask
-                        if shift >= 0:
-                            value |= part << shift
-                        else:
-                            value |= part >> -shift
-                    store(value)
+        number_bytes = frame_size(nAnalog)
+        if len(data) < number_bytes or not frame_valid(data, 0, number_bytes):
+            return [] # CRC check failed
+        res, _ = self.decode_frames(bytes(data[:number_bytes]), nAnalog)
+        return res[:, :1]
 
-            except Exception as e:
-                print(f"Exception decoding frame: {e}")
-            return res
-        # CRC check failed
-        else:
-            return []
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Raw BITalino capture for long recordings, and its offline decoder.")
+    parser.add_argument('--capture', metavar='FILE', help="record raw frame bytes to FILE (sidecar FILE.json)")
+    parser.add_argument('--decode', metavar='FILE', help="decode a raw capture and print its link counters")
+    parser.add_argument('--mac', default=os.getenv('MAC_ADDRESS'), help="MAC address or serial port (default $MAC_ADDRESS)")
+    parser.add_argument('--rate', type=int, default=1000)
+    parser.add_argument('--channels', type=int, nargs='+', default=[0, 1, 2, 3, 4, 5], help="analog channels 0-5")
+    parser.add_argument('--duration', type=float, default=None, help="seconds, default until Ctrl+C")
+    parser.add_argument('--out', help="with --decode: save the decoded samples to this .npy file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    if args.capture:
+        device = BITalino(macAddress=args.mac)
+        device.open(args.mac, SamplingRate=args.rate)
+        try:
+            device.start(args.channels)
+            device.capture(args.capture, args.duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            device.stop()
+            device.close()
+    if args.decode:
+        counters = {}
+        data = decode_capture(args.decode, counters)
+        print(f"{data.shape[1]} samples, {data.shape[0] - 5} analog channels, link counters: {counters}")
+        if args.out:
+            np.save(args.out, data)
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Byte-level BITalino emulator on a Linux pseudo-terminal.
+
+Answers the control bytes BITalino.open/start/stop/battery send and, once started, streams CRC'd frames
+at the configured sampling rate, so the real BITalino.read/decode path runs without hardware.
+Corruption, byte drops and stalls can be injected for load and soak tests.
+
+Usage:
+    python3 -m core.emulator --link /tmp/bitalino --corrupt 0.001 --stall-rate 0.2
+    MAC_ADDRESS=/tmp/bitalino python3 -m uvicorn api.server:app
+"""
+import os
+import pty
+import tty
+import termios
+import select
+import threading
+import logging
+import time
+import numpy as np
+from .device import ANALOG_RULES, frame_size, crc4
+from .mock_device import MockBITalino
+
+RATES = {0x00: 1, 0x01: 10, 0x02: 100, 0x03: 1000}  # sampling rate code (bits 7-6 of the rate command)
+
+
+def encode_frames(data):
+    """Pack a (5 + nAnalog) x N sample matrix [seq, D0..D3, analog...] into N device frames (inverse of decode_frames).
+    Analog values are 10 bit; like the device, the 5th and 6th channel only carry their upper 6 bits.
+    """
+    data = np.asarray(data, dtype=np.uint16)
+    nAnalog = data.shape[0] - 5
+    number_bytes = frame_size(nAnalog)
+    frames = np.zeros((data.shape[1], number_bytes), dtype=np.uint8)
+    for i in range(nAnalog):
+        value = data[5 + i] if i < 4 else (data[5 + i] >> 4) & 0x3F  # A4/A5 fields are 6 bit wide
+        for byte_offset, mask, shift in ANALOG_RULES[i]:
+            part = value >> shift if shift >= 0 else value << -shift
+            frames[:, number_bytes + byte_offset] |= (part & mask).astype(np.uint8)
+    for line, bit in enumerate(range(7, 3, -1), start=1):
+        frames[:, -2] |= ((data[line] & 0x01) << bit).astype(np.uint8)
+    frames[:, -1] = (data[0] & 0x0F) << 4
+    frames[:, -1] |= crc4(frames)
+    return frames
+
+
+class BITalinoEmulator:
+    """Emulated device behind a pty. Point BITalino at .path like at /dev/rfcomm0.
+
+    Control bytes (same layout BITalino sends): xxxxxx01 start with channel mask in bits 2-7,
+    rr000011 set sampling rate, 0x00 while streaming stops, other xxxxxx00 while idle answer one battery byte.
+    Faults: corrupt_rate / drop_rate are per frame probabilities of flipping a byte / losing a byte,
+    stall_rate is stalls per second of stall_ms each, after which the backlog arrives as one burst.
+    """
+
+    def __init__(self, seed=None, corrupt_rate: float = 0.0, drop_rate: float = 0.0, stall_rate: float = 0.0,
+                 stall_ms: int = 200, battery_level: int = 80, max_pending: int = 65536):
+        self.rng = np.random.default_rng(seed)
+        self.source = MockBITalino(macAddress="emulator", seed=seed, paced=False)  # sample values, frames are built here
+        self.corrupt_rate = corrupt_rate
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.battery_level = battery_level
+        self.max_pending = max_pending  # bytes queued for an unread pty before the oldest are dropped
+        self.samplingRate = 1000
+        self.streaming = False
+        self.counters = dict.fromkeys(('frames_sent', 'corrupted_frames', 'dropped_bytes', 'stalls', 'overflow_bytes'), 0)
+        self.master = self.slave = None
+        self.path = None
+        self._out = bytearray()
+        self._t0 = self._sent = 0
+        self._last_tick = 0.0
+        self._stall_until = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Open the pty and serve it from a background thread. Returns self, the device path is .path."""
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)  # no echo or newline translation, pyserial does the same on its side
+        self.path = os.ttyname(self.slave)  # slave stays open here so clients can reconnect without EIO
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="bitalino-emulator", daemon=True)
+        self._thread.start()
+        logging.info("BITalino emulator on %s", self.path)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            wlist = [self.master] if self._out else []
+            readable, writable, _ = select.select([self.master], wlist, [], 0.005)
+            if readable:
+                for byte in os.read(self.master, 64):
+                    self._command(byte)
+            if self.streaming:
+                self._produce()
+            if writable and self._out:
+                n = os.write(self.master, self._out[:4096])
+                del self._out[:n]
+
+    def _command(self, byte):
+        if self.streaming:
+            if byte == 0x00:
+                self.streaming = False
+                self.source.stop()
+                logging.info("Emulator stopped after %d frames", self.counters['frames_sent'])
+            return  # anything else is ignored during acquisition
+        kind = byte & 0x03
+        if kind == 0x03:
+            self.samplingRate = RATES[byte >> 6]
+            self._flush()  # new connection, drop whatever the previous client left unread
+        elif kind == 0x01:
+            channels = [i for i in range(6) if byte & (1 << (2 + i))]
+            self.source.open(SamplingRate=self.samplingRate)
+            self.source.start(channels)
+            self._flush()
+            self.streaming = True
+            self._t0 = self._last_tick = time.monotonic()
+            self._sent = 0
+            logging.info("Emulator streaming A%s @ %d Hz", channels, self.samplingRate)
+        elif kind == 0x00:
+            self._out.append(self.battery_level & 0x7F)
+
+    def _flush(self):
+        self._out.clear()
+        termios.tcflush(self.slave, termios.TCIFLUSH)
+
+    def _produce(self):
+        """Queue the frames due by the monotonic clock since start, unless stalled."""
+        now = time.monotonic()
+        if self.stall_rate and self.rng.random() < self.stall_rate * (now - self._last_tick):
+            self._stall_until = now + self.stall_ms / 1000
+            self.counters['stalls'] += 1
+        self._last_tick = now
+        if now < self._stall_until:
+            return
+        due = int((now - self._t0) * self.samplingRate) - self._sent
+        if due <= 0:
+            return
+        frames = encode_frames(self.source.read(due))
+        self._sent += due
+        self.counters['frames_sent'] += due
+        self._out += self._inject_faults(frames)
+        if len(self._out) > self.max_pending:  # nobody reading, like a full radio buffer
+            excess = len(self._out) - self.max_pending
+            del self._out[:excess]
+            self.counters['overflow_bytes'] += excess
+
+    def _inject_faults(self, frames) -> bytes:
+        n, number_bytes = frames.shape
+        if self.corrupt_rate:
+            hit = np.flatnonzero(self.rng.random(n) < self.corrupt_rate)
+            frames[hit, self.rng.integers(0, number_bytes, len(hit))] ^= self.rng.integers(1, 256, len(hit)).astype(np.uint8)
+            self.counters['corrupted_frames'] += len(hit)
+        if self.drop_rate:
+            hit = np.flatnonzero(self.rng.random(n) < self.drop_rate)
+            if len(hit):
+                keep = np.ones(frames.size, dtype=bool)
+                keep[hit * number_bytes + self.rng.integers(0, number_bytes, len(hit))] = False
+                self.counters['dropped_bytes'] += len(hit)
+                return frames.reshape(-1)[keep].tobytes()
+        return frames.tobytes()
+
+
+def main():
+    import argparse
+    import signal
+    import sys
+    parser = argparse.ArgumentParser(description="Emulate a BITalino on a pseudo-terminal.")
+    parser.add_argument('--link', help="create a symlink to the pty at this path, e.g. /tmp/bitalino")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--corrupt', type=float, default=0.0, help="per frame probability of a corrupted byte")
+    parser.add_argument('--drop', type=float, default=0.0, help="per frame probability of a lost byte")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="stalls per second")
+    parser.add_argument('--stall-ms', type=int, default=200)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    emulator = BITalinoEmulator(seed=args.seed, corrupt_rate=args.corrupt, drop_rate=args.drop,
+                                stall_rate=args.stall_rate, stall_ms=args.stall_ms).start()
+    path = emulator.path
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(emulator.path, args.link)
+        path = args.link
+    print(f"BITalino emulator ready, set MAC_ADDRESS={path}", flush=True)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))  # clean up the symlink on kill too
+    try:
+        while True:
+            time.sleep(5)
+            logging.info("Emulator counters: %s", emulator.counters)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+        if args.link and os.path.islink(args.link):
+            os.remove(args.link)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,26 @@ import matplotlib.animation as animation
 import numpy as np
 import json
 import time
+import io
+import mmap
+import queue
+import threading
+import uuid
+import zipfile
 from datetime import datetime
 from .signal_type import signal_types, eeg_transfer, eda_transfer, ecg_transfer, emg_transfer, acc_transfer # import transfer functions
+from .wire_format import MEDIA_TYPE, decode_frame
+from .compressed_recording import CompressedRecordingWriter, CompressedRecordingReader, recover_compressed_recording
+from .pyramid import MinMaxPyramid, pyramid_path
 
 from dotenv import load_dotenv
 import os
 
 
+FRAME_ACCEPT = f"{MEDIA_TYPE}, application/json;q=0.9" # Accept header preferring binary frames, JSON still works
+CLIENT_ID = uuid.uuid4().hex # own subscriber of this process on the shared device stream, see /bitalino-subscribers/
+
+
 def setup_logging(verbose: bool = False) -> None:
     level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(level=level, format='%(asctime)s %(levelname)s: %(message)s')
@@ -32,7 +45,12 @@ def create_requests_session(retries: int = 3, backoff_factor: float = 0.3) -> re
 def parse_acquisition_response(response_text: str) -> pd.DataFrame:
     """Parse BITalino-style JSON response into dataframe.
     """
-    payload = json.loads(response_text)
+    return parse_acquisition_payload(json.loads(response_text))
+
+
+def parse_acquisition_payload(payload: dict) -> pd.DataFrame:
+    """Parse already decoded BITalino-style JSON payload into dataframe.
+    """
     if "error" in payload:
         raise ValueError(f"API error: {payload.get('error')} - {payload.get('detail')}")
 
@@ -42,9 +60,10 @@ def parse_acquisition_response(response_text: str) -> pd.DataFrame:
 
     provided_columns = payload.get("columns") # prefer explicit columns metadata when available
 
-    # ensure numeric dtype early to avoid ambiguous numpy scalar types later
+    # ensure numeric dtype early to avoid ambiguous numpy scalar types later, raw codes fit uint16
+    # (float32 conversion happens in the transfer functions)
     try:
-        arr = np.asarray(data_got, dtype=float)
+        arr = np.asarray(data_got, dtype=np.uint16)
     except Exception as e:
         raise ValueError(f"Failed to convert data to numeric array: {e}")
 
@@ -79,21 +98,60 @@ def parse_acquisition_response(response_text: str) -> pd.DataFrame:
         raise ValueError(f"Error creating DataFrame: {e}")
 
     # capture optional channel_types metadata
-    channel_types = payload.get('channel_types')
-    def _normalize_label(lbl: str) -> str:
-        if not isinstance(lbl, str):
-            return lbl
-        s = lbl.strip().upper()
-        if s.startswith('A') and s[1:].isdigit():
-            return s
-        if s.startswith('D') and s[1:].isdigit():
-            return 'D' + str(int(s[1:]))
-        if s.isdigit():
-            return 'D' + str(int(s))
-        if s.startswith('I') and s[1:].isdigit():
-            return 'D' + str(int(s[1:]))
+    _set_channel_types(df, payload.get('channel_types'))
+    return df
+
+
+def parse_acquisition_frame(content: bytes) -> pd.DataFrame:
+    """Parse binary application/x-bitalino-frame response into dataframe (uint16 samples, no per-value conversion).
+    """
+    arr, header = decode_frame(content)
+    if arr.shape[0] == 0:
+        raise ValueError("No samples in frame.")
+    df = pd.DataFrame(arr, columns=header.get("columns") or None, copy=False)
+    _set_channel_types(df, header.get('channel_types'))
+    df.attrs['first_sample'] = header.get('first_sample')
+    return df
+
+
+def parse_response(response) -> pd.DataFrame:
+    """Parse requests response in either wire format, based on its content type."""
+    if response.headers.get('content-type', '').startswith(MEDIA_TYPE):
+        return parse_acquisition_frame(response.content)
+    return parse_acquisition_response(response.text)
+
+
+def parse_cursor_response(response):
+    """Parse /bitalino-since/ response in either wire format. Returns (dataframe or None when there were no new
+    samples, next_cursor, dropped).
+    """
+    if response.headers.get('content-type', '').startswith(MEDIA_TYPE):
+        arr, meta = decode_frame(response.content)
+        df = parse_acquisition_frame(response.content) if arr.shape[0] else None
+    else:
+        meta = response.json()
+        df = parse_acquisition_payload(meta) if meta.get('data') else None
+        if df is not None:
+            df.attrs['first_sample'] = meta.get('first_sample')
+    return df, meta.get('next_cursor'), meta.get('dropped', 0)
+
+
+def _normalize_label(lbl: str) -> str:
+    if not isinstance(lbl, str):
+        return lbl
+    s = lbl.strip().upper()
+    if s.startswith('A') and s[1:].isdigit():
         return s
+    if s.startswith('D') and s[1:].isdigit():
+        return 'D' + str(int(s[1:]))
+    if s.isdigit():
+        return 'D' + str(int(s))
+    if s.startswith('I') and s[1:].isdigit():
+        return 'D' + str(int(s[1:]))
+    return s
+
 
+def _set_channel_types(df: pd.DataFrame, channel_types) -> None:
     if isinstance(channel_types, dict):
         # Normalize keys to match columns present
         normalized = {_normalize_label(k): v for k, v in channel_types.items()}
@@ -104,13 +162,103 @@ def parse_acquisition_response(response_text: str) -> pd.DataFrame:
     else:
         df.attrs['channel_types'] = {}
 
-    return df
 
+class StreamClient:
+    """Subscribe to the /bitalino-stream WebSocket on a background thread.
 
-def write_to_file(path: str, mac: str, sampling_rate: int, times: list, data: dict, channel_labels: list, device_name: str = None, header_key: str = None, sensor_types: dict | None = None):
-    """Write a text data file with a JSON-style header and tab-separated rows.
-    The header contains basic metadata (device name, sampling rate, channel labels).
+    Received blocks are queued, drain() returns everything since the last call as one dataframe
+    (same format as parse_acquisition_response), so it can replace a polling request.
+    Missing samples between blocks are counted in gaps.
     """
+
+    def __init__(self, macAddress: str, samplingRate: int, channels: list | None = None, channel_types: dict | None = None,
+                 chunk_ms: int = 100, url: str = "ws://localhost:8000/bitalino-stream", timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+        self.subscribe = {
+            "macAddress": macAddress,
+            "samplingRate": samplingRate,
+            "channels": channels,
+            "channel_types": channel_types,
+            "chunk_ms": chunk_ms,
+            "format": "frame",
+        }
+        self.blocks = queue.Queue()
+        self.gaps = 0  # samples missing between received blocks
+        self.next_sample = None  # expected first_sample of the next block
+        self.error = None
+        self.ws = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        from websocket import create_connection # pip install websocket-client
+        self._stop.clear()
+        self.ws = create_connection(self.url, timeout=self.timeout)
+        self.ws.send(json.dumps(self.subscribe))
+        self._thread = threading.Thread(target=self._run, name="stream-client", daemon=True)
+        self._thread.start()
+        logging.info("Subscribed to %s for %s", self.url, self.subscribe["macAddress"])
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                msg = self.ws.recv()
+                if not msg:
+                    raise ConnectionError("Stream closed by server")
+                if isinstance(msg, bytes): # binary frame
+                    df = parse_acquisition_frame(msg)
+                    payload = df.attrs
+                else: # JSON block or error message
+                    payload = json.loads(msg)
+                    df = parse_acquisition_payload(payload)
+            except Exception as e:
+                if not self._stop.is_set():
+                    logging.warning("Stream receive failed: %s", e)
+                    self.error = e
+                break
+            first = payload.get("first_sample")
+            if first is not None:
+                if self.next_sample is not None and first > self.next_sample:
+                    self.gaps += first - self.next_sample
+                    logging.warning("Stream gap: %d samples missing before block %s", first - self.next_sample, payload.get("seq"))
+                self.next_sample = first + len(df)
+            self.blocks.put(df)
+
+    def drain(self) -> pd.DataFrame | None:
+        """Return all blocks received since last call as one dataframe, or None if nothing arrived."""
+        dfs = []
+        while True:
+            try:
+                dfs.append(self.blocks.get_nowait())
+            except queue.Empty:
+                break
+        if not dfs:
+            return None
+        df = pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+        df.attrs['channel_types'] = dfs[-1].attrs.get('channel_types', {})
+        return df
+
+    def stop(self):
+        self._stop.set()
+        try:
+            if self.ws is not None:
+                self.ws.close()
+        except Exception:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.ws = None
+
+    def restart(self):
+        """Reconnect after an error, gap accounting continues from the last received block."""
+        self.stop()
+        self.error = None
+        self.start()
+
+
+def opensignals_header(mac: str, sampling_rate: int, channel_labels: list, device_name: str = None, header_key: str = None, sensor_types: dict | None = None) -> dict:
+    """Header metadata of a text data file (device name, sampling rate, channel labels)."""
     now = datetime.now()
     date_str = f"{now.year}-{now.month}-{now.day}"
     time_str = now.strftime("%H:%M:%S.%f")[:-3]
@@ -123,7 +271,7 @@ def write_to_file(path: str, mac: str, sampling_rate: int, times: list, data: di
     else:
         sensor_list = channel_labels
     # TODO: check what header meta data is needed by BITalino specs
-    meta = {
+    return {
         header_key: {
             "position": 0,
             "device": device_name,
@@ -145,23 +293,566 @@ def write_to_file(path: str, mac: str, sampling_rate: int, times: list, data: di
             "convertedValues": 1
         }
     }
-    # write header line and tab-separeted data lines
-    with open(path, 'w', newline='') as fh:
-        fh.write('# ' + json.dumps(meta) + "\n")
-        fh.write('# EndOfHeader\n')
-        # rows: time then channel values
+
+
+class RecordingWriter:
+    """Text data file written during acquisition: header up front, sample blocks appended as they arrive.
+
+    Same layout as write_to_file(). A block is formatted with one %-operation over all its values instead
+    of per value. The file is flushed every flush_seconds and fsynced every fsync_seconds (None leaves it
+    to the OS), so a crash loses at most that much; recover_recording() cleans up the rest. fmt='csv' writes a comma-separated file
+    with a column name row instead of the header. header replaces the opensignals_header() metadata.
+    pyramid=True also builds the min/max pyramid (core.pyramid) and saves it next to the file on close().
+    """
+
+    converted = True # values are written as given, transferred ones normally
+
+    def __init__(self, path: str, mac: str, sampling_rate: int, channel_labels: list, device_name: str = None,
+                 header_key: str = None, sensor_types: dict | None = None, fmt: str = 'tsv', flush_seconds: float = 1.0,
+                 header: dict | None = None, pyramid: bool = True, fsync_seconds: float | None = 5.0):
+        self.path = path
+        self.channel_labels = list(channel_labels)
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self.samples = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.pyramid = MinMaxPyramid(len(self.channel_labels), spool=path) if pyramid else None
+        self.fh = open(path, 'w', newline='')
+        delimiter = ',' if fmt == 'csv' else '\t'
+        if fmt == 'csv':
+            self.fh.write(','.join(['Time (s)'] + self.channel_labels) + "\n")
+        else: # write header line, then tab-separeted data lines
+            meta = header or opensignals_header(mac, sampling_rate, self.channel_labels, device_name, header_key, sensor_types)
+            self.fh.write('# ' + json.dumps(meta) + "\n")
+            self.fh.write('# EndOfHeader\n')
+        self._row = delimiter.join(['%.6f'] * (len(self.channel_labels) + 1)) + "\n" # rows: time then channel values
+        self._last_flush = self._last_fsync = time.monotonic()
+        self.flush(sync=True) # header on disk before the first sample
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, times, data, chunk: int = 65536):
+        """Append len(times) rows. data is a dict channel -> values or a list of value arrays in channel_labels
+        order; missing or short channels are left empty in their rows.
+        """
         n = len(times)
-        for i in range(n):
-            row = [f"{times[i]:.6f}"]
-            for ch in channel_labels:
-                vals = data.get(ch, [])
-                v = vals[i] if i < len(vals) else ''
-                try:
-                    row.append(f"{float(v):.6f}")
-                except Exception:
-                    row.append(str(v))
-            fh.write('\t'.join(row) + "\n")
-    logging.info('Saved text data file to %s', path)
+        for start in range(0, n, chunk):
+            end = min(n, start + chunk)
+            block = np.full((end - start, len(self.channel_labels) + 1), np.nan)
+            block[:, 0] = times[start:end]
+            for i, ch in enumerate(self.channel_labels):
+                vals = np.asarray(data.get(ch, []) if isinstance(data, dict) else data[i], dtype=float)[start:end]
+                block[:len(vals), i + 1] = vals
+            text = (self._row * len(block)) % tuple(block.ravel().tolist())
+            if np.isnan(block).any():
+                text = text.replace('nan', '')
+            self.fh.write(text)
+            if self.pyramid is not None:
+                self.pyramid.add(block[:, 1:].T)
+        self.samples += n
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self, sync: bool = False):
+        """Write buffered rows (and spooled pyramid bins) to the file, and to disk if sync or fsync_seconds have
+        passed since the last fsync."""
+        self.fh.flush()
+        self._last_flush = time.monotonic()
+        sync = self.fsync_seconds is not None and (sync or self._last_flush - self._last_fsync >= self.fsync_seconds)
+        if sync:
+            os.fsync(self.fh.fileno())
+            self._last_fsync = self._last_flush
+        if self.pyramid is not None:
+            self.pyramid.flush(sync)
+
+    def close(self):
+        if not self.fh.closed:
+            self.flush(sync=True)
+            self.fh.close()
+            if self.pyramid is not None:
+                self.pyramid.save_for(self.path)
+            logging.info('Saved text data file to %s (%d samples)', self.path, self.samples)
+
+
+def write_to_file(path: str, mac: str, sampling_rate: int, times: list, data: dict, channel_labels: list, device_name: str = None, header_key: str = None, sensor_types: dict | None = None):
+    """Write a text data file with a JSON-style header and tab-separated rows in one go.
+    The header contains basic metadata (device name, sampling rate, channel labels).
+    """
+    with RecordingWriter(path, mac, sampling_rate, channel_labels, device_name=device_name,
+                         header_key=header_key, sensor_types=sensor_types) as writer:
+        writer.write(times, data)
+
+
+def _write_json_atomic(path: str, obj, sync: bool = True):
+    """Write JSON to a temporary file and rename it over path, readers see the old or the new file, never half of one."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=2)
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class BinaryRecordingWriter:
+    """Binary data file written during acquisition: raw little-endian samples x channels (float32 converted
+    values, or uint16 ADC codes with dtype=np.uint16) that np.memmap opens as is, and a JSON sidecar
+    <file>.json with the opensignals_header() metadata plus "dtype" and "time offset".
+
+    Time stamps are not stored, sample k is at time offset + k / sampling rate. Same write(), flush(), fsync
+    and pyramid options as RecordingWriter. The sidecar is replaced atomically, a crash never leaves it half
+    written; recover_recording() adds the sample count it only gets on close().
+    """
+
+    def __init__(self, path: str, mac: str, sampling_rate: int, channel_labels: list, device_name: str = None,
+                 header_key: str = None, sensor_types: dict | None = None, dtype=np.float32, flush_seconds: float = 1.0,
+                 header: dict | None = None, pyramid: bool = True, fsync_seconds: float | None = 5.0):
+        self.path = path
+        self.channel_labels = list(channel_labels)
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.converted = self.dtype.kind == 'f' # uint16 files hold the codes before transfer functions
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self.samples = 0
+        self.header = json.loads(json.dumps(header)) if header else opensignals_header(
+            mac, sampling_rate, self.channel_labels, device_name, header_key, sensor_types)
+        self.info = next(iter(self.header.values()))
+        self.info.update({"column": self.channel_labels, "convertedValues": int(self.converted),
+                          "dtype": self.dtype.str, "time offset": self.info.get("time offset", 0.0)})
+        self._time_set = header is not None and "time offset" in next(iter(header.values()))
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.pyramid = MinMaxPyramid(len(self.channel_labels), spool=path) if pyramid else None
+        self.fh = open(path, 'wb')
+        self._write_sidecar()
+        self._last_flush = self._last_fsync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_sidecar(self):
+        _write_json_atomic(self.path + '.json', self.header, sync=self.fsync_seconds is not None)
+
+    def write(self, times, data):
+        """Append len(times) samples, data as for RecordingWriter.write(). Missing values are NaN (float32) or 0."""
+        n = len(times)
+        if n == 0:
+            return
+        if not self._time_set:
+            self.info["time offset"] = float(times[0])
+            self._time_set = True
+            self._write_sidecar()
+        block = np.full((n, len(self.channel_labels)), np.nan if self.converted else 0, dtype=self.dtype)
+        for i, ch in enumerate(self.channel_labels):
+            vals = np.asarray(data.get(ch, []) if isinstance(data, dict) else data[i])[:n]
+            block[:len(vals), i] = vals
+        self.fh.write(block.tobytes())
+        if self.pyramid is not None:
+            self.pyramid.add(block.T)
+        self.samples += n
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self, sync: bool = False):
+        """Same as RecordingWriter.flush()."""
+        self.fh.flush()
+        self._last_flush = time.monotonic()
+        sync = self.fsync_seconds is not None and (sync or self._last_flush - self._last_fsync >= self.fsync_seconds)
+        if sync:
+            os.fsync(self.fh.fileno())
+            self._last_fsync = self._last_flush
+        if self.pyramid is not None:
+            self.pyramid.flush(sync)
+
+    def close(self):
+        if not self.fh.closed:
+            self.flush(sync=True)
+            self.fh.close()
+            self.info["samples"] = self.samples
+            self._write_sidecar()
+            if self.pyramid is not None:
+                self.pyramid.save_for(self.path)
+            logging.info('Saved binary data file to %s (%d samples)', self.path, self.samples)
+
+
+def open_recording_writer(path: str, mac: str, sampling_rate: int, channel_labels: list, fmt: str = 'tsv', **kwargs):
+    """Writer for SAVE_FORMAT fmt: 'tsv' (.txt), 'csv', 'bin' (float32), 'bin-raw' (uint16 codes) or 'binz'
+    (compressed uint16 codes). path is without extension. Check writer.converted to know if it wants
+    transferred values or raw codes. fsync_seconds defaults to FSYNC_SECONDS from the environment.
+    """
+    if 'fsync_seconds' not in kwargs:
+        fsync = os.getenv('FSYNC_SECONDS', '5').strip().lower()
+        kwargs['fsync_seconds'] = None if fsync in ('', 'off', 'none') else float(fsync)
+    if fmt == 'binz':
+        header = kwargs.pop('header', None) or opensignals_header(mac, sampling_rate, channel_labels, kwargs.pop('device_name', None),
+                                                                  kwargs.pop('header_key', None), kwargs.pop('sensor_types', None))
+        return CompressedRecordingWriter(f"{path}.binz", header, channel_labels, **kwargs)
+    if fmt in ('bin', 'bin-raw'):
+        return BinaryRecordingWriter(f"{path}.bin", mac, sampling_rate, channel_labels,
+                                     dtype=np.uint16 if fmt == 'bin-raw' else np.float32, **kwargs)
+    return RecordingWriter(f"{path}.{'csv' if fmt == 'csv' else 'txt'}", mac, sampling_rate, channel_labels, fmt=fmt, **kwargs)
+
+
+def read_recording_header(path: str):
+    """Header of a text data file. Returns (header, columns, offset): the header as written by
+    opensignals_header() ({key: device dict}), column names and the byte offset where the samples start.
+    """
+    header, columns, offset = {}, [], 0
+    with open(path, 'rb') as fh:
+        for raw in fh:
+            line = raw.decode('utf-8', 'replace')
+            if not line.startswith('#'):
+                if path.lower().endswith('.csv'): # column name row instead of a header
+                    columns = [c.strip() for c in line.split(',')]
+                    offset += len(raw)
+                break
+            offset += len(raw)
+            if line.startswith('# {'):
+                parsed = json.loads(line[2:])
+                if isinstance(parsed, dict) and parsed:
+                    header = parsed
+                    columns = next(iter(header.values())).get('column', [])
+            if line.strip() == '# EndOfHeader':
+                break
+    return header, columns, offset
+
+
+def _recording_layout(path: str, meta: dict, columns: list, offset: int = 0) -> dict:
+    """pandas.read_csv arguments and channel rows for the data section of a text data file (starting at offset).
+    Without a sampling rate in the header (.csv) it is taken from the median spacing of the first time stamps.
+    """
+    time_col = next((i for i, c in enumerate(columns) if c in ('Time', 'Time (s)')), None)
+    labels = [ch for ch in meta.get('label', [c for c in columns if c not in ('Time', 'Time (s)')]) if ch in columns]
+    dtypes = {i: np.float32 for i in range(len(columns))}
+    if time_col is not None:
+        dtypes[time_col] = np.float64 # float32 time stamps lose the sample period after a few hours
+    layout = {
+        'time_col': time_col,
+        'rows': [columns.index(ch) for ch in labels],
+        'read_csv': dict(sep=',' if path.lower().endswith('.csv') else '\t', header=None, engine='c',
+                         usecols=range(len(columns)) if columns else None, dtype=dtypes or np.float32),
+    }
+    rate = meta.get('sampling rate', meta.get('sampling_rate'))
+    if rate is None and time_col is not None:
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            try:
+                times = pd.read_csv(fh, nrows=1001, **layout['read_csv'])[time_col].to_numpy()
+            except ValueError: # no rows yet, or a partly written one
+                times = np.zeros(0)
+        spacing = np.median(np.diff(times)) if len(times) > 1 else 0
+        rate = int(round(1 / spacing)) if spacing > 0 else None
+    if rate is None:
+        logging.warning('No sampling rate in %s, assuming 1000 Hz', path)
+        rate = 1000
+    meta.update({'label': labels, 'sampling rate': rate})
+    return layout
+
+
+def _parse_samples(source, layout: dict, sampling_rate, first_sample: int = 0, **kwargs):
+    """Parse data rows from a file object with pandas' C parser. Returns (times, channels x samples float32)."""
+    table = pd.read_csv(source, **layout['read_csv'], **kwargs)
+    data = np.empty((len(layout['rows']), len(table)), dtype=np.float32)
+    for i, col in enumerate(layout['rows']):
+        data[i] = table[col].to_numpy()
+    if layout['time_col'] is not None:
+        times = table[layout['time_col']].to_numpy()
+    else: # OpenSignals exports start with nSeq, not time
+        times = (first_sample + np.arange(len(table))) / sampling_rate
+    return times, data
+
+
+def load_recording(path: str):
+    """Load a text data file written by RecordingWriter/write_to_file (also .csv files and OpenSignals text exports).
+
+    The JSON header is parsed once and the data section goes to pandas' C parser with fixed dtypes.
+    Returns (times, data, meta): float64 time stamps, a float32 (channels x samples) array with one row per
+    meta['label'] channel, and the header dict of the (first) device. Binary (.bin) and compressed (.binz)
+    files are read as stored, float32 or uint16.
+    """
+    if path.lower().endswith(('.bin', '.binz')):
+        with open_recording(path) as reader:
+            times, data = reader.read(0, len(reader))
+        return times, data, reader.meta
+    header, columns, offset = read_recording_header(path)
+    meta = dict(next(iter(header.values()))) if header else {}
+    layout = _recording_layout(path, meta, columns, offset)
+    with open(path, 'rb') as fh:
+        fh.seek(offset)
+        times, data = _parse_samples(fh, layout, meta['sampling rate'])
+    logging.info('Loaded %s: %d samples, channels %s', path, len(times), meta['label'])
+    return times, data, meta
+
+
+class RecordingReader:
+    """Text data file read lazily through a memory map, only the samples of the requested window are parsed.
+
+    The first open scans the file for line starts (vectorized, chunk by chunk) and keeps a sparse index with
+    the byte offset and time stamp of every index_stride-th sample, cached next to the file as <file>.idx.npz.
+    Later opens read just the header and that index. Memory is proportional to the window read plus
+    cache_samples, which are parsed ahead so playback doesn't reparse on every step.
+    """
+
+    def __init__(self, path: str, index_stride: int = 1000, cache_samples: int = 10000):
+        self.path = path
+        self.index_stride = index_stride
+        self.cache_samples = cache_samples
+        self.header, self.columns, self.data_offset = read_recording_header(path)
+        self.meta = dict(next(iter(self.header.values()))) if self.header else {}
+        self._layout = _recording_layout(path, self.meta, self.columns, self.data_offset)
+        self.converted = bool(self.meta.get('convertedValues', 1)) # False: raw ADC codes, see core.signal_type
+        self.labels = self.meta['label']
+        self.sampling_rate = self.meta['sampling rate']
+        self._fh = open(path, 'rb')
+        size = os.fstat(self._fh.fileno()).st_size
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.offsets, self.index_times, self.n_samples, self.data_end = self._load_index()
+        self._cache = (0, np.zeros(0), np.zeros((len(self.labels), 0), dtype=np.float32))
+
+    def __len__(self):
+        return self.n_samples
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._cache = None
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
+
+    def _load_index(self):
+        index_path = self.path + '.idx.npz'
+        stat = os.stat(self.path)
+        try:
+            with np.load(index_path) as cached:
+                if (int(cached['size']) == stat.st_size and int(cached['mtime_ns']) == stat.st_mtime_ns
+                        and int(cached['stride']) == self.index_stride):
+                    return cached['offsets'], cached['times'], int(cached['n_samples']), int(cached['data_end'])
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            pass # no index yet, or a stale/broken one
+        offsets, n_samples, data_end = self._scan_lines(stat.st_size)
+        times = self._index_times(offsets, n_samples)
+        try:
+            np.savez(index_path, offsets=offsets, times=times, n_samples=n_samples, data_end=data_end,
+                     size=stat.st_size, mtime_ns=stat.st_mtime_ns, stride=self.index_stride)
+        except OSError as e:
+            logging.warning('Could not cache recording index %s: %s', index_path, e)
+        logging.info('Indexed %s: %d samples', self.path, n_samples)
+        return offsets, times, n_samples, data_end
+
+    def _scan_lines(self, size, chunk: int = 1 << 26):
+        """Byte offsets of every index_stride-th sample line. Only complete (newline terminated) lines count,
+        so a file still being written is indexed up to its last flushed row."""
+        stride = self.index_stride
+        offsets = [np.array([self.data_offset], dtype=np.int64)]
+        n_lines, data_end = 0, self.data_offset
+        for start in range(self.data_offset, size, chunk):
+            buf = np.frombuffer(self._mm, dtype=np.uint8, count=min(chunk, size - start), offset=start)
+            line_ends = np.flatnonzero(buf == 10) + start + 1 # start of the line after each newline
+            del buf # release the map export so close() can unmap
+            first = (stride - 1 - n_lines) % stride # newline number k ends sample k, sample k + 1 starts after it
+            offsets.append(line_ends[first::stride])
+            n_lines += len(line_ends)
+            if len(line_ends):
+                data_end = int(line_ends[-1])
+        offsets = np.concatenate(offsets)[:-(-n_lines // stride) or 1]
+        return offsets, n_lines, data_end
+
+    def _index_times(self, offsets, n_samples):
+        if self._layout['time_col'] is None or n_samples == 0:
+            return np.arange(len(offsets)) * self.index_stride / self.sampling_rate
+        sep = self._layout['read_csv']['sep'].encode()
+        times = np.empty(len(offsets))
+        for k, off in enumerate(offsets.tolist()):
+            line = self._mm[off:self._mm.find(b'\n', off)]
+            times[k] = float(line.split(sep)[self._layout['time_col']])
+        return times
+
+    def sample_at(self, t: float) -> int:
+        """Index of the sample at time t (seconds in the file's time column), clamped to the recording."""
+        k = max(0, int(np.searchsorted(self.index_times, t, side='right')) - 1)
+        sample = k * self.index_stride + int(round((t - self.index_times[k]) * self.sampling_rate)) if len(self.index_times) else 0
+        return min(max(sample, 0), self.n_samples)
+
+    def read(self, start: int, n: int):
+        """Samples [start, start + n) as (times, channels x samples float32), parsed from the memory map."""
+        start = min(max(int(start), 0), self.n_samples)
+        end = min(start + max(int(n), 0), self.n_samples)
+        first, times, data = self._cache
+        if not (first <= start and end <= first + len(times)):
+            self._cache = (start,) + self._parse(start, min(self.n_samples, max(end, start + self.cache_samples)))
+            first, times, data = self._cache
+        return times[start - first:end - first], data[:, start - first:end - first]
+
+    def window(self, t0: float, t1: float):
+        """Samples between times t0 and t1 (seconds), see read()."""
+        start = self.sample_at(t0)
+        return self.read(start, self.sample_at(t1) - start)
+
+    def _parse(self, start, end):
+        if end <= start:
+            return np.zeros(0), np.zeros((len(self.labels), 0), dtype=np.float32)
+        stride = self.index_stride
+        k, k_end = start // stride, -(-end // stride)
+        a = int(self.offsets[k])
+        b = int(self.offsets[k_end]) if k_end < len(self.offsets) else self.data_end
+        return _parse_samples(io.BytesIO(self._mm[a:b]), self._layout, self.sampling_rate, first_sample=start,
+                              skiprows=start - k * stride, nrows=end - start)
+
+
+class BinaryRecordingReader:
+    """Binary data file (see BinaryRecordingWriter) memory mapped, same interface as RecordingReader."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path + '.json') as f:
+            self.header = json.load(f)
+        self.meta = dict(next(iter(self.header.values())))
+        self.labels = self.meta['label']
+        self.sampling_rate = self.meta['sampling rate']
+        self.time_offset = self.meta.get('time offset', 0.0)
+        self.dtype = np.dtype(self.meta.get('dtype', '<f4'))
+        self.converted = bool(self.meta.get('convertedValues', self.dtype.kind == 'f')) # False: uint16 ADC codes
+        n = os.path.getsize(path) // (self.dtype.itemsize * len(self.labels)) # whole samples, also while being written
+        self.samples = np.memmap(path, dtype=self.dtype, mode='r', shape=(n, len(self.labels))) if n else \
+            np.zeros((0, len(self.labels)), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.samples = np.zeros((0, len(self.labels)), dtype=self.dtype) # drops the map
+
+    def sample_at(self, t: float) -> int:
+        return min(max(int(round((t - self.time_offset) * self.sampling_rate)), 0), len(self))
+
+    def read(self, start: int, n: int):
+        """Samples [start, start + n) as (times, channels x samples), copied from the memory map."""
+        start = min(max(int(start), 0), len(self))
+        end = min(start + max(int(n), 0), len(self))
+        times = self.time_offset + np.arange(start, end) / self.sampling_rate
+        return times, np.ascontiguousarray(self.samples[start:end].T)
+
+    def window(self, t0: float, t1: float):
+        start = self.sample_at(t0)
+        return self.read(start, self.sample_at(t1) - start)
+
+
+def open_recording(path: str):
+    """RecordingReader, BinaryRecordingReader or CompressedRecordingReader for a data file, by extension."""
+    if path.lower().endswith('.binz'):
+        return CompressedRecordingReader(path)
+    return BinaryRecordingReader(path) if path.lower().endswith('.bin') else RecordingReader(path)
+
+
+def load_pyramid(path: str, reader=None, block: int = 100000) -> MinMaxPyramid:
+    """Min/max pyramid of a data file: the saved <file>.pyr.npz if current, else built in one pass over the
+    file (reader, or open_recording(path)), or over the part the bins spooled by an interrupted writer don't
+    cover, and saved for the next time.
+    """
+    pyramid = MinMaxPyramid.load(pyramid_path(path), path)
+    if pyramid is not None:
+        return pyramid
+    own_reader = reader is None
+    reader = reader or open_recording(path)
+    try:
+        pyramid = MinMaxPyramid.resume(path, len(reader.labels), len(reader)) or MinMaxPyramid(len(reader.labels))
+        for start in range(pyramid.n_samples, len(reader), block):
+            pyramid.add(reader.read(start, block)[1])
+    finally:
+        if own_reader:
+            reader.close()
+    pyramid.save_for(path)
+    logging.info('Built min/max pyramid for %s: %d levels', path, len(pyramid.levels))
+    return pyramid
+
+
+def convert_recording(src: str, dst: str, dtype=None, codec: str = 'zlib', block: int = 100000) -> str:
+    """Convert a recording between the text (.txt/.csv), binary (.bin) and compressed (.binz) formats, by
+    extension, keeping its header. dtype defaults to the source's (float32 for text). Returns dst.
+    """
+    with open_recording(src) as reader:
+        header = json.loads(json.dumps(reader.header)) or opensignals_header('', reader.sampling_rate, reader.labels)
+        info = next(iter(header.values()))
+        for key in ('dtype', 'time offset', 'samples', 'codec', 'block samples'):
+            info.pop(key, None)
+        dtype = dtype or getattr(reader, 'dtype', np.float32)
+        ext = os.path.splitext(dst)[1].lower()
+        if ext == '.binz':
+            writer = CompressedRecordingWriter(dst, header, reader.labels, dtype=dtype, codec=codec)
+        elif ext == '.bin':
+            writer = BinaryRecordingWriter(dst, '', reader.sampling_rate, reader.labels, dtype=dtype, header=header)
+        else:
+            info['column'] = ["Time"] + reader.labels
+            writer = RecordingWriter(dst, '', reader.sampling_rate, reader.labels, header=header,
+                                     fmt='csv' if ext == '.csv' else 'tsv')
+        with writer:
+            for start in range(0, len(reader), block):
+                writer.write(*reader.read(start, block))
+    return dst
+
+
+def text_to_binary(src: str, dst: str = None, dtype=np.float32, block: int = 100000) -> str:
+    """Convert a text data file to the binary format, keeping its header. Returns the .bin path."""
+    return convert_recording(src, dst or os.path.splitext(src)[0] + '.bin', dtype=dtype, block=block)
+
+
+def binary_to_text(src: str, dst: str = None, block: int = 100000) -> str:
+    """Convert a binary or compressed data file to the OpenSignals style text format. Returns the .txt path."""
+    return convert_recording(src, dst or os.path.splitext(src)[0] + '.txt', block=block)
+
+
+def recover_recording(path: str, dst: str = None) -> str:
+    """Make a recording left behind by a crash or kill valid again, in place: cut a partly written last row
+    or block, complete the .bin sidecar or the .binz block index, and rebuild the min/max pyramid.
+    With dst the recovered file is also converted (convert_recording()), e.g. to OpenSignals text.
+    Returns the recovered file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.binz':
+        recover_compressed_recording(path)
+    elif ext == '.bin':
+        with open(path + '.json') as f:
+            header = json.load(f)
+        info = next(iter(header.values()))
+        row = np.dtype(info.get('dtype', '<f4')).itemsize * len(info['label'])
+        size = os.path.getsize(path)
+        info['samples'] = size // row
+        if size != info['samples'] * row:
+            os.truncate(path, info['samples'] * row)
+        _write_json_atomic(path + '.json', header)
+    else:
+        _, columns, offset = read_recording_header(path)
+        if not columns:
+            raise ValueError(f"{path} has no complete header, nothing to recover")
+        with open(path, 'r+b') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.find(b'\0', offset) # unsynced pages can come back zero-filled after a power loss
+                end = mm.rfind(b'\n', offset, size if end < 0 else end) + 1 or offset
+            if end < size:
+                fh.truncate(end)
+                os.fsync(fh.fileno())
+    with open_recording(path) as reader:
+        load_pyramid(path, reader)
+        logging.info('Recovered %s: %d samples', path, len(reader))
+    return convert_recording(path, dst) if dst else path
 
 
 def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: bool = False, device_name: str = None, header_key: str = None) -> str:
@@ -184,6 +875,7 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
     sampling_rate = signal.sampling_rate
     signal_unit= signal.unit
     transfer_func = signal.transfer_function
+    filename = f'data_recording_{date_and_time}_{signal.name}'
 
     # mapping from sensor string to transfer function
     SENSOR_TRANSFER = {
@@ -261,8 +953,7 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
     # per-channel data buffers and global time buffer
     data_buffer = {ch: [] for ch in channels_selected}
     time_buffer = []
-    all_data = {ch: [] for ch in channels_selected}  # for saving to file per-channel
-    all_time = []
+    writer = None # recording file, opened at the first block once channel types are known
     t = 0
     dt =1.0/sampling_rate
 
@@ -290,31 +981,53 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
             stop = True
 
 
+    def open_writer():
+        out_format = os.getenv('SAVE_FORMAT', 'tsv') # tsv, csv, bin (float32), bin-raw (uint16 codes) or binz (compressed uint16 codes)
+        # pick device name and header key from args or environment, if any TODO: check if these are used
+        _device_name = device_name or os.getenv('DEVICE_NAME')
+        _header_key = header_key or os.getenv('HEADER_KEY')
+        return open_recording_writer(f'data/recordings/{filename}_{phase}', mac_address or 'unknown', sampling_rate, channels_selected,
+                                     fmt=out_format, device_name=_device_name, header_key=_header_key, sensor_types=current_channel_types)
+
     def animate(frame):
-        nonlocal stop, consecutive_failures, current_channel_types
+        nonlocal stop, consecutive_failures, current_channel_types, writer
         try:
-            try:
-                #response = session.get(f"http://localhost:8000/bitalino-get/?macAddress={mac_address}&samplingRate={sampling_rate}&recordingTime=1", timeout=request_timeout)
-                response = session.post("http://localhost:8000/bitalino-data/", 
-                       json={
-                           "macAddress": mac_address,
-                           "samplingRate": sampling_rate, 
-                           "recordingTime": 1.0,
-                           "channels": channels_selected if channels_selected else None
-                       })
-                response.raise_for_status()
-            except requests.exceptions.ReadTimeout:
-                record_failure(f"request timeout after {request_timeout}s")
-                return
-            except requests.exceptions.RequestException as re:
-                record_failure(f"request error: {re}")
-                return
+            if stream is not None: # blocks pushed by the server since last frame
+                if stream.error is not None:
+                    record_failure(f"stream error: {stream.error}")
+                    try:
+                        stream.restart()
+                    except Exception as e:
+                        logging.warning('Stream reconnect failed: %s', e)
+                    return
+                all_df = stream.drain()
+                if all_df is None:
+                    return
+            else:
+                try:
+                    #response = session.get(f"http://localhost:8000/bitalino-get/?macAddress={mac_address}&samplingRate={sampling_rate}&recordingTime=1", timeout=request_timeout)
+                    response = session.post("http://localhost:8000/bitalino-data/", 
+                           headers={"Accept": FRAME_ACCEPT},
+                           json={
+                               "macAddress": mac_address,
+                               "samplingRate": sampling_rate, 
+                               "recordingTime": 1.0,
+                               "channels": channels_selected if channels_selected else None,
+                               "clientId": CLIENT_ID
+                           })
+                    response.raise_for_status()
+                except requests.exceptions.ReadTimeout:
+                    record_failure(f"request timeout after {request_timeout}s")
+                    return
+                except requests.exceptions.RequestException as re:
+                    record_failure(f"request error: {re}")
+                    return
 
-            try:
-                all_df = parse_acquisition_response(response.text)
-            except ValueError as e:
-                record_failure(f"parse error: {e}; server response: {(response.text[:1000] if response is not None else '<no-response>')}" )
-                return
+                try:
+                    all_df = parse_response(response)
+                except ValueError as e:
+                    record_failure(f"parse error: {e}; server response: {(response.text[:1000] if response is not None else '<no-response>')}" )
+                    return
 
             logging.debug('Parsed data shape: %s', all_df.shape)
             logging.debug('Parsed columns: %s', list(all_df.columns))
@@ -329,6 +1042,7 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
             # for each selected channel extract data, apply transfer function and update buffers
             n_samples = None
             times = None
+            block, raw_block = {}, {} # transferred values and raw codes per channel for the recording file
             for ch_idx, ch in enumerate(available):
                 series = all_df[ch].values
                 # pick per-channel transfer function
@@ -348,8 +1062,8 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
 
                 # convert transferred NumPy array to native Python floats to avoid numpy scalar issues later
                 vals = transferred.tolist() if hasattr(transferred, 'tolist') else [float(x) for x in transferred]
-                # save per-channel data
-                all_data[ch].extend(vals)
+                block[ch] = transferred
+                raw_block[ch] = series
 
                 # update rolling buffers per-channel
                 data_buffer[ch].extend(vals)
@@ -360,7 +1074,9 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
 
             consecutive_failures = 0 # reset consecutive failures on success
 
-            all_time.extend(times)
+            if writer is None:
+                writer = open_writer()
+            writer.write(times[:n_samples], block if writer.converted else raw_block)
 
             # update common time buffer
             time_buffer.extend(times)
@@ -410,28 +1126,47 @@ def realtime_acquisition(phase: str = None, channels_env: str = None, verbose: b
             record_failure(str(e))
             return
 
+    # poll = POST /bitalino-data/ every frame, stream = blocks pushed over /bitalino-stream WebSocket
+    stream = None
+    if os.getenv('ACQUISITION_TRANSPORT', 'poll').lower() == 'stream':
+        stream = StreamClient(mac_address, sampling_rate, channels=channels_selected,
+                              chunk_ms=int(os.getenv('STREAM_CHUNK_MS', '100')), timeout=request_timeout)
+        stream.start()
+
     fig.canvas.mpl_connect('key_press_event', on_key)
     anim = animation.FuncAnimation(fig, animate, interval=200, cache_frame_data=False)
-    plt.show()
+    try:
+        plt.show()
+    finally: # also on Ctrl+C or an error, the file gets its final flush and pyramid
+        if stream is not None:
+            stream.stop()
+            if stream.gaps:
+                logging.warning('Stream had %d missing samples', stream.gaps)
 
-    filename = f'data_recording_{date_and_time}_{signal.name}'
+        if writer is not None:
+            writer.close()
 
-    # prepare df for saving: time + one column per channel
-    save_dict = {'Time (s)': all_time}
-    for ch in channels_selected:
-        save_dict[ch] = all_data.get(ch, [])
+    return filename
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert recordings between the text (.txt, .csv), binary (.bin + .bin.json) "
+                                                 "and compressed (.binz) formats, or repair one after a crash.")
+    parser.add_argument('src', help="recording to convert")
+    parser.add_argument('dst', nargs='?', default=None, help="output file, format from its extension; "
+                                                             "default src as .bin, or .txt if src is binary")
+    parser.add_argument('--raw', action='store_true', help="store uint16 codes instead of float32 (binary outputs)")
+    parser.add_argument('--codec', choices=['zlib', 'lzma'], default='zlib', help="compression for .binz outputs")
+    parser.add_argument('--recover', action='store_true', help="repair src after a crash in place (see recover_recording()), "
+                                                             "then convert it if dst is given")
+    args = parser.parse_args()
+    setup_logging()
+    if args.recover:
+        print(recover_recording(args.src, args.dst))
+        return
+    dst = args.dst or os.path.splitext(args.src)[0] + ('.txt' if args.src.lower().endswith(('.bin', '.binz')) else '.bin')
+    print(convert_recording(args.src, dst, dtype=np.uint16 if args.raw else None, codec=args.codec))
 
-    out_format = os.getenv('SAVE_FORMAT', 'tsv') # tab-separated or comma-separated
-    if out_format == 'tsv':
-        out_path = f'data/recordings/{filename}_{phase}.txt'
-        # pick device name and header key from args or environment, if any TODO: check if these are used
-        _device_name = device_name or os.getenv('DEVICE_NAME') 
-        _header_key = header_key or os.getenv('HEADER_KEY')
-        write_to_file(out_path, mac_address or 'unknown', sampling_rate, all_time, all_data, channels_selected, device_name=_device_name, header_key=_header_key, sensor_types=current_channel_types)
-    else:
-        out_df = pd.DataFrame(save_dict)
-        out_path = f'data/recordings/{filename}_{phase}.csv'
-        out_df.to_csv(out_path, index=False)
-        logging.info('Saved recording to %s', out_path)
 
-    return filename
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,20 @@ Generates signals that mimic real device output.
 """
 import numpy as np
 import time
+import math
 import logging
+import os
 
 
 class MockBITalino:
-    """Drop-in replacement for BITalino class that generates simulated data."""
-    
-    def __init__(self, macAddress=None, timeout=10):
+    """Drop-in replacement for BITalino class that generates simulated data.
+
+    Paced mode (default, MOCK_PACED=false to turn off) releases samples like a real device: read() blocks until
+    the requested samples exist at the sampling rate on a monotonic clock. Delivery can be grouped into
+    burst_ms packets like Bluetooth and each packet delayed by up to a few jitter_ms.
+    """
+
+    def __init__(self, macAddress=None, timeout=10, seed=None, paced=None, jitter_ms=None, burst_ms=None):
         self.socket = "MOCK"  # Indicate mock mode
         self.analogChannels = []
         self.number_bytes = None
@@ -19,6 +26,20 @@ class MockBITalino:
         self.mock_sample_count = 0
         self.mock_rate = 1000  # Default sampling rate
         self.started = False
+        if seed is None and os.getenv('MOCK_SEED'):  # reproducible benchmarks through the API
+            seed = int(os.getenv('MOCK_SEED'))
+        self.rng = np.random.default_rng(seed)
+        if paced is None:
+            paced = os.getenv('MOCK_PACED', 'true').lower() == 'true'
+        self.paced = paced
+        self.jitter_ms = float(os.getenv('MOCK_JITTER_MS', '0')) if jitter_ms is None else jitter_ms
+        self.burst_ms = float(os.getenv('MOCK_BURST_MS', '0')) if burst_ms is None else burst_ms
+        self._timing_rng = np.random.default_rng(None if seed is None else seed + 1)  # keep data reproducible with jitter
+        self._t0 = time.monotonic()  # acquisition start
+        self._released = 0.0  # delivery time of the last read block, packets never overtake each other
+        self._wave_table = None  # one second of the noise-free waveform per channel, see start()
+        # same link counters as BITalino (core.device.LINK_COUNTERS), the simulated link never loses frames
+        self.counters = dict.fromkeys(('frames_decoded', 'crc_failures', 'resync_bytes', 'seq_gaps', 'samples_lost'), 0)
         logging.info(f"MockBITalino initialized - simulated device at {macAddress}")
 
     def __enter__(self):
@@ -52,6 +73,10 @@ class MockBITalino:
         
         self.started = True
         self.mock_sample_count = 0
+        self._t0 = self._released = time.monotonic()
+        # all rhythms have whole-Hz frequencies, so one second of each waveform repeats exactly
+        t = np.arange(self.mock_rate) / self.mock_rate
+        self._wave_table = np.stack([self._wave_generator(ch)(t) for ch in self.analogChannels])
         logging.info(f"MockBITalino started: channels A{self.analogChannels}")
         return True
 
@@ -84,39 +109,53 @@ class MockBITalino:
         if not self.analogChannels:
             raise ValueError("Analog channels must be specified before reading.")
 
+        if self.paced:
+            self._wait_for(self.mock_sample_count + nSamples, timeout)
+
         nChannels = len(self.analogChannels)
         # Match real device format: [seq, D0, D1, D2, D3, A0, A1, ...]
-        dataAcquired = np.zeros((5 + nChannels, nSamples))
-
-        for sample_idx in range(nSamples):
-            t = self.mock_sample_count / self.mock_rate
-            self.mock_sample_count += 1
-
-            # Row 0: Sequence number (0-15)
-            dataAcquired[0, sample_idx] = self.mock_sample_count % 16
-
-            # Rows 1-4: Digital channels (D0-D3)
-            # Simulate button presses, periodic signals
-            dataAcquired[1, sample_idx] = 1 if (self.mock_sample_count % 200) < 50 else 0  # D0: periodic pulse
-            dataAcquired[2, sample_idx] = 1 if np.random.random() < 0.1 else 0  # D1: random events
-            dataAcquired[3, sample_idx] = 0  # D2: off
-            dataAcquired[4, sample_idx] = 0  # D3: off
-
-            # Rows 5+: Analog channels (A0-A5)
-            for ch_offset, ch in enumerate(self.analogChannels):
-                signal = self._generate_eeg_channel(t, ch)
-                # BITalino ADC is 10-bit: 0-1023
-                value = int(512 + signal)
-                value = max(0, min(1023, value))
-                dataAcquired[5 + ch_offset, sample_idx] = value
+        dataAcquired = np.zeros((5 + nChannels, nSamples), dtype=np.uint16)
+
+        index = self.mock_sample_count + np.arange(nSamples)  # sample numbers, time = index / rate
+        count = index + 1
+        self.mock_sample_count += nSamples
+
+        # Row 0: Sequence number (0-15)
+        dataAcquired[0] = count % 16
+
+        # Rows 1-4: Digital channels (D0-D3)
+        # Simulate button presses, periodic signals
+        dataAcquired[1] = (count % 200) < 50  # D0: periodic pulse
+        dataAcquired[2] = self.rng.random(nSamples) < 0.1  # D1: random events
+        # D2, D3: off
+
+        # Rows 5+: Analog channels (A0-A5), waveform from the table plus noise and artifacts
+        signal = self._wave_table[:, index % self.mock_rate] + self._noise((nChannels, nSamples))
+        # BITalino ADC is 10-bit: 0-1023
+        dataAcquired[5:] = np.clip(512 + signal, 0, 1023)
 
+        self.counters['frames_decoded'] += nSamples
         return dataAcquired
 
-    def _generate_eeg_channel(self, t, channel):
-        """
-        Generate realistic EEG signal for a specific channel.
-        Returns value in range roughly -100 to +100 (will be scaled to 10-bit).
-        """
+    def _wait_for(self, count, timeout):
+        """Sleep until the simulated link has delivered the first count samples since start()."""
+        due = count / self.mock_rate  # seconds after start when the last sample was sampled
+        if self.burst_ms:  # delivered with the next packet
+            period = self.burst_ms / 1000
+            due = math.ceil(due / period - 1e-9) * period
+        if self.jitter_ms:
+            due += abs(self._timing_rng.normal(0, self.jitter_ms / 1000))
+        due = max(self._t0 + due, self._released)
+        wait = due - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Timed out waiting for data")
+        self._released = due
+        if wait > 0:
+            time.sleep(wait)
+
+    def _wave_generator(self, channel):
+        """Noise-free rhythm generator for a specific channel."""
         # Different frequency patterns for each channel
         patterns = {
             0: self._alpha_wave,    # A0: Alpha (8-12 Hz)
@@ -126,20 +165,14 @@ class MockBITalino:
             4: self._mixed_wave,    # A4: Mixed
             5: self._gamma_wave,    # A5: Gamma (30-100 Hz)
         }
-        
-        generator = patterns.get(channel, self._mixed_wave)
-        signal = generator(t)
-        
-        # Add baseline noise
-        noise = np.random.normal(0, 3)
-        
-        # Occasional artifacts (eye blinks, muscle movement)
-        if np.random.random() < 0.01:  # 1% chance
-            artifact = np.random.normal(0, 50)
-        else:
-            artifact = 0
-        
-        return signal + noise + artifact
+        return patterns.get(channel, self._mixed_wave)
+
+    def _noise(self, shape):
+        """Baseline noise plus occasional artifacts (eye blinks, muscle movement) for a whole block."""
+        noise = self.rng.normal(0, 3, shape)
+        artifacts = self.rng.random(shape) < 0.01  # 1% chance
+        noise[artifacts] += self.rng.normal(0, 50, np.count_nonzero(artifacts))
+        return noise
 
     def _alpha_wave(self, t):
         """Alpha rhythm: 8-12 Hz, relaxed wakefulness."""
@@ -0,0 +1,157 @@
+"""
+One thread reading and decoding many devices: non-blocking rfcomm ttys and RFCOMM sockets multiplexed with selectors.
+"""
+import selectors
+import socket
+import threading
+import logging
+import time
+
+
+class DeviceMultiplexer:
+    """Drives read_available() of all attached devices from a single selector thread.
+
+    on_block(data) gets every decoded (5 + nChannels) x n block, on_error(e) the failure after which the device
+    was detached (read error, or no data for the device's timeout). Callbacks run on the multiplexer thread
+    and must not block, or every other device stalls with them; pause() a device instead to stop reading it.
+    """
+
+    def __init__(self, poll_interval: float = 0.1):
+        self.poll_interval = poll_interval  # max select() wait, also the resolution of timeout checks
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()  # interrupts select() when devices are (de)attached
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._devices = {}  # device -> [on_block, on_error, last data time, fd, paused until], only touched by the thread
+        self._pending = []  # (op, device, callbacks or pause timeout, done) applied by the thread
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def attach(self, device, on_block, on_error):
+        """Switch device to non-blocking reads and start decoding it on the multiplexer thread."""
+        device.set_nonblocking(True)
+        self._submit('attach', device, (on_block, on_error))
+
+    def detach(self, device):
+        """Stop reading device. Waits until the multiplexer thread let go of it, so it is safe to close afterwards."""
+        self._submit('detach', device, None, wait=threading.current_thread() is not self._thread)
+
+    def pause(self, device, timeout: float):
+        """Stop reading device (its data waits in the OS / radio buffers) until resume() or for at most timeout seconds."""
+        self._submit('pause', device, timeout)
+
+    def resume(self, device):
+        self._submit('resume', device, None)
+
+    def close(self):
+        self._stop.set()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _submit(self, op, device, callbacks, wait=False):
+        done = threading.Event()
+        with self._lock:
+            self._pending.append((op, device, callbacks, done))
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="device-multiplexer", daemon=True)
+                self._thread.start()
+        self._wake()
+        if wait:
+            done.wait(timeout=2)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass  # wake-up already pending
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._apply_pending()
+            for key, _ in self.selector.select(self.poll_interval):
+                if key.data is None:
+                    try:
+                        self._wake_r.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                self._service(key.data)
+            self._check_timeouts()
+        for device in list(self._devices):
+            self._unregister(device)
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for op, device, callbacks, done in pending:
+            if op == 'attach':
+                try:
+                    fd = device.fileno()
+                    self.selector.register(fd, selectors.EVENT_READ, device)
+                    self._devices[device] = [callbacks[0], callbacks[1], time.monotonic(), fd, None]
+                    logging.info("Multiplexer attached %s (fd %d, %d devices)", device.macAddress, fd, len(self._devices))
+                except Exception as e:
+                    callbacks[1](e)
+            elif op == 'pause':
+                entry = self._devices.get(device)
+                if entry is not None and entry[4] is None:
+                    self.selector.unregister(entry[3])
+                    entry[4] = time.monotonic() + callbacks
+            elif op == 'resume':
+                self._resume(device)
+            elif device in self._devices:
+                self._unregister(device)
+            done.set()
+
+    def _resume(self, device):
+        entry = self._devices.get(device)
+        if entry is not None and entry[4] is not None:
+            entry[4] = None
+            entry[2] = time.monotonic()  # a paused device sends nothing, don't count the pause as silence
+            self.selector.register(entry[3], selectors.EVENT_READ, device)
+
+    def _unregister(self, device):
+        entry = self._devices.pop(device, None)
+        if entry is not None:
+            try:
+                self.selector.unregister(entry[3])
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _service(self, device):
+        entry = self._devices.get(device)
+        if entry is None:
+            return
+        try:
+            data = device.read_available()
+        except Exception as e:
+            self._fail(device, e)
+            return
+        if data.shape[1]:
+            entry[2] = time.monotonic()
+            try:
+                entry[0](data)
+            except Exception:
+                logging.exception("Block handler failed for %s", device.macAddress)
+
+    def _check_timeouts(self):
+        now = time.monotonic()
+        for device, entry in list(self._devices.items()):
+            if entry[4] is not None:
+                if now >= entry[4]:
+                    self._resume(device)
+            elif now - entry[2] > device.timeout:
+                self._fail(device, TimeoutError("Timed out waiting for data"))
+
+    def _fail(self, device, e):
+        on_error = self._devices[device][1]
+        self._unregister(device)
+        try:
+            on_error(e)
+        except Exception:
+            logging.exception("Error handler failed for %s", device.macAddress)
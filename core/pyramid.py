@@ -0,0 +1,196 @@
+"""
+Multi-resolution min/max pyramid of a recording, for zoomed-out plots of long recordings.
+
+Level k holds per channel the min and max of consecutive bins of min_bin * factor ** k samples. An envelope
+of any sample range reads a single level picked by the screen width, so its cost follows the width and not
+the recording length; ranges short enough for the finest level are plotted from the samples themselves.
+Built incrementally while a recording is written (add() per block) or in one pass over a reader, and stored
+next to the recording as <file>.pyr.npz. Writers spool the finished bins of every level to <file>.pyr.<k>.part
+files instead of memory, so memory stays bounded however long they record and a crash keeps the bins written
+so far: resume() continues from them on recovery.
+"""
+import os
+import glob
+import logging
+import zipfile
+import numpy as np
+
+
+def pyramid_path(recording: str) -> str:
+    return recording + '.pyr.npz'
+
+
+def spool_path(recording: str, level: int) -> str:
+    """Finished bins of one level while recording: float32 bins x (min, max) x channels."""
+    return f'{recording}.pyr.{level}.part'
+
+
+def remove_spool(recording: str):
+    for path in glob.glob(glob.escape(recording) + '.pyr.*.part'):
+        os.remove(path)
+
+
+class MinMaxPyramid:
+    """Min/max decimation levels of a channels x samples stream, see module docstring."""
+
+    def __init__(self, n_channels: int, factor: int = 4, min_bin: int = 16, spool: str = None):
+        self.n_channels = n_channels
+        self.factor = factor
+        self.min_bin = min_bin # samples per bin of the finest level, finer ones would be as costly as raw data
+        self.spool = spool # recording whose spool_path() files take the completed bins, None keeps them in memory
+        self.n_samples = 0
+        self.levels = [] # (mins, maxs) channels x bins float32 per level, after finish()
+        self._chunks = [] # per level: list of completed (mins, maxs) bins, without spool
+        self._files = [] # per level: spool file, with spool
+        self._carry = [] # per level: inputs not yet filling a bin
+
+    def add(self, block):
+        """Append a channels x n block of samples. NaN (missing) values are ignored."""
+        block = np.asarray(block, dtype=np.float32)
+        if block.shape[1] == 0:
+            return
+        self.n_samples += block.shape[1]
+        self._feed(0, block, block)
+
+    def _store(self, level, mins, maxs):
+        """Keep completed bins of a level."""
+        if self.spool is None:
+            self._chunks[level].append((mins, maxs))
+        else:
+            self._files[level].write(np.stack([mins.T, maxs.T], axis=1).astype(np.float32).tobytes())
+
+    def _feed(self, level, mins, maxs):
+        if level == len(self._carry):
+            self._chunks.append([])
+            self._carry.append(None)
+            if self.spool is not None:
+                self._files.append(open(spool_path(self.spool, level), 'wb'))
+        if self._carry[level] is not None:
+            mins = np.concatenate([self._carry[level][0], mins], axis=1)
+            maxs = np.concatenate([self._carry[level][1], maxs], axis=1)
+        size = self.min_bin if level == 0 else self.factor
+        full = mins.shape[1] - mins.shape[1] % size
+        self._carry[level] = (mins[:, full:].copy(), maxs[:, full:].copy()) if full < mins.shape[1] else None
+        if full:
+            bin_mins = np.fmin.reduce(mins[:, :full].reshape(self.n_channels, -1, size), axis=2)
+            bin_maxs = np.fmax.reduce(maxs[:, :full].reshape(self.n_channels, -1, size), axis=2)
+            self._store(level, bin_mins, bin_maxs)
+            self._feed(level + 1, bin_mins, bin_maxs)
+
+    def flush(self, sync: bool = False):
+        """Hand spooled bins to the OS, and to disk with sync. Called by the recording writers as they flush."""
+        for fh in self._files:
+            fh.flush()
+            if sync:
+                os.fsync(fh.fileno())
+
+    def finish(self):
+        """Close the last partial bin of every level and join the levels. Call once, after the last add()."""
+        level = 0
+        while level < len(self._carry):
+            if self._carry[level] is not None:
+                carry_mins, carry_maxs = self._carry[level]
+                self._carry[level] = None
+                bin_mins = np.fmin.reduce(carry_mins, axis=1, keepdims=True)
+                bin_maxs = np.fmax.reduce(carry_maxs, axis=1, keepdims=True)
+                self._store(level, bin_mins, bin_maxs)
+                if level + 1 < len(self._carry): # partial bin belongs to the last bin above too
+                    self._feed(level + 1, bin_mins, bin_maxs)
+            level += 1
+        if self.spool is None:
+            self.levels = [(np.concatenate([c[0] for c in chunks], axis=1), np.concatenate([c[1] for c in chunks], axis=1))
+                           for chunks in self._chunks if chunks]
+        else: # memory mapped, save() copies them in chunks
+            self.levels = []
+            for level, fh in enumerate(self._files):
+                fh.close()
+                bins = os.path.getsize(fh.name) // (8 * self.n_channels)
+                if bins:
+                    spooled = np.memmap(fh.name, dtype=np.float32, mode='r', shape=(bins, 2, self.n_channels))
+                    self.levels.append((spooled[:, 0].T, spooled[:, 1].T))
+        self._chunks, self._files, self._carry = [], [], []
+        return self
+
+    def bin_size(self, level: int) -> int:
+        return self.min_bin * self.factor ** level
+
+    def envelope(self, start: int, end: int, width: int):
+        """Min/max envelope of samples [start, end) with width to factor * width bins.
+
+        Returns (positions, mins, maxs): first sample index of every bin and channels x bins arrays, or
+        None if the range has fewer than min_bin * width samples and is better plotted as is.
+        """
+        level = None
+        for k in range(len(self.levels)):
+            if (end - start) / self.bin_size(k) < width:
+                break
+            level = k
+        if level is None:
+            return None
+        size = self.bin_size(level)
+        mins, maxs = self.levels[level]
+        first, last = max(0, start // size), min(mins.shape[1], -(-end // size))
+        return np.arange(first, last) * size, mins[:, first:last], maxs[:, first:last]
+
+    def save(self, path: str, recording: str = None):
+        """Store as .npz, tagged with size and mtime of the recording file so stale pyramids are rebuilt."""
+        stat = os.stat(recording) if recording else None
+        arrays = {}
+        for k, (mins, maxs) in enumerate(self.levels):
+            arrays[f'min_{k}'], arrays[f'max_{k}'] = mins, maxs
+        np.savez(path, factor=self.factor, min_bin=self.min_bin, n_channels=self.n_channels, n_samples=self.n_samples,
+                 size=stat.st_size if stat else -1, mtime_ns=stat.st_mtime_ns if stat else -1, **arrays)
+
+    def save_for(self, recording: str):
+        """finish() and save next to a just written recording, then drop its spool files (and the levels of a
+        spooled pyramid, load() them to use). Errors are logged, the recording stays valid.
+        """
+        try:
+            self.finish().save(pyramid_path(recording), recording)
+            if self.spool is not None:
+                self.levels = []
+            remove_spool(recording)
+        except Exception:
+            logging.exception("Could not save min/max pyramid for %s", recording)
+
+    @classmethod
+    def resume(cls, recording: str, n_channels: int, n_samples: int, factor: int = 4, min_bin: int = 16):
+        """Pyramid of the first samples of an interrupted recording, from the finest bins its writer spooled
+        (at most n_samples, the recording's length). Continue with add() from pyramid.n_samples; None if
+        nothing was spooled.
+        """
+        try:
+            size = os.path.getsize(spool_path(recording, 0))
+        except OSError:
+            return None
+        bins = min(size // (8 * n_channels), n_samples // min_bin)
+        if bins == 0:
+            return None
+        pyramid = cls(n_channels, factor, min_bin)
+        spooled = np.fromfile(spool_path(recording, 0), dtype=np.float32, count=bins * 2 * n_channels)
+        spooled = spooled.reshape(bins, 2, n_channels)
+        pyramid._chunks.append([])
+        pyramid._carry.append(None)
+        pyramid._store(0, spooled[:, 0].T, spooled[:, 1].T)
+        pyramid._feed(1, spooled[:, 0].T, spooled[:, 1].T) # levels above are rebuilt from the finest one
+        pyramid.n_samples = bins * min_bin
+        return pyramid
+
+    @classmethod
+    def load(cls, path: str, recording: str = None):
+        """Load a saved pyramid, None if missing or older than the recording it belongs to."""
+        try:
+            with np.load(path) as f:
+                if recording is not None:
+                    stat = os.stat(recording)
+                    if int(f['size']) != stat.st_size or int(f['mtime_ns']) != stat.st_mtime_ns:
+                        return None
+                pyramid = cls(int(f['n_channels']), int(f['factor']), int(f['min_bin']))
+                pyramid.n_samples = int(f['n_samples'])
+                k = 0
+                while f'min_{k}' in f.files:
+                    pyramid.levels.append((f[f'min_{k}'], f[f'max_{k}']))
+                    k += 1
+                return pyramid
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
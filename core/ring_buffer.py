@@ -0,0 +1,82 @@
+"""
+Fixed-size preallocated sample ring buffer shared between one acquisition thread (writer) and any number of readers.
+"""
+import numpy as np
+
+
+class RingBuffer:
+    """Ring of (rows x capacity) samples addressed by absolute sample index.
+
+    head is the index one past the newest sample, tail the oldest sample still held. The writer
+    never waits for readers. Readers copy only the slice they ask for and then check if the writer
+    lapped them meanwhile, dropping the overwritten part instead of returning torn data.
+    """
+
+    def __init__(self, rows, capacity, dtype=np.uint16):
+        self.rows = rows
+        self.capacity = int(capacity)
+        self.data = np.zeros((rows, self.capacity), dtype=dtype)
+        self.head = 0        # published: samples [tail, head) are valid
+        self._reserved = 0   # writer bumps this before touching slots, readers check against it
+        self.overruns = 0    # samples overwritten before a reader got them
+
+    @property
+    def tail(self):
+        return max(0, self.head - self.capacity)
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def write(self, block):
+        """Append (rows x n) block. Only one thread may write."""
+        block = np.asarray(block)
+        n = block.shape[1]
+        if n == 0:
+            return
+        start = self.head
+        if n > self.capacity:  # only the newest samples fit
+            start += n - self.capacity
+            block = block[:, -self.capacity:]
+            n = self.capacity
+        self._reserved = start + n
+        i0 = start % self.capacity
+        first = min(n, self.capacity - i0)
+        self.data[:, i0:i0 + first] = block[:, :first]
+        if first < n:
+            self.data[:, :n - first] = block[:, first:]
+        self.head = start + n
+
+    def read(self, start, n, rows=None):
+        """Copy up to n samples starting at absolute index start, only the given rows if rows is set.
+
+        Returns (block, start) where start moved forward if part of the range was already overwritten.
+        """
+        head = self.head
+        tail = max(0, head - self.capacity)
+        if start < tail:
+            self.overruns += tail - start
+            start = tail
+        end = min(start + n, head)
+        k = max(0, end - start)
+        rows = slice(None) if rows is None else list(rows)
+        n_rows = self.rows if isinstance(rows, slice) else len(rows)
+        out = np.empty((n_rows, k), dtype=self.data.dtype)
+        i0 = start % self.capacity
+        first = min(k, self.capacity - i0)
+        out[:, :first] = self.data[rows, i0:i0 + first]
+        if first < k:
+            out[:, first:] = self.data[rows, :k - first]
+        # writer may have overwritten the front of our range while copying
+        lapped = self._reserved - self.capacity - start
+        if lapped > 0:
+            lapped = min(lapped, k)
+            self.overruns += lapped
+            out = out[:, lapped:]
+            start += lapped
+        return out, start
+
+    def latest(self, n):
+        """Copy of the newest n samples (fewer if the buffer holds less)."""
+        head = self.head
+        block, _ = self.read(max(self.tail, head - n), n)
+        return block
@@ -0,0 +1,485 @@
+"""
+Persistent device sessions: keep one open, started BITalino per MAC/port between API requests.
+The stream is decoded continuously into a RingBuffer, by a shared DeviceMultiplexer thread for devices
+with a file descriptor, or by a reader thread per session (e.g. MockBITalino).
+"""
+import threading
+import concurrent.futures
+import logging
+import time
+import numpy as np
+from .ring_buffer import RingBuffer
+from .multiplexer import DeviceMultiplexer
+
+
+def is_transient(e) -> bool:
+    """EIO (errno 5), EAGAIN and other socket errors without errno, or timeouts: worth a reconnect."""
+    return isinstance(e, OSError) and getattr(e, 'errno', None) in (5, 11, None) or isinstance(e, TimeoutError)
+
+
+class Subscriber:
+    """Independent consumer of a session stream: own cursor, channel rows and backpressure policy.
+
+    policy 'drop-oldest': a slow subscriber skips samples the ring buffer already overwrote.
+    policy 'block': reading the device pauses (up to session.block_timeout) before overwriting unread samples,
+    the reader thread waits or the multiplexer stops polling this device only.
+    """
+    POLICIES = ('drop-oldest', 'block')
+
+    def __init__(self, session, name, rows=None, policy='drop-oldest'):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid backpressure policy {policy}, use one of {self.POLICIES}")
+        self.session = session
+        self.name = name
+        self.rows = rows  # row indices of the session data to deliver, None for all
+        self.policy = policy
+        self.cursor = session.buffer.head if session.buffer is not None else 0
+        self.delivered = 0  # samples handed out
+        self.dropped = 0    # samples lost to ring buffer overrun
+        self.last_read = time.monotonic()
+
+    @property
+    def available(self):
+        """Samples buffered and not yet read."""
+        buffer = self.session.buffer
+        return 0 if buffer is None else buffer.head - self.cursor
+
+    def take(self, max_samples):
+        """Non-blocking: return (data, first_sample) with up to max_samples buffered samples."""
+        data, start = self.session.buffer.read(self.cursor, max_samples, rows=self.rows)
+        if start > self.cursor:
+            self.dropped += start - self.cursor
+            logging.warning("Ring buffer overrun for %s subscriber %s: %d samples lost", self.session.macAddress, self.name, start - self.cursor)
+        self.cursor = start + data.shape[1]
+        self.delivered += data.shape[1]
+        self.last_read = self.session.last_used = time.monotonic()
+        if self.policy == 'block':
+            with self.session.space_ready:
+                self.session.space_ready.notify_all()
+            self.session._resume_staged()
+        return data, start
+
+    def read(self, nSamples, timeout: float = 10):
+        """Blocking: wait until nSamples are buffered, then take them. Raises reader failure or TimeoutError
+        if no new samples arrived for timeout seconds, so reads longer than timeout still complete.
+        """
+        session = self.session
+        deadline = time.monotonic() + timeout
+        available = self.available
+        with session.data_ready:
+            while self.available < nSamples and session.error is None:
+                if self.available != available: # stream is alive, restart the inactivity timeout
+                    available = self.available
+                    deadline = time.monotonic() + timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for data")
+                session.data_ready.wait(remaining)
+        if session.error is not None:
+            raise session.error
+        return self.take(nSamples)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "policy": self.policy,
+            "cursor": self.cursor,
+            "lag": self.available,  # samples behind the newest sample
+            "lag_seconds": self.available / self.session.samplingRate,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "idle_seconds": time.monotonic() - self.last_read,
+        }
+
+
+class DeviceSession:
+    """One open and started device with a reader thread filling a ring buffer.
+    Reads continue the same acquisition stream, so no samples are lost between requests.
+    """
+
+    def __init__(self, device_class, macAddress, samplingRate, timeout=10, max_attempts=3,
+                 buffer_seconds: float = 60, block_ms: int = 50, block_timeout: float = 1.0, multiplexer=None,
+                 arrival_seconds: float = 60, arrival_interval: float = 0.02):
+        self.device_class = device_class
+        self.macAddress = macAddress
+        self.samplingRate = samplingRate
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.buffer_seconds = buffer_seconds
+        self.block_size = max(1, samplingRate * block_ms // 1000)  # samples per device read in reader thread
+        self.device = None
+        self.buffer = None
+        self.block_timeout = block_timeout  # max wait of reader thread for 'block' subscribers per write
+        self.subscribers: dict[str, Subscriber] = {}
+        self.default = None  # shared subscriber behind read()
+        self.error = None  # final reader failure, raised to the next reader
+        self.lock = threading.RLock()  # serialize open/close and read() callers, never taken by the reader thread
+        self.data_ready = threading.Condition()
+        self.space_ready = threading.Condition()
+        self.last_used = time.monotonic()
+        self.reconnects = 0
+        self.arrivals = None  # RingBuffer of [head, receive time, samples lost so far] records of stored blocks, see core.sync
+        self.arrival_seconds = arrival_seconds  # time span the arrivals hold, at least the drift fit window of core.sync
+        self.arrival_interval = arrival_interval  # min. time between records, blocks in between are merged
+        self._arrival_time = float('-inf')  # receive time of the last record written
+        self._held_arrival = None  # least delayed block since then
+        self.segment_start = 0  # head when the device was last (re)connected, the stream restarts there
+        self.multiplexer = multiplexer  # DeviceMultiplexer reading this device, None for a reader thread
+        self.executor = None  # worker thread for blocking calls from async code (api.server), see worker()
+        self._attached = None  # device currently attached to the multiplexer
+        self._staged = None  # (block, receive time) held back for 'block' subscribers while the device is paused
+        self._attach_lock = threading.Lock()
+        self._executor_lock = threading.Lock()
+        self._closed_counters = {}  # link counters of device connections closed so far
+        self._reader = None
+        self._stop = threading.Event()
+
+    @property
+    def is_open(self):
+        return self._attached is not None or self._reader is not None and self._reader.is_alive()
+
+    def _open_device(self):
+        device = self.device_class(macAddress=self.macAddress, timeout=self.timeout)
+        device.open(macAddress=self.macAddress, SamplingRate=self.samplingRate)
+        try:
+            device.start()
+        except Exception:
+            device.close()
+            raise
+        return device
+
+    def _close_device(self, device):
+        for key, value in getattr(device, 'counters', {}).items():
+            self._closed_counters[key] = self._closed_counters.get(key, 0) + value
+        try:
+            device.stop()
+        except Exception:
+            pass
+        try:
+            device.close()
+        except Exception:
+            pass
+
+    def open(self):
+        """Open and start the device and reader thread if not already running."""
+        with self.lock:
+            if self.is_open:
+                return
+            self.error = None
+            try:
+                self.device = self._open_device()
+            except Exception:
+                self._shutdown_executor()  # no worker left behind for a device that doesn't open
+                raise
+            rows = 5 + len(self.device.analogChannels)
+            if self.buffer is None or self.buffer.rows != rows:
+                self.buffer = RingBuffer(rows, self.samplingRate * self.buffer_seconds)
+                self.arrivals = RingBuffer(3, 2 * int(self.arrival_seconds / self.arrival_interval), dtype=np.float64)
+            self.segment_start = self.buffer.head
+            self._arrival_time, self._held_arrival = float('-inf'), None
+            self._staged = None
+            for sub in self.subscribers.values():
+                sub.cursor = self.buffer.head  # skip samples left from before an idle close or failure
+            if self.default is None:
+                self.default = self.subscribe('default')
+            self._stop.clear()
+            if self.multiplexer is not None and hasattr(self.device, 'fileno'):
+                self._attach(self.device)
+            else:
+                self._reader = threading.Thread(target=self._run, name=f"reader-{self.macAddress}", daemon=True)
+                self._reader.start()
+            logging.info("Session opened for %s @ %s Hz", self.macAddress, self.samplingRate)
+
+    def worker(self):
+        """Single worker thread for blocking calls on this device (open, close) from async code, created on demand
+        and shut down again by close() or a failed open()."""
+        with self._executor_lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"device-{self.macAddress}")
+            return self.executor
+
+    def _shutdown_executor(self):
+        with self._executor_lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)  # may be running this call, queued calls still finish
+
+    def close(self):
+        with self.lock:
+            self._shutdown_executor()
+            reader, self._reader = self._reader, None
+            self._stop.set()
+            with self._attach_lock:
+                attached, self._attached = self._attached, None
+            if attached is not None:
+                self.multiplexer.detach(attached)
+            if reader is not None:
+                reader.join(timeout=self.timeout + 1)
+            if self.device is not None:
+                self._close_device(self.device)
+                self.device = None
+                logging.info("Session closed for %s", self.macAddress)
+
+    def _run(self):
+        """Reader thread: read blocks from device into the ring buffer, reconnect on transient errors."""
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                if self.device is None:
+                    self.device = self._open_device()
+                    self.reconnects += 1
+                    self.segment_start = self.buffer.head
+                data = self.device.read(nSamples=self.block_size, timeout=self.timeout)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                failures += 1
+                logging.warning("Reader for %s failed on attempt %d/%d: %s (errno=%s)", self.macAddress, failures, self.max_attempts, repr(e), getattr(e, 'errno', None))
+                # stream state is unknown after an error, drop the connection either way
+                if self.device is not None:
+                    self._close_device(self.device)
+                    self.device = None
+                if failures < self.max_attempts and is_transient(e):
+                    logging.info("Reconnecting %s after short backoff...", self.macAddress)
+                    self._stop.wait(0.2 * failures)
+                    continue
+                self.error = e
+                with self.data_ready:
+                    self.data_ready.notify_all()
+                break
+            failures = 0
+            self._wait_for_space(data.shape[1])
+            self._store(data)
+
+    def _attach(self, device):
+        with self._attach_lock:
+            if self._stop.is_set():
+                return False
+            self._attached = device
+        self.multiplexer.attach(device, self._on_block, self._on_error)
+        return True
+
+    def _on_block(self, data):
+        """Multiplexer thread: store a decoded block. Never waits for 'block' subscribers, that would stall every
+        device: a block without space is staged and only this device is paused, until a 'block' subscriber
+        catches up (_resume_staged()) or block_timeout passes. The staged block is stored with the next one.
+        """
+        if self._staged is not None:
+            staged, self._staged = self._staged, None
+            self._store(*staged)  # space was freed, or block_timeout passed: overwrite anyway
+        if self._has_space(data.shape[1]):
+            self._store(data)
+            return
+        self.multiplexer.pause(self._attached, self.block_timeout)  # queued before _staged is visible to readers
+        self._staged = (data, time.monotonic())
+
+    def _resume_staged(self):
+        """After a 'block' subscriber read: continue a paused device once its staged block fits."""
+        staged, attached = self._staged, self._attached
+        if staged is not None and attached is not None and self._has_space(staged[0].shape[1]):
+            self.multiplexer.resume(attached)
+
+    def _store(self, data, received=None):
+        """Append a block to the ring buffer, note when it arrived and wake readers."""
+        self.buffer.write(data)
+        lost = self._closed_counters.get('samples_lost', 0) + getattr(self.device, 'counters', {}).get('samples_lost', 0)
+        self._note_arrival(self.buffer.head, time.monotonic() if received is None else received, lost)
+        with self.data_ready:
+            self.data_ready.notify_all()
+
+    def _on_error(self, e):
+        """Multiplexer thread: device failed and was detached, reconnect from a helper thread."""
+        with self._attach_lock:
+            if self._stop.is_set() or self._attached is None:
+                return
+            self._attached = None
+            self._reader = threading.Thread(target=self._recover, args=(e,), name=f"recover-{self.macAddress}", daemon=True)
+            self._reader.start()
+
+    def _recover(self, error):
+        """Reconnect a multiplexed device after a failure and attach it again, giving up like _run()."""
+        failures = 0
+        while not self._stop.is_set():
+            failures += 1
+            logging.warning("Reader for %s failed on attempt %d/%d: %s (errno=%s)", self.macAddress, failures, self.max_attempts, repr(error), getattr(error, 'errno', None))
+            if self.device is not None:
+                self._close_device(self.device)
+                self.device = None
+            if failures >= self.max_attempts or not is_transient(error):
+                self.error = error
+                with self.data_ready:
+                    self.data_ready.notify_all()
+                return
+            logging.info("Reconnecting %s after short backoff...", self.macAddress)
+            self._stop.wait(0.2 * failures)
+            try:
+                self.device = self._open_device()
+                self.reconnects += 1
+                self.segment_start = self.buffer.head
+            except Exception as e:
+                error = e
+                continue
+            if self._attach(self.device):
+                return
+
+    def _has_space(self, n):
+        """True if writing n samples won't overwrite data unread by 'block' subscribers."""
+        blocking = [sub.cursor for sub in list(self.subscribers.values()) if sub.policy == 'block']
+        return not blocking or min(blocking) >= self.buffer.head + n - self.buffer.capacity
+
+    def _note_arrival(self, head, received, lost):
+        """Add an arrivals record, at most one per arrival_interval plus one for the least delayed block arriving in
+        between: the lower envelope core.sync fits survives, and the ring spans arrival_seconds however small the reads.
+        """
+        record = np.array([[head], [received], [lost]], dtype=np.float64)
+        if received - self._arrival_time < self.arrival_interval:
+            held = self._held_arrival
+            if held is None or received - (head + lost) / self.samplingRate < held[1, 0] - (held[0, 0] + held[2, 0]) / self.samplingRate:
+                self._held_arrival = record
+            return
+        if self._held_arrival is not None:
+            self.arrivals.write(self._held_arrival)
+            self._held_arrival = None
+        self.arrivals.write(record)
+        self._arrival_time = received
+
+    def _wait_for_space(self, n):
+        """Backpressure for 'block' subscribers: wait (bounded) until writing n samples won't overwrite their unread data."""
+        deadline = time.monotonic() + self.block_timeout
+        with self.space_ready:
+            while True:
+                if self._has_space(n):
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    return  # device can't be paused, overwrite anyway
+                self.space_ready.wait(remaining)
+
+    def subscribe(self, name=None, rows=None, policy='drop-oldest') -> Subscriber:
+        """Return subscriber called name, creating it at the newest sample if it doesn't exist."""
+        with self.lock:
+            name = name or f"sub-{len(self.subscribers) + 1}"
+            sub = self.subscribers.get(name)
+            if sub is None:
+                sub = self.subscribers[name] = Subscriber(self, name, rows=rows, policy=policy)
+            return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            if self.subscribers.get(sub.name) is sub:
+                del self.subscribers[sub.name]
+        with self.space_ready:
+            self.space_ready.notify_all()
+        self._resume_staged()
+
+    def read(self, nSamples, timeout: float = 10):
+        """Return next nSamples of the stream after the previous read(), waiting for the reader if needed."""
+        data, _ = self.read_block(nSamples, timeout)
+        return data
+
+    def read_block(self, nSamples, timeout: float = 10):
+        """Like read(), but returns (data, first_sample) with the absolute index of the first sample."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            self.open()
+            try:
+                return self.default.read(nSamples, timeout)
+            except TimeoutError:
+                raise
+            except Exception:
+                self.error = None
+                self.close()
+                raise
+
+    def link_counters(self) -> dict:
+        """Device link counters (frames decoded, CRC failures, resync bytes, sequence gaps, samples lost) summed over reconnects."""
+        counters = dict(self._closed_counters)
+        device = self.device
+        for key, value in getattr(device, 'counters', {}).items():
+            counters[key] = counters.get(key, 0) + value
+        return counters
+
+    def stats(self) -> dict:
+        buffer = self.buffer
+        return {
+            "macAddress": self.macAddress,
+            "samplingRate": self.samplingRate,
+            "open": self.is_open,
+            "head": buffer.head if buffer is not None else 0,
+            "tail": buffer.tail if buffer is not None else 0,
+            "overruns": buffer.overruns if buffer is not None else 0,
+            "reconnects": self.reconnects,
+            "link": self.link_counters(),
+            "subscribers": [sub.stats() for sub in list(self.subscribers.values())],
+        }
+
+
+class SessionManager:
+    """Keeps DeviceSessions per MAC/port and tears them down after idle_timeout seconds without requests.
+    io_mode 'select' reads all devices on one DeviceMultiplexer thread, 'thread' gives each session its own reader.
+    """
+
+    def __init__(self, idle_timeout: float = 30.0, buffer_seconds: float = 60, io_mode: str = 'select'):
+        self.idle_timeout = idle_timeout
+        self.buffer_seconds = buffer_seconds
+        self.multiplexer = DeviceMultiplexer() if io_mode == 'select' else None
+        self.sessions: dict[str, DeviceSession] = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def get(self, device_class, macAddress, samplingRate, timeout=10) -> DeviceSession:
+        """Return the session for macAddress, replacing it if device class or sampling rate changed."""
+        with self._lock:
+            session = self.sessions.get(macAddress)
+            if session is not None and (session.device_class is not device_class or session.samplingRate != samplingRate):
+                logging.info("Session config changed for %s, restarting", macAddress)
+                session.close()
+                session = None
+            if session is None:
+                session = DeviceSession(device_class, macAddress, samplingRate, timeout=timeout,
+                                        buffer_seconds=self.buffer_seconds, multiplexer=self.multiplexer)
+                self.sessions[macAddress] = session
+            session.last_used = time.monotonic()
+        self.start_reaper()
+        return session
+
+    def reap_idle(self):
+        """Close devices of sessions not used for idle_timeout seconds. The session object stays, next read reopens it."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [s for s in self.sessions.values() if s.is_open and now - s.last_used > self.idle_timeout]
+        for session in idle:
+            with session.lock:
+                if time.monotonic() - session.last_used > self.idle_timeout:  # not picked up meanwhile
+                    logging.info("Closing idle session for %s", session.macAddress)
+                    session.close()
+        # forget polling subscribers that stopped reading
+        for session in list(self.sessions.values()):
+            for sub in list(session.subscribers.values()):
+                if sub is not session.default and now - sub.last_read > self.idle_timeout:
+                    logging.info("Removing idle subscriber %s of %s", sub.name, session.macAddress)
+                    session.unsubscribe(sub)
+
+    def start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._stop.clear()
+        def loop():
+            while not self._stop.wait(max(1.0, self.idle_timeout / 4)):
+                try:
+                    self.reap_idle()
+                except Exception:
+                    logging.exception("Idle session reaper failed")
+        self._reaper = threading.Thread(target=loop, name="session-reaper", daemon=True)
+        self._reaper.start()
+
+    def close_all(self):
+        self._stop.set()
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+        if self.multiplexer is not None:
+            self.multiplexer.close()
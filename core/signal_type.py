@@ -47,3 +47,15 @@ signal_types = {
     'eda': SignalType('eda', 'μS', (0, 100), 4, transfer_function=eda_transfer),
     'None': SignalType('raw', None, (-45, 45), 100, None)
 }
+
+# sensor string of a channel (header 'sensor' list, channel type combo) -> transfer function for its ADC codes
+SENSOR_TRANSFER = {
+    'RAW': lambda x: x,
+    'BTN': lambda x: x,
+    'EDABIT': lambda x: x,
+    'ECGBIT': ecg_transfer,
+    'EEGBIT': eeg_transfer,
+    'EMGBIT': emg_transfer,
+    'ACCBIT': acc_transfer,
+    'ACCBITREV': acc_transfer,
+}
@@ -0,0 +1,169 @@
+"""
+Synchronized multi-device acquisition: several device sessions merged onto one common timeline.
+
+Stored blocks are stamped with their host receive time (DeviceSession.arrivals, at most about one record per
+20 ms and always the least delayed block, covering the last minute). Per device a linear fit of receive
+time over sample count (corrected for samples lost in sequence number gaps) gives its clock drift; the lower
+envelope of the receive times gives the offset, so radio latency spikes don't shift the stream. Output sample k
+is at t0 + k / samplingRate, each device contributes its sample nearest to that time.
+"""
+import os
+import threading
+import logging
+import time
+from datetime import datetime
+import numpy as np
+from .file_io import open_recording_writer
+
+COLUMN_NAMES = ['seqN', 'D0', 'D1', 'D2', 'D3', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6']  # rows of a device session
+
+
+def fit_clock(x, t, rate, min_span: float = 2.0):
+    """Fit receive times t of sample counts x as t = offset + x * period. Returns (offset, period).
+    Uses the nominal period until min_span seconds of arrivals allow estimating drift.
+    """
+    period = 1.0 / rate
+    if len(x) >= 8 and t[-1] - t[0] >= min_span:
+        period = np.polyfit(x - x[0], t - t[0], 1)[0]
+    offset = float(np.min(t - x * period))  # lower envelope: the least delayed block
+    return offset, period
+
+
+class SyncSession:
+    """Starts several DeviceSessions together and merges their streams into time-aligned blocks."""
+
+    def __init__(self, sessions, samplingRate, labels=None, fit_seconds: float = 30):
+        self.sessions = list(sessions)
+        self.samplingRate = samplingRate  # rate of the common timeline
+        self.labels = labels or [s.macAddress for s in self.sessions]
+        self.fit_seconds = fit_seconds  # arrivals window for the drift fit
+        self.t0 = None
+        self.clocks = [None] * len(self.sessions)  # latest (offset, period) per device
+        self.path = None
+        self._recorder = None
+        self._stop = threading.Event()
+
+    @property
+    def columns(self):
+        return [f"{label}:{name}" for label, session in zip(self.labels, self.sessions)
+                for name in COLUMN_NAMES[:session.buffer.rows]]
+
+    def start(self):
+        """Open all device sessions at the same time (one thread each) and fix the common time origin."""
+        errors = []
+        def open_session(session):
+            try:
+                session.open()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=open_session, args=(s,)) for s in self.sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        self.t0 = time.monotonic()
+        logging.info("Synchronized session started for %s", ", ".join(self.labels))
+
+    def _fit(self, i):
+        """Clock fit and lost-sample table of device i over its recent arrivals, None before the first block."""
+        session = self.sessions[i]
+        session.last_used = time.monotonic()  # keep devices from being reaped as idle
+        arrivals = session.arrivals.latest(session.arrivals.capacity)
+        if arrivals.shape[1] == 0:
+            return None
+        head, received, lost = arrivals
+        keep = (head > session.segment_start) & (received >= received[-1] - self.fit_seconds)
+        if not keep.any():
+            return None
+        head, received, lost = head[keep], received[keep], lost[keep]
+        x = head + lost  # samples the device actually took, including those lost on the link
+        offset, period = fit_clock(x, received, session.samplingRate)
+        self.clocks[i] = (offset, period)
+        return offset, period, x, lost
+
+    def drift_ppm(self) -> dict:
+        """Estimated clock drift of each device relative to the host clock, parts per million."""
+        return {label: None if clock is None else float((clock[1] * session.samplingRate - 1) * 1e6)
+                for label, session, clock in zip(self.labels, self.sessions, self.clocks)}
+
+    def read(self, cursor=None, maxSamples=None):
+        """Merged block of timeline samples [cursor, cursor + maxSamples) that every device already covers.
+
+        Returns (data, first_sample): data stacks the rows of all devices (see columns) as uint16, sample k
+        is at k / samplingRate seconds after start. Without cursor reading starts at the newest common sample.
+        """
+        fits = [self._fit(i) for i in range(len(self.sessions))]
+        rows = sum(s.buffer.rows for s in self.sessions)
+        if any(fit is None for fit in fits):
+            return np.zeros((rows, 0), dtype=np.uint16), cursor or 0
+        # newest time every device has a sample for
+        covered = min(offset + x[-1] * period for offset, period, x, _ in fits)
+        end = int(np.floor((covered - self.t0) * self.samplingRate))
+        if cursor is None:
+            cursor = end
+        cursor = max(cursor, 0)
+        n = max(0, min(end, cursor + (maxSamples or self.samplingRate * 5)) - cursor)
+        t = self.t0 + (cursor + np.arange(n)) / self.samplingRate
+
+        out = np.empty((rows, n), dtype=np.uint16)
+        r = 0
+        for session, (offset, period, x, lost) in zip(self.sessions, fits):
+            buffer = session.buffer
+            true_index = np.rint((t - offset) / period) - 1  # sample i was taken at offset + (i + 1) * period
+            index = (true_index - np.interp(true_index, x, lost)).astype(np.int64)
+            index = np.clip(index, max(session.segment_start, buffer.tail), buffer.head - 1)
+            if n:
+                block, start = buffer.read(int(index[0]), int(index[-1] - index[0]) + 1)
+                out[r:r + buffer.rows] = block[:, np.clip(index - start, 0, block.shape[1] - 1)]
+            r += buffer.rows
+        return out, cursor
+
+    def record(self, path=None):
+        """Append merged blocks to one tab-separated text file (core.file_io.RecordingWriter, flushed and fsynced
+        like single-device recordings) from a background thread."""
+        self.path = path or f"data/recordings/sync_recording_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.txt"
+        columns = self.columns
+        meta = {
+            "sync": {
+                "devices": self.labels,
+                "sampling rate": self.samplingRate,
+                "date": datetime.now().strftime("%Y-%m-%d"),
+                "time": datetime.now().strftime("%H:%M:%S.%f")[:-3],
+                "label": columns,
+                "column": ["Time"] + columns,
+            }
+        }
+        writer = open_recording_writer(os.path.splitext(self.path)[0], '+'.join(self.labels), self.samplingRate, columns,
+                                       fmt='tsv', header=meta)
+        self.path = writer.path
+        self._stop.clear()
+        self._recorder = threading.Thread(target=self._record, args=(writer,), name="sync-recorder", daemon=True)
+        self._recorder.start()
+        return self.path
+
+    def _record(self, writer):
+        cursor = 0
+        try:
+            while True:
+                stopping = self._stop.wait(0.2)
+                data, first = self.read(cursor, self.samplingRate * 5)
+                if data.shape[1]:
+                    times = (first + np.arange(data.shape[1])) / self.samplingRate
+                    writer.write(times, data)
+                    cursor = first + data.shape[1]
+                if stopping:
+                    break
+        except Exception:
+            logging.exception("Synchronized recording to %s failed", self.path)
+        finally:
+            writer.close()
+            logging.info("Synchronized recording saved to %s", self.path)
+
+    def stop(self):
+        """Stop recording. The device sessions stay open for other clients."""
+        self._stop.set()
+        if self._recorder is not None:
+            self._recorder.join(timeout=5)
+            self._recorder = None
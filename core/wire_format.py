@@ -0,0 +1,46 @@
+"""
+Compact binary wire format for acquisition responses (application/x-bitalino-frame).
+
+Layout: b'BITF' | uint32 LE header length | JSON header | raw sample buffer.
+Header: {"columns", "dtype", "shape": [n_samples, n_columns], "channel_types", "first_sample", ...}.
+Samples are little-endian uint16, samples × channels in row-major order (same orientation as the JSON "data" field).
+"""
+import json
+import struct
+import numpy as np
+
+MEDIA_TYPE = 'application/x-bitalino-frame'
+MAGIC = b'BITF'
+DTYPE = '<u2'
+
+
+def accepts_frame(accept: str | None) -> bool:
+    """True if an Accept header asks for the binary format."""
+    return bool(accept) and MEDIA_TYPE in accept
+
+
+def encode_frame(data, columns, channel_types=None, first_sample=None, **extra) -> bytes:
+    """Encode (channels x samples) matrix as header + raw uint16 buffer."""
+    samples = np.ascontiguousarray(np.asarray(data).T, dtype=DTYPE)
+    header = {
+        "columns": list(columns),
+        "dtype": DTYPE,
+        "shape": list(samples.shape),
+        "channel_types": channel_types or {},
+        "first_sample": first_sample,
+        **extra,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    return MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes + samples.tobytes()
+
+
+def decode_frame(buf):
+    """Decode frame bytes. Returns (samples x channels array viewing buf without copy, header dict)."""
+    buf = memoryview(buf)
+    if bytes(buf[:4]) != MAGIC:
+        raise ValueError("Not a BITalino frame (bad magic)")
+    (header_len,) = struct.unpack_from('<I', buf, 4)
+    header = json.loads(bytes(buf[8:8 + header_len]).decode('utf-8'))
+    n_samples, n_columns = header["shape"]
+    arr = np.frombuffer(buf, dtype=header.get("dtype", DTYPE), count=n_samples * n_columns, offset=8 + header_len)
+    return arr.reshape(n_samples, n_columns), header
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("bluetooth") # core.device needs pybluez
+from core.device import BITalino, decode_frames
+from core.emulator import BITalinoEmulator, encode_frames
+
+
+@pytest.mark.parametrize("nAnalog", [1, 4, 5, 6])
+def test_encode_decode_round_trip(nAnalog):
+    rng = np.random.default_rng(0)
+    n = 1000
+    data = np.zeros((5 + nAnalog, n), dtype=np.uint16)
+    data[0] = np.arange(n) % 16
+    data[1:5] = rng.integers(0, 2, (4, n))
+    data[5:] = rng.integers(0, 1024, (nAnalog, n))
+    decoded, valid = decode_frames(encode_frames(data).tobytes(), nAnalog)
+    assert valid.all()
+    expected = data.copy()
+    expected[9:] >>= 4 # 5th and 6th channel keep their upper 6 bits
+    np.testing.assert_array_equal(decoded, expected)
+
+
+def test_emulator_streams_six_channels():
+    with BITalinoEmulator(seed=1) as emulator:
+        device = BITalino(macAddress=emulator.path, timeout=5)
+        device.open(macAddress=emulator.path, SamplingRate=1000)
+        device.start([0, 1, 2, 3, 4, 5])
+        try:
+            data = device.read(nSamples=2000, timeout=5)
+        finally:
+            device.stop()
+            device.close()
+    assert data.shape == (11, 2000)
+    assert device.counters['crc_failures'] == 0 and device.counters['seq_gaps'] == 0
+    assert data[9:].max() < 64
+    # scaled, not wrapped: a masked 10 bit waveform jumps across the whole 6 bit range
+    assert np.abs(np.diff(data[9:].astype(int), axis=1)).max() < 32
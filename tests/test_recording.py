@@ -0,0 +1,124 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+import numpy as np
+import pytest
+from core.compressed_recording import recover_compressed_recording, CompressedRecordingReader
+from core.file_io import open_recording_writer, open_recording, load_recording, recover_recording, RecordingReader
+from core.pyramid import MinMaxPyramid, pyramid_path, spool_path
+from core.signal_type import SENSOR_TRANSFER, ecg_transfer
+
+# writes 20000 samples in blocks of 100, the last one after fsync_seconds, then dies without closing the file
+CRASH_WRITER = """
+import os, signal, sys, time
+import numpy as np
+from core.file_io import open_recording_writer
+writer = open_recording_writer(sys.argv[1], 'mac', 1000, ['A1', 'A2'], fmt='binz', fsync_seconds=0.5)
+for i in range(0, 20000, 100):
+    if i == 19900:
+        time.sleep(0.6)
+    writer.write(np.arange(i, i + 100) / 1000, [np.arange(i, i + 100) % 1024, np.full(100, 7)])
+os.kill(os.getpid(), signal.SIGKILL)
+"""
+
+
+def test_binz_crash_keeps_synced_samples(tmp_path):
+    # 20000 samples are less than 5 blocks of 4096: without short blocks on fsync only 16384 would survive
+    path = str(tmp_path / 'crash')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root] + sys.path))
+    result = subprocess.run([sys.executable, '-c', CRASH_WRITER, path], env=env, cwd=root, timeout=60)
+    assert result.returncode == -signal.SIGKILL
+    assert recover_compressed_recording(path + '.binz') == 20000
+    with CompressedRecordingReader(path + '.binz') as reader:
+        assert reader.complete
+        _, data = reader.read(0, 20000)
+    assert np.array_equal(data[0], np.arange(20000) % 1024)
+    assert (data[1] == 7).all()
+
+
+def test_csv_round_trip_keeps_sampling_rate(tmp_path):
+    # .csv files have no header, the rate comes from the time column
+    times = np.arange(500) / 100
+    with open_recording_writer(str(tmp_path / 'rec'), 'mac', 100, ['A1', 'A2'], fmt='csv', pyramid=False) as writer:
+        writer.write(times, [np.sin(times), np.arange(500)])
+    path = writer.path
+    assert load_recording(path)[2]['sampling rate'] == 100
+    with RecordingReader(path) as reader:
+        assert reader.sampling_rate == 100
+        assert reader.sample_at(2.0) == 200
+        read_times, data = reader.window(1.0, 2.0)
+    assert np.allclose(read_times, times[100:200])
+    assert np.array_equal(data[1], np.arange(100, 200))
+
+
+@pytest.mark.parametrize("fmt, converted", [('tsv', True), ('bin', True), ('bin-raw', False), ('binz', False)])
+def test_reader_tells_raw_codes_from_converted_values(tmp_path, fmt, converted):
+    codes = np.arange(100) % 1024
+    with open_recording_writer(str(tmp_path / 'rec'), 'mac', 100, ['A1'], fmt=fmt, pyramid=False,
+                               sensor_types={'A1': 'ECGBIT'}) as writer:
+        writer.write(np.arange(100) / 100, [codes if not writer.converted else ecg_transfer(codes)])
+    with open_recording(writer.path) as reader:
+        assert reader.converted == converted
+        _, data = reader.read(0, 100)
+        sensor = reader.meta['sensor'][0]
+    values = data[0] if reader.converted else SENSOR_TRANSFER[sensor](data[0])
+    assert np.allclose(values, ecg_transfer(codes)) # playback shows the same unit for every format
+
+
+@pytest.mark.parametrize("fmt", ['tsv', 'bin', 'binz'])
+def test_writer_spools_pyramid(tmp_path, fmt):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1024, (2, 50000))
+    with open_recording_writer(str(tmp_path / 'rec'), 'mac', 1000, ['A1', 'A2'], fmt=fmt) as writer:
+        for start in range(0, 50000, 1000):
+            writer.write(np.arange(start, start + 1000) / 1000, data[:, start:start + 1000])
+            assert not any(writer.pyramid._chunks) # finished bins are on disk, not in memory
+        assert os.path.exists(spool_path(writer.path, 0))
+    assert not os.path.exists(spool_path(writer.path, 0))
+    saved = MinMaxPyramid.load(pyramid_path(writer.path), writer.path)
+    expected = MinMaxPyramid(2)
+    expected.add(data)
+    expected.finish()
+    assert len(saved.levels) == len(expected.levels)
+    for (mins, maxs), (expected_mins, expected_maxs) in zip(saved.levels, expected.levels):
+        assert np.array_equal(mins, expected_mins) and np.array_equal(maxs, expected_maxs)
+
+
+# writes samples until killed, syncing data and spooled pyramid bins every 0.2 s
+SPOOL_WRITER = """
+import sys, time
+import numpy as np
+from core.file_io import open_recording_writer
+writer = open_recording_writer(sys.argv[1], 'mac', 1000, ['A1', 'A2'], fmt='tsv', fsync_seconds=0.2)
+i = 0
+while True:
+    writer.write(np.arange(i, i + 100) / 1000, [np.arange(i, i + 100) % 1024, np.full(100, 7)])
+    i += 100
+    time.sleep(0.002)
+"""
+
+
+def test_recovery_resumes_spooled_pyramid(tmp_path):
+    path = str(tmp_path / 'crash')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root] + sys.path))
+    writer = subprocess.Popen([sys.executable, '-c', SPOOL_WRITER, path], env=env, cwd=root)
+    try:
+        time.sleep(2)
+    finally:
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+    assert os.path.getsize(spool_path(path + '.txt', 0)) > 0 # recovery starts from these bins
+    recover_recording(path + '.txt')
+    assert not os.path.exists(spool_path(path + '.txt', 0))
+    with open_recording(path + '.txt') as reader:
+        recovered = MinMaxPyramid.load(pyramid_path(path + '.txt'), path + '.txt')
+        expected = MinMaxPyramid(2)
+        expected.add(reader.read(0, len(reader))[1])
+        expected.finish()
+    assert recovered.n_samples == expected.n_samples and len(recovered.levels) == len(expected.levels)
+    for (mins, maxs), (expected_mins, expected_maxs) in zip(recovered.levels, expected.levels):
+        assert np.array_equal(mins, expected_mins) and np.array_equal(maxs, expected_maxs)
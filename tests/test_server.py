@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+import pytest
+
+pytest.importorskip("bluetooth") # core.device needs pybluez
+from api import server
+from tests.test_session import mock_session
+
+
+def test_read_subscriber_longer_than_timeout():
+    session = mock_session()
+    session.open()
+    try:
+        start = time.monotonic()
+        data, _ = asyncio.run(server.read_subscriber("mock", session, session.default, 150, timeout=0.5))
+        assert data.shape[1] == 150
+        assert time.monotonic() - start > 1.0
+    finally:
+        session.close()
+
+
+def test_waiting_subscriber_is_not_reaped():
+    manager = server.SessionManager(idle_timeout=0.3, io_mode='thread')
+    session = manager.get(server.MockBITalino, "mock-reap", 100)
+    session.open()
+    subscriber = session.subscribe("cli")
+
+    async def read_while_reaping():
+        read = asyncio.create_task(server.read_subscriber("mock-reap", session, subscriber, 150))
+        while not read.done():
+            manager.reap_idle()
+            await asyncio.sleep(0.1)
+        return await read
+
+    try:
+        data, _ = asyncio.run(read_while_reaping()) # 1.5 s of samples, longer than the idle timeout
+        assert data.shape[1] == 150
+        assert session.subscribers.get("cli") is subscriber
+    finally:
+        manager.close_all()
+
+
+def test_failed_open_leaves_no_device_thread():
+    for i in range(3):
+        with pytest.raises(Exception):
+            asyncio.run(server.open_session(f"/dev/nonexistent{i}", server.BITalino, 1000))
+        assert server.sessions.sessions[f"/dev/nonexistent{i}"].executor is None
+    time.sleep(0.1)
+    assert not [t for t in threading.enumerate() if t.name.startswith("device-/dev/nonexistent")]
+
+
+def test_open_runs_on_device_thread():
+    session = server.sessions.get(server.MockBITalino, "mock-open", 100)
+    open_device = session._open_device
+    threads = []
+    def recording_open_device():
+        threads.append(threading.current_thread().name)
+        return open_device()
+    session._open_device = recording_open_device
+    try:
+        asyncio.run(server.open_session("mock-open", server.MockBITalino, 100))
+        assert threads and threads[0].startswith("device-mock-open")
+    finally:
+        session.close()
+
+
+def test_device_thread_stops_with_session():
+    session = asyncio.run(server.open_session("mock-executor", server.MockBITalino, 100))
+    try:
+        assert asyncio.run(server.run_device_io(session, threading.current_thread)).name.startswith("device-mock-executor")
+    finally:
+        session.close()
+    assert session.executor is None
+    time.sleep(0.1)
+    assert not [t for t in threading.enumerate() if t.name.startswith("device-mock-executor")]
+
+
+def test_reads_count_towards_queue_depth(monkeypatch):
+    monkeypatch.setenv('USE_MOCK_DEVICE', 'true')
+    monkeypatch.setattr(server, 'DEVICE_QUEUE_DEPTH', 2)
+
+    async def reads():
+        await server.open_session("mock-queue", server.MockBITalino, 100)
+        return await asyncio.gather(*(server.bitalino_data("mock-queue", 100, 1, clientId=f"c{i}", accept=None) for i in range(3)),
+                                    return_exceptions=True)
+    try:
+        results = asyncio.run(reads())
+    finally:
+        server.sessions.sessions.pop("mock-queue").close()
+    assert [getattr(r, 'status_code', None) for r in results].count(429) == 1
+    assert sum(isinstance(r, dict) for r in results) == 2
@@ -0,0 +1,68 @@
+import time
+import pytest
+import numpy as np
+from core.mock_device import MockBITalino
+from core.session import DeviceSession
+from core.multiplexer import DeviceMultiplexer
+from core.sync import fit_clock
+
+
+def mock_session(samplingRate=100):
+    device_class = lambda macAddress, timeout: MockBITalino(macAddress=macAddress, timeout=timeout, seed=1, paced=True)
+    return DeviceSession(device_class, "mock", samplingRate)
+
+
+def test_read_longer_than_timeout():
+    # 1.5 s of samples with a 0.5 s timeout: the timeout only covers a stalled stream
+    session = mock_session()
+    try:
+        start = time.monotonic()
+        data, _ = session.read_block(150, timeout=0.5)
+        assert data.shape[1] == 150
+        assert time.monotonic() - start > 1.0
+    finally:
+        session.close()
+
+
+def test_block_policy_in_select_mode():
+    pytest.importorskip("bluetooth") # core.device needs pybluez
+    from core.device import BITalino
+    from core.emulator import BITalinoEmulator
+    multiplexer = DeviceMultiplexer()
+    with BITalinoEmulator(seed=1) as slow_device, BITalinoEmulator(seed=2) as other_device:
+        slow = DeviceSession(BITalino, slow_device.path, 1000, buffer_seconds=1, block_timeout=5, multiplexer=multiplexer)
+        other = DeviceSession(BITalino, other_device.path, 1000, buffer_seconds=1, multiplexer=multiplexer)
+        try:
+            slow.open()
+            other.open()
+            blocking = slow.subscribe('blocking', policy='block')
+            time.sleep(0.5)
+            other_head = other.buffer.head
+            time.sleep(1.5) # 2 s without reading a 1 s buffer
+            assert blocking.available <= slow.buffer.capacity # slow device paused at a full buffer
+            assert other.buffer.head - other_head > 1000 # the multiplexer kept reading the other device
+            blocking.take(slow.samplingRate * 2)
+            assert blocking.dropped == 0
+            time.sleep(0.5) # resumed after the blocking subscriber read
+            assert blocking.read(200, timeout=1)[0].shape[1] == 200
+        finally:
+            slow.close()
+            other.close()
+            multiplexer.close()
+
+
+def test_arrivals_span_drift_fit_window():
+    # 1-sample reads at 1000 Hz for 40 s: the arrivals must still cover the 30 s fit window of core.sync
+    session = mock_session(1000)
+    session.open()
+    session.close()
+    rng = np.random.default_rng(0)
+    t0 = time.monotonic() + 1
+    for k in range(1, 40001):
+        session._note_arrival(k, t0 + k / 1000 + (0 if k % 50 == 0 else rng.uniform(0, 0.02)), 0)
+    head, received, _ = session.arrivals.latest(session.arrivals.capacity)
+    head, received = head[received >= t0], received[received >= t0] # without the records of the mock run
+    assert received[-1] - received[0] > 35
+    offset, period = fit_clock(head, received, 1000)
+    assert abs(offset - t0) < 1e-3 # least delayed blocks kept
+    assert abs(period * 1000 - 1) < 1e-4
@@ -0,0 +1,25 @@
+import time
+import numpy as np
+from core.file_io import RecordingReader
+from core.mock_device import MockBITalino
+from core.session import DeviceSession
+from core.sync import SyncSession
+
+
+def test_record_writes_merged_stream(tmp_path):
+    sync = SyncSession([DeviceSession(MockBITalino, f"mock-{i}", 100) for i in range(2)], 100)
+    sync.start()
+    try:
+        path = sync.record(str(tmp_path / 'sync.txt'))
+        time.sleep(1.5)
+        sync.stop()
+    finally:
+        for session in sync.sessions:
+            session.close()
+    with RecordingReader(path) as reader:
+        assert reader.labels == sync.columns
+        assert reader.meta['devices'] == sync.labels
+        times, data = reader.read(0, len(reader))
+    assert len(reader) >= 50
+    assert np.allclose(np.diff(times), 1 / 100)
+    assert np.array_equal(data[0], data[0].astype(int)) # values stored as given, no conversion
@@ -2,7 +2,7 @@ import os
 # Force pyqtgraph and matplotlib to use PyQt5 (avoid mixing PyQt6/PyQt5)
 os.environ.setdefault('PYQTGRAPH_QT_LIB', 'PyQt5')
 os.environ.setdefault('MPLBACKEND', 'Qt5Agg')
-from core.signal_type import signal_types, eeg_transfer, ecg_transfer, emg_transfer, acc_transfer
+from core.signal_type import signal_types, SENSOR_TRANSFER
 
 from dotenv import load_dotenv
 import sys
@@ -10,11 +10,10 @@ import os
 import json
 import requests
 import numpy as np
-import pandas as pd
 import pyqtgraph as pg
 from datetime import datetime
 from PyQt5 import QtWidgets, QtCore, QtGui
-from datetime import time
+import time
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
@@ -34,8 +33,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.playback_mode = False
         self.playback_timer = QtCore.QTimer()
         self.playback_timer.timeout.connect(self.update_playback)
-        self.playback_times = []
-        self.playback_data = {}
+        self.playback_reader = None # core.file_io.RecordingReader of the loaded file
+        self.playback_pyramid = None # core.pyramid.MinMaxPyramid of the loaded file, for long windows
+        self.playback_transfers = {} # channel -> transfer function for files of raw ADC codes (bin-raw, binz)
         self.playback_index = 0
 
         self.timer = QtCore.QTimer()
@@ -145,6 +145,11 @@ class MainWindow(QtWidgets.QMainWindow):
         self.plot_mode_combo.setCurrentIndex(0)
         self.plot_mode_combo.currentIndexChanged.connect(lambda _: self.selection_changed())
         layout_plot_style_controls.addWidget(self.plot_mode_combo)
+        # playback window length, long windows are drawn as min/max envelope
+        layout_plot_style_controls.addWidget(QtWidgets.QLabel("Window:"))
+        self.playback_window_combo = QtWidgets.QComboBox()
+        self.playback_window_combo.addItems(["2 s", "10 s", "1 min", "10 min", "All"])
+        layout_plot_style_controls.addWidget(self.playback_window_combo)
         layout_plot_style_controls.addStretch()
         #layout_plot_style_controls.addWidget(self.hide_all_plots_button)
 
@@ -172,6 +177,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.mode_combo.addItems(["Acquire data", "Load from file"])
         self.mode_combo.currentTextChanged.connect(self.mode_changed)
         layout_operation_mode_selector.addWidget(self.mode_combo)
+        # recording file format: text (+ CSV copy), CSV, binary float32, binary uint16 codes or compressed codes
+        layout_operation_mode_selector.addWidget(QtWidgets.QLabel("Save as:"))
+        self.save_format_combo = QtWidgets.QComboBox()
+        self.save_format_combo.addItems(["tsv", "csv", "bin", "bin-raw", "binz"])
+        self.save_format_combo.setCurrentText(os.getenv('SAVE_FORMAT', 'tsv'))
+        layout_operation_mode_selector.addWidget(self.save_format_combo)
         layout_operation_mode_selector.addStretch()
 
         # Control buttons
@@ -242,7 +253,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(central_widget)
 
     def load_file(self):
-        filename, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Load BITalino file", "data/recordings/", "Text files (*.txt)")
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Load BITalino file", "data/recordings/", "Recordings (*.txt *.csv *.bin *.binz)")
         if not filename: 
             return
 
@@ -260,81 +271,37 @@ class MainWindow(QtWidgets.QMainWindow):
         
         self.current_filename = filename
         
-        # Read entire file
-        with open(filename, 'r') as f:
-            content = f.read()
-        
-        lines = content.splitlines()
-        
-        # Skip OpenSignals version header if present
-        if lines and "# OpenSignals Text File Format. Version 1" in lines[0]:
-            print("Skipping OpenSignals version header")
-            lines = lines[1:]
-        
-        # Initialize defaults
-        header_end_idx = 0
-        channels, sensors = ['A1', 'A2'], ['raw', 'raw']
-        sampling_rate = 100
-        device_info = {}
-        column_order = []
-        
-        # Parse header
-        for i, line in enumerate(lines):
-            if line.strip() == '# EndOfHeader':
-                header_end_idx = i
-                break
-            if line.startswith('# {'):
-                try:
-                    import json
-                    full_header = json.loads(line[2:].strip())
-                    if isinstance(full_header, dict) and len(full_header) > 0:
-                        device_mac = list(full_header.keys())[0]
-                        device_info = full_header[device_mac]
-                        channels = device_info.get('label', ['A1'])
-                        sensors = device_info.get('sensor', ['raw'])
-                        sampling_rate = device_info.get('sampling_rate', 100)
-                        self.playback_sampling_rate = sampling_rate
-                        column_order = device_info.get('column', [])
-                        print(f"File sampling rate: {sampling_rate} Hz")
-                        print(f"Header: channels={channels}, sensors={sensors}")
-                        print(f"Columns: {column_order}")
-                        #break
-                except Exception as e:
-                    print(f"Header parse error: {e}")
-        
-        # Dynamic column mapping
-        label_to_col = {label: idx for idx, label in enumerate(column_order) if label in channels}
-        
-        #print(f"header_end_idx = {header_end_idx}")
-        #print(f"lines[header_end_idx] = '{lines[header_end_idx][:50]}...'")
-        #print(f"First 3 data lines:")
-        #for i in range(header_end_idx+1, min(header_end_idx+4, len(lines))):
-        #    print(f"  lines[{i}] = '{lines[i][:50]}'")
-
-        # Parse data lines
-        times, data = [], {}
-        for line in lines[header_end_idx+1:]:
-            if line.strip():
-                parts = line.strip().split()
-                if len(parts) >= len(column_order):
-                    times.append(float(parts[0]))  # Time col 0
-                    for ch in channels:
-                        col_idx = label_to_col.get(ch, 5)
-                        if col_idx < len(parts):
-                            data.setdefault(ch, []).append(float(parts[col_idx]))
-        
-        print(f"Parsed {len(times)} samples from {len(lines[header_end_idx+1:])} data lines")
-        
+        # header and sparse index only, playback parses the visible window from a memory map
+        from core.file_io import open_recording, load_pyramid
+        if self.playback_reader is not None:
+            self.playback_reader.close()
+            self.playback_reader = None
+        self.playback_pyramid = None
+        try:
+            self.playback_reader = open_recording(filename)
+        except Exception as e:
+            self.info_text_box.append(f"Error loading file: {e}")
+            return
+        try: # saved with the recording, built once on first open of older files
+            self.playback_pyramid = load_pyramid(filename, self.playback_reader)
+        except Exception as e:
+            self.info_text_box.append(f"No overview for long windows: {e}")
+        device_info = self.playback_reader.meta
+        channels = self.playback_reader.labels
+        sensors = device_info.get('sensor', ['raw'] * len(channels))
+        self.playback_sampling_rate = self.playback_reader.sampling_rate
+        print(f"File sampling rate: {self.playback_sampling_rate} Hz")
+        print(f"Header: channels={channels}, sensors={sensors}")
+
         # Store playback data
-        self.playback_times = times
-        self.playback_data = data
         self.playback_channel_types = dict(zip(channels, sensors))
+        # raw ADC codes get the transfer functions of live plotting, so all formats look the same
+        self.playback_transfers = {} if self.playback_reader.converted else {
+            ch: SENSOR_TRANSFER.get(str(sensor).upper(), self.signal.transfer_function) for ch, sensor in zip(channels, sensors)}
         
         # Setup buffers
         self.selected_channels = channels
         self.data_buffers = {ch: [] for ch in channels}
-        self.all_data = {ch: [] for ch in channels}
-        self.all_time = []
 
               
         # Auto-select checkboxes
@@ -346,7 +313,7 @@ class MainWindow(QtWidgets.QMainWindow):
         
         # Single call after all setup
         self.selection_changed()
-        self.info_text_box.append(f"Loaded {filename} ({len(times)} samples, {len(channels)} channels: {channels})")
+        self.info_text_box.append(f"Loaded {filename} ({len(self.playback_reader)} samples, {len(channels)} channels: {channels})")
 
 
 
@@ -354,7 +321,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """Single button: Start/Play Pause/Resume for both modes"""
         
         if self.playback_mode:
-            if not hasattr(self, 'playback_times') or not self.playback_times:
+            if self.playback_reader is None or len(self.playback_reader) == 0:
                 QtWidgets.QMessageBox.warning(self, "No file loaded", 
                     "Please load a file first before playing.")
                 return
@@ -402,27 +369,36 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def update_playback(self):
-        if self.playback_index >= len(self.playback_times):
+        if self.playback_index >= len(self.playback_reader):
             self.playback_timer.stop()
             self.start_pause_button.setText("▶ Play")
             self.playback_index = 0
             self.info_text_box.append("Playback finished - end of file reached.")
             return
         
-        window = int(self.playback_sampling_rate * 2)  # show 2s window
-        end_idx = min(self.playback_index + window, len(self.playback_times))
+        window = self.playback_window_samples()
+        envelope = None
+        if self.playback_pyramid is not None:
+            envelope = self.playback_pyramid.envelope(self.playback_index, self.playback_index + window,
+                                                      max(1, self.plot_widget.width()))
         
         # fill buffers with current window
-        self.time_buffer = self.playback_times[self.playback_index:end_idx]
-        for ch in self.selected_channels:
-            if ch in self.playback_data:
-                self.data_buffers[ch] = self.playback_data[ch][self.playback_index:end_idx]
+        if envelope is None:
+            self.time_buffer, values = self.playback_reader.read(self.playback_index, window)
+        else: # one vertical min-max stroke per bin, about one per pixel
+            positions, mins, maxs = envelope
+            t0 = self.playback_reader.read(int(positions[0]), 1)[0][0]
+            self.time_buffer = np.repeat(t0 + (positions - positions[0]) / self.playback_sampling_rate, 2)
+            values = np.stack([mins, maxs], axis=2).reshape(len(mins), -1)
+        for ch, row in zip(self.playback_reader.labels, values):
+            if ch in self.selected_channels: # transfer functions are increasing, envelope min/max stay min/max
+                self.data_buffers[ch] = self.playback_transfers[ch](row) if ch in self.playback_transfers else row
         
         # update plot
         for idx, ch in enumerate(self.selected_channels):
             if idx < len(self.lines):
                 y = self.data_buffers.get(ch, [])
-                x = self.time_buffer[:len(y)] if y else []
+                x = self.time_buffer[:len(y)] if len(y) else []
                 self.lines[idx].set_data(x, y)
         
         # auto-scale
@@ -435,6 +411,11 @@ class MainWindow(QtWidgets.QMainWindow):
         # advance by 1 sample only
         self.playback_index += 1
 
+    def playback_window_samples(self):
+        """Samples in the playback window chosen in the window combo box."""
+        seconds = {"2 s": 2, "10 s": 10, "1 min": 60, "10 min": 600}.get(self.playback_window_combo.currentText())
+        return len(self.playback_reader) if seconds is None else int(self.playback_sampling_rate * seconds)
+
 
     # acquire or playback mode 
     def mode_changed(self): 
@@ -469,13 +450,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.signal = signal_types.get(signal_type_key, signal_types['None'])
         self.transfer_func = self.signal.transfer_function
         self.sampling_rate = self.signal.sampling_rate
+        self.transport = os.getenv('ACQUISITION_TRANSPORT', 'poll').lower() # poll /bitalino-since/ or stream /bitalino-stream
+        self.stream_client = None
+        self.cursor = None # next_cursor of the last /bitalino-since/ poll
 
         self.dt = 1.0 / self.sampling_rate
         self.t = 0
         self.time_buffer = []
         self.data_buffer = []
-        self.all_time = []
-        self.all_data = []
         self.ax.set_ylim(self.signal.ylim)
         self.ax.set_xlabel("Time (s)")
         self.ax.set_ylabel(self.signal.unit)
@@ -707,8 +689,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.selected_channel_types = channel_types
         # initialize buffers for each selected channel
         self.data_buffers = {ch: [] for ch in channels}
-        self.all_data = {ch: [] for ch in channels}
-        self.all_time = []
+        self.open_recording(channels, channel_types)
         # initialize error tracking for API failures
         self.consecutive_api_failures = 0
         self.max_api_failures = 10
@@ -716,19 +697,26 @@ class MainWindow(QtWidgets.QMainWindow):
         self.selection_changed()
 
         self.info_text_box.append(f"Starting acquisition with channels {channels} and types {channel_types}")
-        self.timer.start(300)    
-
-    def stop_plotting_and_save(self):
-        self.timer.stop()
-        self.playback_timer.stop()
-
-        if self.playback_mode:
-            self.info_text_box.append("Playback stopped.")
-            return
-
-        channels = getattr(self, 'selected_channels', [])
-        channel_types = getattr(self, 'selected_channel_types', {})
-        
+        self.cursor = None
+        self.link_stats = None # last counters from /bitalino-stats/
+        self.link_stats_time = time.monotonic()
+        if getattr(self, 'stream_client', None) is not None:
+            self.stream_client.stop()
+            self.stream_client = None
+        if self.transport == 'stream': # server pushes blocks over WebSocket, timer only drains them
+            from core.file_io import StreamClient
+            try:
+                self.stream_client = StreamClient(self.mac_address, self.sampling_rate, channels=channels)
+                self.stream_client.start()
+            except Exception as e:
+                self.stream_client = None
+                self.info_text_box.append(f"Stream unavailable ({e}), polling instead")
+        # cursor polls return right away with whatever is buffered, so poll often for low display latency
+        self.timer.start(300 if self.stream_client is not None else 50)
+
+    def open_recording(self, channels, channel_types):
+        """Open the text and CSV recording files, samples are appended to them as they arrive."""
+        self.close_recording()
         # determine filename suffix from channel types
         if channel_types:
             # Use the first channel's type for filename
@@ -737,95 +725,179 @@ class MainWindow(QtWidgets.QMainWindow):
             signal_suffix = first_type.replace('BIT', '').lower() if 'BIT' in first_type else first_type.lower()
         else:
             signal_suffix = self.signal.name
-        
-        filename = f'data/recordings/data_recording_{self.date_and_time}_{signal_suffix}'
-        channel_types = getattr(self, 'selected_channel_types', {})
-
-        # prepare data and times for write_to_file
-        times = self.all_time
-        # ensure all channel buffers have same length as times
-        data = {ch: getattr(self, 'all_data', {}).get(ch, []) if isinstance(getattr(self, 'all_data', {}), dict) else [] for ch in channels}
 
-        # If internal per-frame append used non-equal lengths, pad shorter lists with empty strings in write_to_file
-        # write text file in the same format as core.file_io
-        from core.file_io import write_to_file
-        out_path = f"{filename}.txt"
+        filename = f'data/recordings/data_recording_{self.date_and_time}_{signal_suffix}'
+        # file in the same format as core.file_io, text recordings also get a CSV for quick inspection
+        from core.file_io import open_recording_writer
+        save_format = self.save_format_combo.currentText()
         try:
-            write_to_file(out_path, self.mac_address or '', self.sampling_rate, times, data, channels, device_name=self.mac_address, sensor_types=channel_types)
-            self.info_text_box.append(f"Data saved to file {out_path} (channels: {channels}, types: {channel_types})")
+            self.writers = [open_recording_writer(filename, self.mac_address or '', self.sampling_rate, channels, fmt=save_format,
+                                                  device_name=self.mac_address, sensor_types=channel_types)]
+            if save_format == 'tsv':
+                self.writers.append(open_recording_writer(filename, self.mac_address or '', self.sampling_rate, channels, fmt='csv',
+                                                         pyramid=False))
         except Exception as e:
-            self.info_text_box.append(f"Error saving file: {e}")
+            self.writers = []
+            self.info_text_box.append(f"Error opening recording file: {e}")
 
-        # also save a CSV for quick inspection
-        try:
-            df = pd.DataFrame({"Time (s)": times})
-            for ch in channels:
-                df[ch] = data.get(ch, [])
-            df.to_csv(f"{filename}.csv", index=False)
-        except Exception:
-            pass
+    def close_recording(self):
+        """Close the recording files. Returns the text file path, or None if nothing was recorded."""
+        writers, self.writers = getattr(self, 'writers', []), []
+        for writer in writers:
+            try:
+                writer.close()
+            except Exception as e:
+                self.info_text_box.append(f"Error saving file: {e}")
+        return writers[0].path if writers else None
 
+    def closeEvent(self, event):
+        """Closing the window during acquisition still finishes the recording files."""
+        self.timer.stop()
+        self.playback_timer.stop()
+        self.close_recording()
+        super().closeEvent(event)
 
-    def update_plot(self):
-        try:
-            params = {'macAdd': self.mac_address, 'samplingRate': self.sampling_rate, 'recordingTime': 1}
-            response = requests.get("http://localhost:8000/bitalino-get/", params=params, timeout=30)
-            if not response.ok:
-                error_detail = response.text[:500]
-                status = response.status_code
+    def stop_plotting_and_save(self):
+        self.timer.stop()
+        self.playback_timer.stop()
+        if getattr(self, 'stream_client', None) is not None:
+            self.stream_client.stop()
+            if self.stream_client.gaps:
+                self.info_text_box.append(f"Stream had {self.stream_client.gaps} missing samples")
+            self.stream_client = None
+
+        if self.playback_mode:
+            self.info_text_box.append("Playback stopped.")
+            return
+        self.report_link_stats(final=True)
+
+        channels = getattr(self, 'selected_channels', [])
+        channel_types = getattr(self, 'selected_channel_types', {})
+        out_path = self.close_recording()
+        if out_path:
+            self.info_text_box.append(f"Data saved to file {out_path} (channels: {channels}, types: {channel_types})")
+
+
+    def fetch_frame(self):
+        """Poll /bitalino-since/ once for samples after self.cursor. Returns parsed dataframe, or None if nothing new
+        or on error (reported in info box)."""
+        params = {'macAdd': self.mac_address, 'samplingRate': self.sampling_rate}
+        if self.cursor is not None:
+            params['cursor'] = self.cursor
+        from core.file_io import FRAME_ACCEPT, parse_cursor_response
+        response = requests.get("http://localhost:8000/bitalino-since/", params=params, headers={"Accept": FRAME_ACCEPT}, timeout=30)
+        if not response.ok:
+            error_detail = response.text[:500]
+            status = response.status_code
+            
+            if not hasattr(self, 'consecutive_api_failures'):  # track consecutive failures
+                self.consecutive_api_failures = 0
+                self.max_api_failures = 10
+            
+            self.consecutive_api_failures += 1
+            
+            if status == 503: # Service unavailable - device I/O error or other transient failure, give moment and retry
+                if self.consecutive_api_failures > 3:
+                    msg = f"Device error (attempt {self.consecutive_api_failures}/{self.max_api_failures}): {error_detail[:100]}"
+                else:
+                    msg = f"Device temporarily unavailable (retrying...)"
+                print(f"[{self.consecutive_api_failures}] API returned non-OK status {status}: {error_detail}")
+                self.info_text_box.append(msg)
+                
+                if self.consecutive_api_failures >= self.max_api_failures:
+                    self.timer.stop()
+                    self.info_text_box.append(f"Stopped: Device unresponsive after {self.max_api_failures} attempts. Check device connection.")
+                    self.start_pause_button.setText("▶ Start")
+                return None
+                
+            elif status == 504: # Gateway timeout - Bluetooth/device timeout
+                self.consecutive_api_failures += 1
+                msg = f"Device timeout (attempt {self.consecutive_api_failures}/{self.max_api_failures})"
+                print(f"API returned timeout 504: {error_detail}")
+                self.info_text_box.append(msg)
                 
-                if not hasattr(self, 'consecutive_api_failures'):  # track consecutive failures
-                    self.consecutive_api_failures = 0
-                    self.max_api_failures = 10
+                if self.consecutive_api_failures >= self.max_api_failures:
+                    self.timer.stop()
+                    self.info_text_box.append(f"Stopped: Device timeouts after {self.max_api_failures} attempts. Device may be out of range.")
+                    self.start_pause_button.setText("▶ Start")
+                return None
                 
+            else:  # other errors
                 self.consecutive_api_failures += 1
+                print(f"API returned non-OK status {status}: {error_detail}")
+                self.info_text_box.append(f"API error {status}: {error_detail[:80]}")
                 
-                if status == 503: # Service unavailable - device I/O error or other transient failure, give moment and retry
-                    if self.consecutive_api_failures > 3:
-                        msg = f"Device error (attempt {self.consecutive_api_failures}/{self.max_api_failures}): {error_detail[:100]}"
-                    else:
-                        msg = f"Device temporarily unavailable (retrying...)"
-                    print(f"[{self.consecutive_api_failures}] API returned non-OK status {status}: {error_detail}")
-                    self.info_text_box.append(msg)
-                    
-                    if self.consecutive_api_failures >= self.max_api_failures:
-                        self.timer.stop()
-                        self.info_text_box.append(f"Stopped: Device unresponsive after {self.max_api_failures} attempts. Check device connection.")
-                        self.start_pause_button.setText("▶ Start")
-                    return
-                    
-                elif status == 504: # Gateway timeout - Bluetooth/device timeout
-                    self.consecutive_api_failures += 1
-                    msg = f"Device timeout (attempt {self.consecutive_api_failures}/{self.max_api_failures})"
-                    print(f"API returned timeout 504: {error_detail}")
-                    self.info_text_box.append(msg)
-                    
-                    if self.consecutive_api_failures >= self.max_api_failures:
-                        self.timer.stop()
-                        self.info_text_box.append(f"Stopped: Device timeouts after {self.max_api_failures} attempts. Device may be out of range.")
-                        self.start_pause_button.setText("▶ Start")
-                    return
-                    
-                else:  # other errors
-                    self.consecutive_api_failures += 1
-                    print(f"API returned non-OK status {status}: {error_detail}")
-                    self.info_text_box.append(f"API error {status}: {error_detail[:80]}")
-                    
-                    if self.consecutive_api_failures >= self.max_api_failures:
-                        self.timer.stop()
-                        self.info_text_box.append(f"Stopped after {self.max_api_failures} consecutive API errors")
-                        self.start_pause_button.setText("▶ Start")
-                    return
-
-            self.consecutive_api_failures = 0  # reset failure counter after success
-
-            from core.file_io import parse_acquisition_response
+                if self.consecutive_api_failures >= self.max_api_failures:
+                    self.timer.stop()
+                    self.info_text_box.append(f"Stopped after {self.max_api_failures} consecutive API errors")
+                    self.start_pause_button.setText("▶ Start")
+                return None
+
+        self.consecutive_api_failures = 0  # reset failure counter after success
+
+        try:
+            all_df, self.cursor, dropped = parse_cursor_response(response)
+            if dropped:
+                self.info_text_box.append(f"{dropped} samples lost between polls")
+            return all_df
+        except Exception as e:
+            print("Error parsing device response:", e)
+            print("Response body:", response.text[:1000])
+            return None
+
+    def report_link_stats(self, final=False):
+        """Show device link counters from /bitalino-stats/ in the info box when CRC failures or
+        sequence gaps increased (always when final). Losses on the radio link show up here,
+        ring buffer overruns point at our own pipeline."""
+        try:
+            response = requests.get("http://localhost:8000/bitalino-stats/", params={'macAdd': self.mac_address}, timeout=2)
+            if not response.ok:
+                return
+            stats = response.json()
+        except Exception as e:
+            print("Error fetching link stats:", e)
+            return
+        last = self.link_stats or {}
+        changed = any(stats.get(k, 0) != last.get(k, 0) for k in ('crc_failures', 'seq_gaps', 'overruns'))
+        self.link_stats = stats
+        if final or changed:
+            self.info_text_box.append(
+                f"Link: {stats.get('frames_decoded', 0)} frames, {stats.get('crc_failures', 0)} CRC failures "
+                f"({stats.get('resync_bytes', 0)} bytes skipped), {stats.get('seq_gaps', 0)} sequence gaps "
+                f"(~{stats.get('samples_lost', 0)} samples lost), {stats.get('overruns', 0)} buffer overruns")
+
+    def drain_stream(self):
+        """Return blocks pushed over /bitalino-stream since last tick, or None. Reconnects after stream errors."""
+        client = self.stream_client
+        if client.error is not None:
+            self.consecutive_api_failures = getattr(self, 'consecutive_api_failures', 0) + 1
+            self.info_text_box.append(f"Stream error (attempt {self.consecutive_api_failures}/{self.max_api_failures}): {str(client.error)[:80]}")
+            if self.consecutive_api_failures >= self.max_api_failures:
+                self.timer.stop()
+                client.stop()
+                self.info_text_box.append(f"Stopped after {self.max_api_failures} consecutive stream errors")
+                self.start_pause_button.setText("▶ Start")
+                return None
             try:
-                all_df = parse_acquisition_response(response.text)
-                #print(f"DEBUG-1: all_df.shape={all_df.shape if hasattr(all_df, 'shape') else 'NO SHAPE'}, columns={list(all_df.columns) if hasattr(all_df, 'columns') else 'NO COLUMNS'}")
+                client.restart()
             except Exception as e:
-                print("Error parsing device response:", e)
-                print("Response body:", response.text[:1000])
+                print("Stream reconnect failed:", e)
+            return None
+        all_df = client.drain()
+        if all_df is not None:
+            self.consecutive_api_failures = 0
+        return all_df
+
+    def update_plot(self):
+        try:
+            if getattr(self, 'stream_client', None) is not None:
+                all_df = self.drain_stream()
+            else:
+                all_df = self.fetch_frame()
+            if time.monotonic() - getattr(self, 'link_stats_time', 0) > 5: # check link health every few seconds
+                self.link_stats_time = time.monotonic()
+                self.report_link_stats()
+            if all_df is None:
                 return
 
             channel_types = getattr(all_df, 'attrs', {}).get('channel_types', {})
@@ -836,19 +908,8 @@ class MainWindow(QtWidgets.QMainWindow):
             if not channels:
                 return
 
-            # mapping sensor string -> transfer function
-            SENSOR_TRANSFER = {
-                'RAW': lambda x: x,
-                'BTN': lambda x: x,
-                'EDABIT': lambda x: x,
-                'ECGBIT': ecg_transfer,
-                'EEGBIT': eeg_transfer,
-                'EMGBIT': emg_transfer,
-                'ACCBIT': acc_transfer,
-                'ACCBITREV': acc_transfer,
-            }
-
             n_samples = None
+            block, raw_block = {}, {} # transferred values and raw codes per channel for the recording files
             for ch in channels:
                 if ch not in all_df.columns:
                     continue
@@ -865,7 +926,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
                 # append to buffers
                 self.data_buffers.setdefault(ch, []).extend(vals)
-                self.all_data.setdefault(ch, []).extend(vals)
+                block[ch] = transferred
+                raw_block[ch] = series
                 if n_samples is None:
                     n_samples = len(vals)
                     times = np.arange(self.t, self.t + n_samples * self.dt, self.dt)
@@ -876,7 +938,8 @@ class MainWindow(QtWidgets.QMainWindow):
                 #print("DEBUG-4: n_samples is None - no data processed!")
                 return
 
-            self.all_time.extend(times)
+            for writer in getattr(self, 'writers', []):
+                writer.write(times[:n_samples], block if writer.converted else raw_block)
 
             # update rolling buffers for plotting window (2s)
             window = int(self.sampling_rate * 2)